@@ -0,0 +1,139 @@
+"""
+Generate a synthetic project to benchmark the plugin: a package of source modules calling each other and
+test modules calling the source modules.
+
+    python benchmarks/generate.py /tmp/project --modules 500 --tests 5000
+"""
+import random
+import shutil
+import pathlib
+import argparse
+
+PACKAGE_NAME = 'synthetic'
+
+
+def generate_project(directory, modules=50, tests=500, tests_per_file=50, fan_out=3, fan_in=3, functions=5,
+                     function_lines=5, seed=0, force=False):
+    """
+    Generate a synthetic project. The source modules only import modules with a higher index, so there are no
+    import cycles, and the last module is a dependency of most tests.
+
+    :param directory Directory of the project. It must not exist or be empty, unless force is set.
+    :param modules Number of source modules
+    :param tests Number of test functions
+    :param tests_per_file Number of test functions of each test module
+    :param fan_out Number of modules called by each source module
+    :param fan_in Number of source modules called by each test
+    :param functions Number of functions of each source module
+    :param function_lines Number of statements of each function, to control the file sizes
+    :param seed Seed of the random choices, so the same parameters generate the same project
+    :param force Replace the directory when it is not empty
+    """
+    directory = pathlib.Path(directory)
+    if directory.exists() and any(directory.iterdir()):
+        if not force:
+            raise FileExistsError('The directory "{}" is not empty'.format(directory))
+        shutil.rmtree(directory)
+    package_directory = directory / PACKAGE_NAME
+    tests_directory = directory / 'tests'
+    package_directory.mkdir(parents=True)
+    tests_directory.mkdir()
+    (package_directory / '__init__.py').write_text('')
+    (tests_directory / '__init__.py').write_text('')
+    (directory / 'pytest.ini').write_text('[pytest]\ntestpaths = tests\n')
+
+    generator = random.Random(seed)
+    for index in range(modules):
+        candidates = range(index + 1, modules)
+        called_modules = sorted(generator.sample(candidates, min(fan_out, len(candidates))))
+        module_path = package_directory / get_module_name(index)
+        module_path.with_suffix('.py').write_text(_get_module_source(called_modules, functions, function_lines))
+
+    for file_index in range(0, tests, tests_per_file):
+        test_count = min(tests_per_file, tests - file_index)
+        test_path = tests_directory / 'test_{}.py'.format(file_index // tests_per_file)
+        test_path.write_text(_get_test_module_source(generator, file_index, test_count, modules, fan_in))
+    return directory
+
+
+def get_module_name(index):
+    """
+    Get the name of a source module of a synthetic project
+
+    :param index Index of the module
+    """
+    return 'module_{}'.format(index)
+
+
+def get_module_path(directory, index):
+    """
+    Get the location of a source module of a synthetic project
+
+    :param directory Directory of the project
+    :param index Index of the module
+    """
+    return pathlib.Path(directory) / PACKAGE_NAME / '{}.py'.format(get_module_name(index))
+
+
+def _get_module_source(called_modules, functions, function_lines):
+    lines = ['from . import {}'.format(get_module_name(index)) for index in called_modules]
+    for function_index in range(functions):
+        lines += ['', '', 'def function_{}(value):'.format(function_index)]
+        lines += ['    value = value * {} + {}'.format(line % 7 + 1, line) for line in range(function_lines)]
+        if function_index == 0:
+            # the first function calls the first function of every called module
+            lines += ['    value += {}.function_0(value % 10)'.format(get_module_name(index)) for index in called_modules]
+        lines.append('    return value % 1000')
+    return '\n'.join(lines) + '\n'
+
+
+def _get_test_module_source(generator, first_test_index, test_count, modules, fan_in):
+    lines = ['from {} import {}'.format(PACKAGE_NAME, ', '.join(get_module_name(index) for index in range(modules)))]
+    for test_index in range(first_test_index, first_test_index + test_count):
+        called_modules = generator.sample(range(modules), min(fan_in, modules))
+        lines += ['', '', 'def test_{}():'.format(test_index)]
+        lines += ['    assert {}.function_0({}) >= 0'.format(get_module_name(index), test_index) for index in called_modules]
+    return '\n'.join(lines) + '\n'
+
+
+def add_arguments(parser):
+    """
+    Add the parameters of the synthetic project to an argument parser
+
+    :param parser argparse.ArgumentParser object
+    """
+    parser.add_argument('--modules', type=int, default=50, help='Number of source modules')
+    parser.add_argument('--tests', type=int, default=500, help='Number of test functions')
+    parser.add_argument('--tests-per-file', type=int, default=50, help='Number of test functions of each test module')
+    parser.add_argument('--fan-out', type=int, default=3, help='Number of modules called by each source module')
+    parser.add_argument('--fan-in', type=int, default=3, help='Number of source modules called by each test')
+    parser.add_argument('--functions', type=int, default=5, help='Number of functions of each source module')
+    parser.add_argument('--function-lines', type=int, default=5, help='Number of statements of each function')
+    parser.add_argument('--seed', type=int, default=0, help='Seed of the random choices')
+
+
+def get_parameters(arguments):
+    """
+    Get the parameters of generate_project from the parsed arguments
+
+    :param arguments Arguments parsed by a parser with the arguments of add_arguments
+    """
+    return {'modules': arguments.modules, 'tests': arguments.tests, 'tests_per_file': arguments.tests_per_file,
+            'fan_out': arguments.fan_out, 'fan_in': arguments.fan_in, 'functions': arguments.functions,
+            'function_lines': arguments.function_lines, 'seed': arguments.seed}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Generate a synthetic project to benchmark pytest-ekstazi')
+    parser.add_argument('directory', help='Directory of the project, it must not exist or be empty')
+    parser.add_argument('--force', action='store_true', help='Replace the directory of the project if it is not empty')
+    add_arguments(parser)
+    arguments = parser.parse_args()
+    try:
+        generate_project(arguments.directory, force=arguments.force, **get_parameters(arguments))
+    except FileExistsError as error:
+        parser.error('{}, use --force to replace it'.format(error))
+
+
+if __name__ == '__main__':
+    main()
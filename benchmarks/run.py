@@ -0,0 +1,197 @@
+"""
+Measure the wall time and the peak RSS of the plugin on a synthetic project and write the results as JSON.
+
+    python benchmarks/run.py --modules 500 --tests 5000 --output results.json
+
+Every scenario runs in a new process, so its peak RSS is not affected by the other scenarios:
+
+- plain: pytest without the plugin
+- first_run: pytest --ekstazi without a configuration file, tracing every test
+- no_change: pytest --ekstazi again, selecting no test
+- one_file_change: pytest --ekstazi after changing the source module used by most tests
+- configuration: loading the configuration file, reading every test entry and saving a change
+"""
+import os
+import sys
+import json
+import time
+import shlex
+import pathlib
+import platform
+import tempfile
+import argparse
+import statistics
+import subprocess
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+sys.path.insert(0, str(pathlib.Path(__file__).parent))
+
+import generate
+
+CONFIGURATION_FILE = 'ekstazi.json'
+SCENARIOS = ['plain', 'first_run', 'no_change', 'one_file_change', 'configuration']
+
+# loads a configuration file, reads the entry of every test and saves a change, printing the times as JSON
+CONFIGURATION_SCRIPT = '''
+import sys, json, time
+from pytest_ekstazi.config import EkstaziConfiguration
+from pytest_ekstazi.storage import DEPENDENCIES
+start = time.perf_counter()
+configuration = EkstaziConfiguration(sys.argv[1])
+test_keys = [test_key for test_key, _ in configuration.items(DEPENDENCIES)]
+for test_key in test_keys:
+    configuration.get_test_dependencies(*EkstaziConfiguration.extract_test_from_key(test_key))
+loaded = time.perf_counter()
+configuration.add_test_hash(*EkstaziConfiguration.extract_test_from_key(test_keys[0]), '0' * 40)
+configuration.save()
+configuration.close()
+saved = time.perf_counter()
+print(json.dumps({'load_time': loaded - start, 'save_time': saved - loaded, 'tests': len(test_keys)}))
+'''
+
+
+def run_process(arguments, directory):
+    """
+    Run a process and measure its wall time and its peak RSS in kilobytes (None if it can not be measured)
+
+    :param arguments Command line of the process
+    :param directory Working directory of the process
+    :return wall time, peak RSS, exit code and standard output
+    """
+    start = time.perf_counter()
+    process = subprocess.Popen(arguments, cwd=str(directory), stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                               universal_newlines=True)
+    output = process.stdout.read()
+    peak_rss = None
+    if resource is not None and hasattr(os, 'wait4'):
+        _, status, usage = os.wait4(process.pid, 0)
+        process.returncode = os.waitstatus_to_exitcode(status) if hasattr(os, 'waitstatus_to_exitcode') else status
+        # ru_maxrss is in bytes on macOS and in kilobytes on Linux
+        peak_rss = usage.ru_maxrss // 1024 if sys.platform == 'darwin' else usage.ru_maxrss
+    else:
+        process.wait()
+    wall_time = time.perf_counter() - start
+    process.stdout.close()
+    return wall_time, peak_rss, process.returncode, output
+
+
+def run_scenario(scenario, directory, pytest_args, configuration_file, changed_module):
+    """
+    Run a benchmark scenario on a synthetic project
+
+    :param scenario Scenario name, one of SCENARIOS
+    :param directory Directory of the synthetic project
+    :param pytest_args Extra arguments of the pytest runs with the plugin
+    :param configuration_file Location of the configuration file of the plugin
+    :param changed_module Location of the source module changed by the one_file_change scenario
+    """
+    pytest_command = [sys.executable, '-m', 'pytest', '-q', '-p', 'no:cacheprovider']
+    ekstazi_command = pytest_command + ['--ekstazi', '--ekstazi-file', str(configuration_file)] + pytest_args
+    if scenario == 'plain':
+        return run_process(pytest_command, directory)
+    if scenario == 'first_run':
+        for file_path in (configuration_file, pathlib.Path(str(configuration_file) + '.journal')):
+            if file_path.exists():
+                os.remove(file_path)
+        return run_process(ekstazi_command, directory)
+    if scenario == 'no_change':
+        return run_process(ekstazi_command, directory)
+    if scenario == 'one_file_change':
+        original_content = changed_module.read_text()
+        changed_module.write_text(original_content + '\n\ndef changed_function():\n    return 0\n')
+        try:
+            return run_process(ekstazi_command, directory)
+        finally:
+            # the changed module is selected again by the next run, which restores the saved hashes
+            changed_module.write_text(original_content)
+            run_process(ekstazi_command, directory)
+    if scenario == 'configuration':
+        return run_process([sys.executable, '-c', CONFIGURATION_SCRIPT, str(configuration_file)], directory)
+    raise ValueError('Unknown scenario "{}"'.format(scenario))
+
+
+def run_benchmarks(directory, parameters, scenarios=SCENARIOS, repeat=3, pytest_args=None,
+                   configuration_file=CONFIGURATION_FILE, force=False):
+    """
+    Generate a synthetic project and run the benchmark scenarios on it
+
+    :param directory Directory of the synthetic project
+    :param parameters Parameters of the synthetic project (see generate.generate_project)
+    :param scenarios Names of the scenarios, run in the order of SCENARIOS
+    :param repeat Number of runs of each scenario
+    :param pytest_args Extra arguments of the pytest runs with the plugin, e.g. ["--ekstazi-hash-workers", "4"]
+    :param configuration_file Name of the configuration file in the project directory, its suffix chooses its format
+    :param force Replace the directory of the project when it is not empty
+    """
+    pytest_args = pytest_args or []
+    directory = generate.generate_project(directory, force=force, **parameters)
+    configuration_file = directory / configuration_file
+    changed_module = generate.get_module_path(directory, parameters['modules'] - 1)
+    results = dict()
+    for scenario in [s for s in SCENARIOS if s in scenarios]:
+        if scenario != 'first_run' and scenario != 'plain' and not configuration_file.exists():
+            run_scenario('first_run', directory, pytest_args, configuration_file, changed_module)
+        samples = []
+        for _ in range(repeat):
+            wall_time, peak_rss, exit_code, output = run_scenario(scenario, directory, pytest_args, configuration_file,
+                                                                  changed_module)
+            if exit_code not in (0, 5):
+                # 5: no tests were selected
+                raise RuntimeError('The scenario {} has failed with exit code {}:\n{}'.format(scenario, exit_code, output))
+            sample = {'wall_time': wall_time, 'peak_rss_kb': peak_rss}
+            if scenario == 'configuration':
+                sample.update(json.loads(output.strip().splitlines()[-1]))
+            samples.append(sample)
+        results[scenario] = {
+            'samples': samples,
+            'median_wall_time': statistics.median(s['wall_time'] for s in samples),
+            'max_peak_rss_kb': max((s['peak_rss_kb'] for s in samples if s['peak_rss_kb'] is not None), default=None)
+        }
+    return {
+        'parameters': parameters,
+        'pytest_args': pytest_args,
+        'configuration_file': configuration_file.name,
+        'repeat': repeat,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'results': results
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark pytest-ekstazi on a synthetic project')
+    generate.add_arguments(parser)
+    parser.add_argument('--scenarios', nargs='+', choices=SCENARIOS, default=SCENARIOS, help='Scenarios to run')
+    parser.add_argument('--repeat', type=int, default=3, help='Number of runs of each scenario')
+    parser.add_argument('--pytest-args', default='',
+                        help='Extra arguments of the pytest runs with the plugin, as a single shell-quoted string. '
+                             'Use the --pytest-args="..." form, so that arguments starting with a dash are not '
+                             'parsed as options of the runner, e.g. --pytest-args="--ekstazi-paranoid".')
+    parser.add_argument('--configuration-file', default=CONFIGURATION_FILE,
+                        help='Name of the configuration file, its suffix chooses its format (.json, .bin or .db)')
+    parser.add_argument('--directory', help='Directory of the synthetic project, it must not exist or be empty. '
+                                            'By default a temporary directory.')
+    parser.add_argument('--force', action='store_true', help='Replace the directory of the project if it is not empty')
+    parser.add_argument('--output', help='Location of the JSON results. By default they are written to stdout.')
+    arguments = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as temp_directory:
+        directory = arguments.directory or pathlib.Path(temp_directory) / 'project'
+        try:
+            results = run_benchmarks(directory, generate.get_parameters(arguments), arguments.scenarios, arguments.repeat,
+                                     shlex.split(arguments.pytest_args), arguments.configuration_file, arguments.force)
+        except FileExistsError as error:
+            parser.error('{}, use --force to replace it'.format(error))
+    if arguments.output:
+        with open(arguments.output, 'w') as file:
+            json.dump(results, file, indent=4)
+    else:
+        print(json.dumps(results, indent=4))
+
+
+if __name__ == '__main__':
+    main()
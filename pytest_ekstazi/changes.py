@@ -0,0 +1,86 @@
+import os
+import sys
+import subprocess
+
+GIT_CHANGE_SOURCE = 'git'
+
+
+class ChangeSourceError(ValueError):
+    pass
+
+
+def parse_change_source(change_source):
+    """
+    Split a change source in its kind and its argument, e.g. "git:HEAD~1" into ("git", "HEAD~1")
+
+    :param change_source Change source in the form <kind>:<argument>
+    """
+    kind, separator, argument = change_source.partition(':')
+    if not separator or kind != GIT_CHANGE_SOURCE:
+        raise ChangeSourceError('Invalid change source "{}", expected "{}:<rev>"'.format(change_source, GIT_CHANGE_SOURCE))
+    return kind, argument or 'HEAD'
+
+
+def get_git_changed_files(revision, directory):
+    """
+    Get the absolute paths of the files changed in the working tree since a revision of the git repository,
+    including the untracked files
+
+    :param revision Git revision compared to the working tree
+    :param directory Directory inside the git repository
+    """
+    toplevel = _run_git(['rev-parse', '--show-toplevel'], directory).strip()
+    # without renames both paths of a moved file are listed, and -z does not quote the paths with special characters
+    changed_files = _run_git(['diff', '--name-only', '--no-renames', '-z', revision, '--'], toplevel).split('\0')
+    changed_files += _run_git(['ls-files', '--others', '--exclude-standard', '-z'], toplevel).split('\0')
+    return {os.path.abspath(os.path.join(toplevel, file_path)) for file_path in changed_files if file_path}
+
+
+def read_changed_files(file_path, directory):
+    """
+    Read the paths of the changed files from a file with a path per line. Relative paths are relative to a directory.
+
+    :param file_path Location of the file, or "-" to read the standard input
+    :param directory Directory of the relative paths
+    """
+    if file_path == '-':
+        lines = sys.stdin.read().splitlines()
+    else:
+        try:
+            with open(file_path) as file:
+                lines = file.read().splitlines()
+        except OSError as error:
+            raise ChangeSourceError('The changed files can not be read: {}'.format(error))
+    return {os.path.abspath(os.path.join(directory, line.strip())) for line in lines if line.strip()}
+
+
+def get_changed_files(change_source=None, changed_files_path=None, directory=None):
+    """
+    Get the absolute paths of the changed files from a change source and/or a file listing them.
+    Return None if no change source has been provided.
+
+    :param change_source Change source in the form "git:<rev>"
+    :param changed_files_path Location of a file listing the changed files, or "-" to read the standard input
+    :param directory Directory of the git repository and of the relative paths. By default the current directory.
+    """
+    if change_source is None and changed_files_path is None:
+        return None
+    directory = str(directory or os.getcwd())
+    changed_files = set()
+    if change_source is not None:
+        _, revision = parse_change_source(change_source)
+        changed_files.update(get_git_changed_files(revision, directory))
+    if changed_files_path is not None:
+        changed_files.update(read_changed_files(changed_files_path, directory))
+    return changed_files
+
+
+def _run_git(arguments, directory):
+    try:
+        process = subprocess.run(['git'] + arguments, cwd=directory, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                                 universal_newlines=True)
+    except OSError as error:
+        raise ChangeSourceError('git could not be executed: {}'.format(error))
+    if process.returncode != 0:
+        raise ChangeSourceError('git {} has failed: {}'.format(' '.join(arguments), process.stderr.strip()))
+    return process.stdout
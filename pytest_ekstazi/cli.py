@@ -0,0 +1,239 @@
+"""
+Query the configuration file of the plugin without running pytest: the tests are not collected and the test
+modules are not imported, only the files needed to answer the query are hashed.
+
+    python -m pytest_ekstazi affected --changed-from git:HEAD
+    python -m pytest_ekstazi stats --top 10
+    python -m pytest_ekstazi show tests/test_module.py::test_function
+"""
+import os
+import sys
+import pathlib
+import argparse
+
+from .config import EkstaziConfiguration, TestOutcome, MODULE_UNIT_NAME
+from .storage import TABLES, TEST_RESULTS, InvalidConfigurationFile, get_journal_path
+from .utils import hash_file_dependencies, split_dependency, HASH_ALGORITHMS
+from .changes import get_changed_files, ChangeSourceError
+from .plugin import DEFAULT_CONFIG_FILE
+
+
+def get_node_ids(test_location, test_file, unit_name):
+    """
+    Get the pytest node IDs of a unit of a test file: the test function (in each test class defining it),
+    the test class or the whole module
+
+    :param test_location Location of the test file relative to the rootdir
+    :param test_file Entry of the test file in the configuration file
+    :param unit_name Name of the unit in the configuration file
+    """
+    test_location = pathlib.PurePath(test_location).as_posix()
+    if unit_name == MODULE_UNIT_NAME:
+        return [test_location]
+    # the name of a test function does not include its test classes
+    qualnames = test_file.get('qualnames', dict()).get(unit_name, [unit_name])
+    return ['{}::{}'.format(test_location, qualname.replace('.', '::')) for qualname in qualnames]
+
+
+def get_affected_tests(configuration, rootdir, changed_files=None):
+    """
+    Get the node IDs of the tests that the plugin would select: the tests that depend on a changed file, the tests
+    of the changed test files and of the test files whose fixture files have changed, the tests whose dependencies
+    are not known and the pending tests. A changed test file selects all of its tests, as the test functions are
+    not compared without importing the file.
+
+    :param configuration EkstaziConfiguration object
+    :param rootdir Directory of the test file locations saved in the configuration
+    :param changed_files Absolute paths of the changed files. Only these files are hashed, by default every file
+                         known from the configuration is checked, without reading the files whose stat signature
+                         has not changed.
+    """
+    hash_algorithm = configuration.get_hash_algorithm()
+    normalized_hashes = configuration.get_normalized_hashes() if configuration.get_hash_normalization() else None
+    test_files = configuration.get_test_files()
+
+    # the same dependencies hashed by the plugin when the session starts
+    dependencies = configuration.get_dependency_files()
+    for test_location, test_file in test_files.items():
+        test_file_path = str(pathlib.Path(rootdir) / test_location)
+        dependencies[test_file_path] = dependencies.get(test_file_path, []) + [(test_file['hash'], test_file.get('stat'))]
+        for fixture_file in test_file['fixture_files']:
+            dependencies.setdefault(fixture_file, [])
+    if changed_files is not None:
+        dependencies = {d: h for d, h in dependencies.items() if split_dependency(d)[0] in changed_files}
+    files = dict()
+    for dependency, known_hashes in dependencies.items():
+        files.setdefault(split_dependency(dependency)[0], dict())[dependency] = known_hashes
+    hashes = dict()
+    hashes_cache = dict()
+    for file_path, file_dependencies in files.items():
+        hashes.update(hash_file_dependencies(file_path, file_dependencies, hashes_cache, hash_algorithm,
+                                             normalized_hashes)[1])
+
+    def is_changed(dependency, saved_hash):
+        # the files that are not hashed have not changed
+        return hashes.get(dependency, saved_hash) != saved_hash
+
+    changed_dependencies = [d for d, saved_hash in configuration.get_dependencies_hashes().items() if is_changed(d, saved_hash)]
+    affected_tests = configuration.get_affected_tests(changed_dependencies)
+    node_ids = set()
+    for test_location, test_file in test_files.items():
+        test_file_path = str(pathlib.Path(rootdir) / test_location)
+        units = test_file.get('units', test_file['tests'])
+        if is_changed(test_file_path, test_file['hash']) or \
+                any(is_changed(f, fixture_file_hash) for f, fixture_file_hash in test_file['fixture_files'].items()):
+            for unit_name in units:
+                node_ids.update(get_node_ids(test_location, test_file, unit_name))
+            continue
+        for unit_name in units:
+            if EkstaziConfiguration.get_test_key(test_location, unit_name) in affected_tests or \
+                    configuration.get_test_dependencies(test_location, unit_name) is None:
+                node_ids.update(get_node_ids(test_location, test_file, unit_name))
+        for test_name in test_file['tests']:
+            if configuration.is_test_pending(test_location, test_name):
+                node_ids.update(get_node_ids(test_location, test_file, test_name))
+    return sorted(node_ids)
+
+
+def get_hub_files(configuration, top):
+    """
+    Get the dependencies with the most dependent tests, as a list of (dependency, number of tests) pairs
+
+    :param configuration EkstaziConfiguration object
+    :param top Number of dependencies
+    """
+    dependents = ((dependency, len(tests)) for dependency, tests in configuration.get_dependents().items())
+    return sorted(dependents, key=lambda dependent: (-dependent[1], dependent[0]))[:top]
+
+
+def find_test_key(configuration, test):
+    """
+    Find the key of a test in the configuration from a test key or a node ID. Return None if the test is not found.
+
+    :param configuration EkstaziConfiguration object
+    :param test Test key (e.g. "test_module.py::test_function") or node ID (e.g. "tests/test_module.py::test_function[1]")
+    """
+    # the parameters of the node ID are not part of the test key
+    test_location, _, names = test.split('[', 1)[0].partition('::')
+    names = names.split('::') if names else []
+    # the test function, then its classes and its module for module granularity
+    unit_names = names[-1:] + ['.'.join(names[:index]) for index in range(len(names), 0, -1)] + [MODULE_UNIT_NAME]
+    test_keys = [EkstaziConfiguration.get_test_key(test_location, unit_name) for unit_name in unit_names]
+    for test_key in test_keys:
+        if configuration.get_test_dependencies(*EkstaziConfiguration.extract_test_from_key(test_key)) is not None or \
+                configuration.get_test_hash(*EkstaziConfiguration.extract_test_from_key(test_key)) is not None:
+            return test_key
+    return None
+
+
+def affected_command(configuration, arguments):
+    if configuration.get_hash_algorithm() not in HASH_ALGORITHMS:
+        print('The hash algorithm "{}" of the configuration file is not available'.format(configuration.get_hash_algorithm()),
+              file=sys.stderr)
+        return 1
+    changed_files = None
+    if arguments.changed_from is not None or arguments.changed_files is not None or arguments.files:
+        changed_files = get_changed_files(arguments.changed_from, arguments.changed_files, os.getcwd()) or set()
+        changed_files.update(os.path.abspath(file_path) for file_path in arguments.files)
+    node_ids = get_affected_tests(configuration, os.path.abspath(arguments.rootdir), changed_files)
+    if arguments.test_files:
+        node_ids = sorted({node_id.split('::', 1)[0] for node_id in node_ids})
+    if arguments.count:
+        print(len(node_ids))
+    else:
+        for node_id in node_ids:
+            print(node_id)
+    return 0
+
+
+def stats_command(configuration, arguments):
+    journal_path = get_journal_path(arguments.file)
+    print('file: {} ({} bytes)'.format(arguments.file, os.path.getsize(arguments.file)))
+    if journal_path.exists():
+        print('journal: {} ({} bytes)'.format(journal_path, journal_path.stat().st_size))
+    for table in TABLES:
+        print('{}: {}'.format(table, sum(1 for _ in configuration.items(table))))
+    results = [TestOutcome(result) for _, result in configuration.items(TEST_RESULTS)]
+    print('failed tests: {}'.format(sum(1 for r in results if r in (TestOutcome.FAILED, TestOutcome.ERROR))))
+    print('hash algorithm: {}'.format(configuration.get_hash_algorithm()))
+    print('hash normalization: {}'.format('yes' if configuration.get_hash_normalization() else 'no'))
+    if arguments.top:
+        print('hub files:')
+        for dependency, tests in get_hub_files(configuration, arguments.top):
+            print('{:>8}  {}'.format(tests, dependency))
+    return 0
+
+
+def show_command(configuration, arguments):
+    test_key = find_test_key(configuration, arguments.test)
+    if test_key is None:
+        print('The test "{}" is not in the configuration file'.format(arguments.test), file=sys.stderr)
+        return 1
+    test_location, test_name = EkstaziConfiguration.extract_test_from_key(test_key)
+    last_result = configuration.get_last_test_result(test_location, test_name)
+    duration = configuration.get_test_duration(test_location, test_name)
+    dependencies = sorted(configuration.get_test_dependencies(test_location, test_name) or ())
+    print('test: {}'.format(test_key))
+    print('hash: {}'.format(configuration.get_test_hash(test_location, test_name)))
+    print('result: {}'.format(last_result.value if last_result is not None else None))
+    print('duration: {}'.format('{:.3f}s'.format(duration) if duration is not None else None))
+    print('pending: {}'.format('yes' if configuration.is_test_pending(test_location, test_name) else 'no'))
+    print('dependencies: {}'.format(len(dependencies)))
+    for dependency in dependencies:
+        print('  {}  {}'.format(configuration.get_dependency_hash(dependency), dependency))
+    return 0
+
+
+def get_parser():
+    """Get the argument parser of the command line"""
+    parser = argparse.ArgumentParser(prog='python -m pytest_ekstazi',
+                                     description='Query the configuration file of pytest-ekstazi without running pytest')
+    parser.add_argument('--file', default=DEFAULT_CONFIG_FILE,
+                        help='Ekstazi configuration file. Default: "{}".'.format(DEFAULT_CONFIG_FILE))
+    subparsers = parser.add_subparsers(dest='command', metavar='command')
+    subparsers.required = True
+
+    affected_parser = subparsers.add_parser('affected', help='Print the node IDs of the affected tests')
+    affected_parser.add_argument('files', nargs='*',
+                                 help='Changed files. Only the changed files are hashed, by default every file is checked.')
+    affected_parser.add_argument('--changed-from', metavar='git:REV', help='Find the changed files with git')
+    affected_parser.add_argument('--changed-files', metavar='FILE',
+                                 help='File listing the changed files, one path per line ("-" reads the standard input)')
+    affected_parser.add_argument('--rootdir', default=os.curdir,
+                                 help='Rootdir of the pytest sessions that saved the configuration file. '
+                                      'Default: the current directory.')
+    affected_parser.add_argument('--count', action='store_true', help='Print the number of affected tests')
+    affected_parser.add_argument('--test-files', action='store_true', help='Print the affected test files')
+    affected_parser.set_defaults(function=affected_command)
+
+    stats_parser = subparsers.add_parser('stats', help='Print the size of the configuration file and its hub files')
+    stats_parser.add_argument('--top', type=int, default=10,
+                              help='Number of hub files, the files with the most dependent tests. Default: 10.')
+    stats_parser.set_defaults(function=stats_command)
+
+    show_parser = subparsers.add_parser('show', help='Print the entry of a test')
+    show_parser.add_argument('test', help='Test key (test_module.py::test_function) or node ID')
+    show_parser.set_defaults(function=show_command)
+    return parser
+
+
+def main(argv=None):
+    """
+    Run the command line and return its exit code
+
+    :param argv Command line arguments. By default sys.argv.
+    """
+    parser = get_parser()
+    arguments = parser.parse_args(argv)
+    if not os.path.exists(arguments.file):
+        parser.error('The configuration file "{}" does not exist'.format(arguments.file))
+    try:
+        configuration = EkstaziConfiguration(arguments.file)
+    except InvalidConfigurationFile as error:
+        parser.error(str(error))
+    try:
+        return arguments.function(configuration, arguments)
+    except ChangeSourceError as error:
+        parser.error(str(error))
+    finally:
+        configuration.close()
@@ -0,0 +1,240 @@
+import os
+import re
+import sys
+import threading
+import contextlib
+
+from .utils import get_function_dependency, get_code_scopes
+
+TRACE_IGNORE_FILES = re.compile(r'\<.+\>')
+
+# tool identifiers that may be claimed in sys.monitoring (debugger and coverage ids are left to other tools)
+MONITORING_TOOL_IDS = (2, 3, 4)
+MONITORING_TOOL_NAME = 'pytest-ekstazi'
+
+# the reads of Python files are not tracked, their executed code is already collected
+PYTHON_FILE_SUFFIXES = ('.py', '.pyc', '.pyo')
+
+# flags of os.open that can modify a file
+WRITE_FLAGS = os.O_WRONLY | os.O_RDWR | os.O_APPEND | os.O_CREAT | os.O_TRUNC
+
+
+class DependencyCollector:
+    def __init__(self, ignore_dirs, function_dependencies=False, read_dirs=None):
+        """
+        Collect the files of the code objects executed while a test runs.
+        Each file is checked only once per session against the ignored directories, and each code object
+        produces at most one event per collection.
+
+        :param ignore_dirs Directories whose files are never considered as dependencies
+        :param function_dependencies Collect the functions and classes executed (and the module level code of their
+                                     files) instead of the whole files. It requires Python 3.11+ (co_qualname),
+                                     whole files are collected in older versions.
+        :param read_dirs Directories whose non-Python files opened for reading are also collected, through an audit
+                         hook. The files opened for writing in the same collection are not dependencies.
+                         By default the opened files are not tracked.
+        """
+        self._ignore_dirs = tuple(str(path) for path in ignore_dirs)
+        # the frames of the collector and of its context manager run while collecting, so they are never dependencies
+        self._dependency_files = {__file__: False, contextlib.__file__: False}
+        self._dependencies = None
+        self._ignored_names = ()
+        self._function_dependencies = function_dependencies and sys.version_info >= (3, 11)
+        self._code_dependencies = dict()
+        # code objects already reported in the current collection
+        self._seen_codes = set()
+        self._collecting = False
+        # number of code objects reported to the collector in the session
+        self.events = 0
+        self._read_dirs = tuple(os.path.join(str(path), '') for path in read_dirs) if read_dirs else None
+        self._tracking_reads = False
+        self._audit_hook_added = False
+        # the files opened by other threads (e.g. the files hashed by the plugin) are not read by the test
+        self._tracking_thread = None
+        # opened files already handled in the current collection, so reopening a file costs a set lookup
+        self._opened_files = set()
+        self._written_files = set()
+
+    def is_dependency_file(self, file_path):
+        """
+        Check whether a source file can be a test dependency. The result is cached for the whole session.
+
+        :param file_path Source file of a code object
+        """
+        is_dependency = self._dependency_files.get(file_path)
+        if is_dependency is None:
+            is_dependency = not file_path.startswith(self._ignore_dirs) and not TRACE_IGNORE_FILES.match(file_path)
+            self._dependency_files[file_path] = is_dependency
+        return is_dependency
+
+    @contextlib.contextmanager
+    def collect(self, dependencies, ignored_names=()):
+        """
+        Add to ``dependencies`` the file of every code object executed inside the context
+
+        :param dependencies Set where the dependency files are added
+        :param ignored_names Names of code objects that must not be considered as dependencies (e.g. the test itself)
+        """
+        # a collection inside another one (e.g. a fixture requested while a test runs) pauses the outer collection
+        outer_collection = (self._dependencies, self._ignored_names) if self._collecting else None
+        if outer_collection is not None:
+            self._pause()
+        self._resume(dependencies, ignored_names)
+        try:
+            yield dependencies
+        finally:
+            self._pause()
+            if outer_collection is not None:
+                self._resume(*outer_collection)
+
+    def _resume(self, dependencies, ignored_names):
+        restart = dependencies is not self._dependencies
+        if restart:
+            self._seen_codes = set()
+        self._dependencies = dependencies
+        self._ignored_names = ignored_names
+        if self._read_dirs is not None:
+            self._start_tracking_reads(restart)
+        self._start(restart)
+        self._collecting = True
+
+    def _pause(self):
+        self._stop()
+        self._tracking_reads = False
+        self._collecting = False
+
+    def _on_code(self, code):
+        self.events += 1
+        if code.co_name not in self._ignored_names and self.is_dependency_file(code.co_filename):
+            if self._function_dependencies:
+                self._dependencies.update(self._get_code_dependencies(code))
+            else:
+                self._dependencies.add(code.co_filename)
+
+    def _get_code_dependencies(self, code):
+        code_key = (code.co_filename, code.co_qualname)
+        dependencies = self._code_dependencies.get(code_key)
+        if dependencies is None:
+            dependencies = [get_function_dependency(code.co_filename, scope) for scope in get_code_scopes(code.co_qualname)]
+            self._code_dependencies[code_key] = dependencies
+        return dependencies
+
+    def _start_tracking_reads(self, restart):
+        if not self._audit_hook_added:
+            # audit hooks can not be removed, the hook does nothing while no collection is running
+            sys.addaudithook(self._audit_hook)
+            self._audit_hook_added = True
+        if restart:
+            self._opened_files = set()
+            self._written_files = set()
+        self._tracking_thread = threading.get_ident()
+        self._tracking_reads = True
+
+    def _audit_hook(self, event, args):
+        if event != 'open' or not self._tracking_reads or threading.get_ident() != self._tracking_thread:
+            return
+        file, mode, flags = args
+        if isinstance(file, int):
+            return
+        writing = any(char in mode for char in 'wax+') if mode else bool((flags or 0) & WRITE_FLAGS)
+        opened_key = (file, writing)
+        if opened_key in self._opened_files:
+            return
+        self._opened_files.add(opened_key)
+        file_path = os.path.abspath(os.fsdecode(file))
+        if writing:
+            self._written_files.add(file_path)
+            self._dependencies.discard(file_path)
+        elif self.is_read_dependency_file(file_path) and file_path not in self._written_files:
+            self._dependencies.add(file_path)
+
+    def is_read_dependency_file(self, file_path):
+        """
+        Check whether a file opened for reading can be a test dependency
+
+        :param file_path Absolute location of the file
+        """
+        return file_path.startswith(self._read_dirs) and not file_path.startswith(self._ignore_dirs) \
+            and not file_path.endswith(PYTHON_FILE_SUFFIXES)
+
+    def _start(self, restart):
+        raise NotImplementedError
+
+    def _stop(self):
+        raise NotImplementedError
+
+
+class MonitoringDependencyCollector(DependencyCollector):
+    """
+    Dependency collector using sys.monitoring (Python 3.12+). The code locations are not disabled after their first
+    event: sys.monitoring.restart_events would enable again the locations disabled by the other tools (e.g. coverage),
+    so each code object is only reported once per collection, as with sys.setprofile.
+    """
+
+    def __init__(self, ignore_dirs, function_dependencies=False, read_dirs=None):
+        super().__init__(ignore_dirs, function_dependencies, read_dirs)
+        self._tool_id = None
+
+    def _start(self, restart):
+        monitoring = sys.monitoring
+        if self._tool_id is None:
+            self._tool_id = self._acquire_tool_id()
+            for event in (monitoring.events.PY_START, monitoring.events.PY_RESUME):
+                monitoring.register_callback(self._tool_id, event, self._monitoring_callback)
+        monitoring.set_events(self._tool_id, monitoring.events.PY_START | monitoring.events.PY_RESUME)
+
+    def _stop(self):
+        sys.monitoring.set_events(self._tool_id, sys.monitoring.events.NO_EVENTS)
+
+    def _monitoring_callback(self, code, instruction_offset):
+        if code not in self._seen_codes:
+            self._seen_codes.add(code)
+            self._on_code(code)
+
+    @staticmethod
+    def _acquire_tool_id():
+        # the id of a previous collector is reused, its callbacks are replaced by the ones of the new collector
+        for tool_id in MONITORING_TOOL_IDS:
+            if sys.monitoring.get_tool(tool_id) == MONITORING_TOOL_NAME:
+                return tool_id
+        for tool_id in MONITORING_TOOL_IDS:
+            if sys.monitoring.get_tool(tool_id) is None:
+                sys.monitoring.use_tool_id(tool_id, MONITORING_TOOL_NAME)
+                return tool_id
+        raise RuntimeError('No sys.monitoring tool id is available for pytest-ekstazi')
+
+
+class ProfileDependencyCollector(DependencyCollector):
+    """Dependency collector using sys.setprofile. Only call events are inspected, there is no line tracing."""
+
+    def __init__(self, ignore_dirs, function_dependencies=False, read_dirs=None):
+        super().__init__(ignore_dirs, function_dependencies, read_dirs)
+        self._previous_profile = None
+
+    def _start(self, restart):
+        self._previous_profile = sys.getprofile()
+        sys.setprofile(self._profile_callback)
+
+    def _stop(self):
+        sys.setprofile(self._previous_profile)
+        self._previous_profile = None
+
+    def _profile_callback(self, frame, event, arg):
+        if event == 'call':
+            code = frame.f_code
+            if code not in self._seen_codes:
+                self._seen_codes.add(code)
+                self._on_code(code)
+
+
+def create_dependency_collector(ignore_dirs, function_dependencies=False, read_dirs=None):
+    """
+    Create the dependency collector with lowest overhead available in the running Python version
+
+    :param ignore_dirs Directories whose files are never considered as dependencies
+    :param function_dependencies Collect the functions and classes executed instead of the whole files
+    :param read_dirs Directories whose non-Python files opened for reading are also collected
+    """
+    if hasattr(sys, 'monitoring'):
+        return MonitoringDependencyCollector(ignore_dirs, function_dependencies, read_dirs)
+    return ProfileDependencyCollector(ignore_dirs, function_dependencies, read_dirs)
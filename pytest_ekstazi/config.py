@@ -1,7 +1,16 @@
 import enum
-import json
 import pathlib
 
+from .storage import open_storage, append_journal, read_journal, remove_journal, REMOVED, \
+    TABLES, DEPENDENCIES, DEPENDENCIES_HASHES, TEST_HASHES, TEST_RESULTS, TEST_FILES, FILE_STATS, METADATA, DEPENDENTS, \
+    NORMALIZED_HASHES, TEST_DURATIONS, PENDING_TESTS, FINGERPRINTS
+from .utils import DEFAULT_HASH_ALGORITHM
+# kept importable from this module for backward compatibility
+from .storage import InvalidConfigurationFile  # noqa: F401
+
+# unit name of the test functions defined outside of classes for module granularity
+MODULE_UNIT_NAME = '<module>'
+
 
 class TestOutcome(str, enum.Enum):
     PASSED = 'passed'
@@ -10,10 +19,6 @@ class TestOutcome(str, enum.Enum):
     ERROR = 'error'
 
 
-class InvalidConfigurationFile(ValueError):
-    pass
-
-
 class EkstaziConfiguration:
     def __init__(self, file_path):
         """
@@ -22,24 +27,10 @@ class EkstaziConfiguration:
         :param file_path Configuration file path.
         """
         self._file_path = file_path
-        self._dependencies = dict()
-        self._dependencies_hashes = dict()
-        self._test_hashes = dict()
-        self._test_results = dict()
-
-        if pathlib.Path(file_path).exists():
-            with open(file_path) as file:
-                parsed_json = json.load(file)
-                json_objects = {'dependencies': self._dependencies, 'dependencies_hashes': self._dependencies_hashes,
-                                'test_hashes': self._test_hashes, 'test_results': self._test_results}
-                for key, local_dict in json_objects.items():
-                    json_object = parsed_json.get(key, local_dict) 
-                    if not isinstance(json_object, dict):
-                        raise InvalidConfigurationFile('{} is not a dictionary'.format(key))
-                    local_dict.update(json_object)
-
-                # convert test result values to TestOutcome object
-                self._test_results = {key: TestOutcome(value) for key, value in self._test_results.items()}
+        self._storage = open_storage(file_path)
+        # entries changed since the configuration file was loaded, by table
+        self._changes = {table: dict() for table in TABLES}
+        self._replay_journal()
 
     def set_test_dependencies_entry(self, test_file_path, test_name):
         """
@@ -50,7 +41,7 @@ class EkstaziConfiguration:
         :param test_name Test function name
         """
         test_key = self.get_test_key(test_file_path, test_name)
-        self._dependencies.setdefault(test_key, set())
+        self._get_changed_dependencies(test_key)
     
     def add_test_dependency(self, test_file_path, test_name, depedency_file_path):
         """
@@ -61,8 +52,7 @@ class EkstaziConfiguration:
         :param depedency_file_path Dependency file path
         """
         test_key = self.get_test_key(test_file_path, test_name)
-        self._dependencies.setdefault(test_key, set())
-        self._dependencies[test_key].add(str(depedency_file_path))
+        self._get_changed_dependencies(test_key).add(str(depedency_file_path))
     
     def get_test_dependencies(self, test_file_path, test_name):
         """
@@ -72,7 +62,39 @@ class EkstaziConfiguration:
         :param test_name Test function name
         """
         test_key = self.get_test_key(test_file_path, test_name)
-        return self._dependencies.get(test_key)
+        dependencies = self._get(DEPENDENCIES, test_key)
+        return set(dependencies) if dependencies is not None else None
+
+    def get_dependent_tests(self, dependency):
+        """
+        Get the keys of the tests that depend on a file (or function), including the changes not saved yet
+
+        :param dependency Dependency file path (or function dependency)
+        """
+        dependency = str(dependency)
+        dependent_tests = set(self._get(DEPENDENTS, dependency) or ())
+        for test_key, dependencies in self._changes[DEPENDENCIES].items():
+            if dependencies is not REMOVED and dependency in dependencies:
+                dependent_tests.add(test_key)
+            else:
+                dependent_tests.discard(test_key)
+        return dependent_tests
+
+    def get_affected_tests(self, dependencies):
+        """
+        Get the keys of the tests that depend on any of the dependencies
+
+        :param dependencies Dependency file paths (or function dependencies), e.g. the changed files
+        """
+        affected_tests = set()
+        for dependency in dependencies:
+            affected_tests.update(self.get_dependent_tests(dependency))
+        return affected_tests
+
+    def get_dependents(self):
+        """Get the keys of the tests that depend on each file (or function), including the changes not saved yet"""
+        self._update_dependents()
+        return dict(self.items(DEPENDENTS))
 
     def remove_dependencies(self, test_file_path, test_name):
         """
@@ -82,8 +104,7 @@ class EkstaziConfiguration:
         :param test_name Test function name
         """
         test_key = self.get_test_key(test_file_path, test_name)
-        if test_key in self._dependencies: 
-            del self._dependencies[test_key]
+        self._changes[DEPENDENCIES][test_key] = REMOVED
     
     def add_dependency_hash(self, file_path, hashdigest):
         """Add or update the hash value of a file. This function calculates SHA-1 hash of the file content.
@@ -91,8 +112,7 @@ class EkstaziConfiguration:
         :param file_path Location of the file
         :param hashdigest Hash hexdigest of the file
         """
-        file_path = str(file_path)
-        self._dependencies_hashes[file_path] = hashdigest
+        self._changes[DEPENDENCIES_HASHES][str(file_path)] = hashdigest
     
     def add_test_hash(self, test_file_path, test_name, hashdigest):
         """Add or update the hash value of a test file. This function calculates SHA-1 hash of the file content.
@@ -102,7 +122,7 @@ class EkstaziConfiguration:
         :param hashdigest Hash hexdigest of the test
         """
         test_key = self.get_test_key(test_file_path, test_name)
-        self._test_hashes[test_key] = hashdigest
+        self._changes[TEST_HASHES][test_key] = hashdigest
     
     def set_test_result(self, test_file_path, test_name, outcome):
         """
@@ -113,14 +133,14 @@ class EkstaziConfiguration:
         :param outcome TestOutcome object defining the result of the test
         """
         test_key = self.get_test_key(test_file_path, test_name)
-        self._test_results[test_key] = outcome
+        self._changes[TEST_RESULTS][test_key] = TestOutcome(outcome).value
 
     def get_dependency_hash(self, file_path):
         """Get the hash of the content of a depedency file saved in the configuration 
 
         :param file_path Location of the file
         """
-        return self._dependencies_hashes.get(str(file_path))
+        return self._get(DEPENDENCIES_HASHES, str(file_path))
     
     def get_test_hash(self, test_file_path, test_name):
         """Get the hash of the content of a test file saved in the configuration 
@@ -129,7 +149,7 @@ class EkstaziConfiguration:
         :param test_name Test function name
         """
         test_key = self.get_test_key(test_file_path, test_name)
-        return self._test_hashes.get(test_key)
+        return self._get(TEST_HASHES, test_key)
     
     def get_last_test_result(self, test_file_path, test_name):
         """
@@ -139,17 +159,313 @@ class EkstaziConfiguration:
         :param test_name Test function name
         """
         test_key = self.get_test_key(test_file_path, test_name)
-        return self._test_results.get(test_key)
+        test_result = self._get(TEST_RESULTS, test_key)
+        return TestOutcome(test_result) if test_result is not None else None
+
+    def set_test_duration(self, test_file_path, test_name, duration):
+        """
+        Set the duration of the last execution of a test, including the setup and teardown of its fixtures.
+        The duration of a parametrized test is the mean duration of its parametrized tests.
+
+        :param test_file_path Script location of the test case
+        :param test_name Test function name
+        :param duration Duration in seconds
+        """
+        test_key = self.get_test_key(test_file_path, test_name)
+        self._changes[TEST_DURATIONS][test_key] = duration
+
+    def get_test_duration(self, test_file_path, test_name):
+        """
+        Get the duration in seconds of the last execution of a test. The method returns None if it is not known.
+
+        :param test_file_path Script location of the test case
+        :param test_name Test function name
+        """
+        test_key = self.get_test_key(test_file_path, test_name)
+        return self._get(TEST_DURATIONS, test_key)
+
+    def set_test_pending(self, test_file_path, test_name, pending=True):
+        """
+        Mark a test as pending: it is affected by a change but has not run yet, so it must be selected in the next
+        executions even if nothing else has changed
+
+        :param test_file_path Script location of the test case
+        :param test_name Test function name
+        :param pending Whether the test is pending, False once it has run
+        """
+        test_key = self.get_test_key(test_file_path, test_name)
+        self._changes[PENDING_TESTS][test_key] = True if pending else REMOVED
+
+    def is_test_pending(self, test_file_path, test_name):
+        """
+        Check whether a test is pending
+
+        :param test_file_path Script location of the test case
+        :param test_name Test function name
+        """
+        test_key = self.get_test_key(test_file_path, test_name)
+        return bool(self._get(PENDING_TESTS, test_key))
+
+    def set_file_stat(self, dependency, stat_signature, timestamp):
+        """
+        Set the stat signature of the file of a dependency when its saved hash was calculated
+
+        :param dependency Dependency file path (or function dependency)
+        :param stat_signature Modification time in nanoseconds, size and inode number of the file
+        :param timestamp Time in nanoseconds taken before the file content was read
+        """
+        self._changes[FILE_STATS][str(dependency)] = list(stat_signature) + [timestamp]
+
+    def get_file_stat(self, dependency):
+        """
+        Get the stat signature and the timestamp saved with the hash of a dependency. The method returns None if
+        there is no signature saved, otherwise a list with modification time, size, inode number and timestamp.
+
+        :param dependency Dependency file path (or function dependency)
+        """
+        return self._get(FILE_STATS, str(dependency))
+
+    def get_dependency_files(self):
+        """
+        Get the saved hash of every dependency, with the stat signature and the timestamp saved with it,
+        as a dictionary of lists of (hash, stat) pairs
+        """
+        file_stats = dict(self.items(FILE_STATS))
+        return {dependency: [(hashdigest, file_stats.get(dependency))] for dependency, hashdigest in self.items(DEPENDENCIES_HASHES)}
+
+    def set_test_file(self, test_file_path, hashdigest, test_names, fixture_files, unit_names=None, file_stat=None,
+                      test_qualnames=None):
+        """
+        Set the entry of a test file, so the file can be checked without importing it
+        
+        :param test_file_path Script location of the test cases
+        :param hashdigest Hash hexdigest of the test file content
+        :param test_names Names of the test functions collected from the file
+        :param fixture_files Dictionary with the hashes of the files defining fixtures used by the tests (None for missing files)
+        :param unit_names Names under which the dependencies of the tests are saved. By default the test names.
+        :param file_stat Stat signature and timestamp of the test file when its hash was calculated
+        :param test_qualnames Dictionary with the qualified names of the test functions defined in test classes
+                              (e.g. "TestClass.test_method") by test name
+        """
+        test_names = sorted(set(test_names))
+        unit_names = sorted(set(unit_names)) if unit_names is not None else test_names
+        test_file = {'hash': hashdigest, 'tests': test_names, 'units': unit_names, 'fixture_files': dict(fixture_files)}
+        if file_stat is not None:
+            test_file['stat'] = list(file_stat)
+        if test_qualnames:
+            test_file['qualnames'] = {name: sorted(set(qualnames)) for name, qualnames in sorted(test_qualnames.items())}
+        self._changes[TEST_FILES][str(test_file_path)] = test_file
+
+    def get_dependencies_hashes(self):
+        """Get the saved hash of every dependency"""
+        return dict(self.items(DEPENDENCIES_HASHES))
+
+    def get_test_files(self):
+        """Get the entries of all test files, as a dictionary with the script location of each test file"""
+        return dict(self.items(TEST_FILES))
+
+    def get_test_file_hash(self, test_file_path):
+        """Get the hash of the content of a test file saved in the configuration
+
+        :param test_file_path Script location of the test cases
+        """
+        test_file = self._get(TEST_FILES, str(test_file_path))
+        return test_file['hash'] if test_file else None
+
+    def get_test_file_stat(self, test_file_path):
+        """
+        Get the stat signature and the timestamp saved with the hash of a test file
+
+        :param test_file_path Script location of the test cases
+        """
+        test_file = self._get(TEST_FILES, str(test_file_path))
+        return test_file.get('stat') if test_file else None
+
+    def get_test_file_tests(self, test_file_path):
+        """
+        Get the names of the test functions of a test file. The method returns None if the file has not been recorded.
+
+        :param test_file_path Script location of the test cases
+        """
+        test_file = self._get(TEST_FILES, str(test_file_path))
+        return test_file['tests'] if test_file else None
+
+    def get_test_file_units(self, test_file_path):
+        """
+        Get the names under which the dependencies of the tests of a test file are saved
+
+        :param test_file_path Script location of the test cases
+        """
+        test_file = self._get(TEST_FILES, str(test_file_path))
+        return test_file.get('units', test_file['tests']) if test_file else None
+
+    def get_test_file_fixture_files(self, test_file_path):
+        """
+        Get the hashes of the files defining the fixtures used by the tests of a test file
+
+        :param test_file_path Script location of the test cases
+        """
+        test_file = self._get(TEST_FILES, str(test_file_path))
+        return test_file['fixture_files'] if test_file else None
+
+    def set_hash_algorithm(self, algorithm):
+        """
+        Set the algorithm of the dependency and test file hashes
+
+        :param algorithm Name of the hash algorithm
+        """
+        self._changes[METADATA]['hash_algorithm'] = algorithm
+
+    def get_hash_algorithm(self):
+        """Get the algorithm of the dependency and test file hashes saved in the configuration"""
+        return self._get(METADATA, 'hash_algorithm') or DEFAULT_HASH_ALGORITHM
+
+    def set_hash_normalization(self, normalize):
+        """
+        Set whether the hashes of the Python files and of the test functions are hashes of their normalized AST
+
+        :param normalize Whether the hashes are normalized
+        """
+        self._changes[METADATA]['hash_normalization'] = bool(normalize)
+
+    def get_hash_normalization(self):
+        """Get whether the hashes saved in the configuration are hashes of the normalized AST of the sources"""
+        return bool(self._get(METADATA, 'hash_normalization'))
+
+    def set_normalized_hashes(self, file_path, hashes):
+        """
+        Set the normalized hashes of a Python file, cached by the hash of its raw content
+
+        :param file_path Location of the Python file
+        :param hashes Dictionary with the raw content hash, the file hash and the scope hashes of the file
+        """
+        self._changes[NORMALIZED_HASHES][str(file_path)] = hashes
+
+    def get_normalized_hashes(self):
+        """Get the normalized hashes of all Python files, by file path"""
+        return dict(self.items(NORMALIZED_HASHES))
+
+    def set_function_fingerprints(self, file_path, file_hash, python_tag, fingerprints):
+        """
+        Set the fingerprints of the test and fixture functions of a Python file
+
+        :param file_path Location of the Python file
+        :param file_hash Hash of the file when the fingerprints were calculated
+        :param python_tag Tag of the Python implementation that compiled the functions, e.g. "cpython-311"
+        :param fingerprints Dictionary with the fingerprint of each function
+        """
+        self._changes[FINGERPRINTS][str(file_path)] = {'hash': file_hash, 'python': python_tag,
+                                                       'functions': dict(fingerprints)}
+
+    def get_function_fingerprints(self, file_path, file_hash, python_tag):
+        """
+        Get the fingerprints of the functions of a Python file. The method returns an empty dictionary if the file
+        or the Python implementation have changed since they were saved.
+
+        :param file_path Location of the Python file
+        :param file_hash Current hash of the file
+        :param python_tag Tag of the current Python implementation
+        """
+        entry = self._get(FINGERPRINTS, str(file_path))
+        if not entry or entry['hash'] != file_hash or entry['python'] != python_tag:
+            return dict()
+        return dict(entry['functions'])
 
     def save(self):
-        """Save the dependencies and file hashes into the configuration file"""
-        json_content = {'dependencies': {d: list(self._dependencies[d]) for d in self._dependencies},
-                        'dependencies_hashes': self._dependencies_hashes,
-                        'test_hashes': self._test_hashes,
-                        'test_results': self._test_results}
-        with open(self._file_path, 'w') as file:
-            json.dump(json_content, file, indent=4)
-    
+        """Save the dependencies and file hashes into the configuration file. Only the changed entries are written."""
+        self._update_dependents()
+        self._storage.save({table: {key: value for key, value in table_changes.items() if self._is_changed(table, key, value)}
+                            for table, table_changes in self._changes.items()})
+        self._changes = {table: dict() for table in TABLES}
+        # the changes of the journal were loaded, so they have been saved as well
+        remove_journal(self._file_path)
+
+    def append_journal(self, changes):
+        """
+        Append the changes of finished tests to the journal of the configuration file. The changes are not applied
+        to this configuration, they are loaded with the configuration file until it is saved again, so an
+        interrupted session keeps the work of the tests it has completed.
+
+        :param changes Dictionary mapping each table to a dictionary of new values by key,
+                       e.g. {"dependencies": {test_key: [dependency, ...]}}
+        """
+        append_journal(self._file_path, changes)
+
+    def export(self, file_path):
+        """
+        Save the whole configuration into another file. The format is chosen by the file suffix,
+        so it can be used to convert between the JSON and the binary formats.
+
+        :param file_path Location of the exported configuration file
+        """
+        self._update_dependents()
+        storage = open_storage(file_path)
+        storage.save({table: dict(self.items(table)) for table in TABLES})
+        storage.close()
+
+    def items(self, table):
+        """
+        Iterate over the entries of a table of the configuration, including the changes not saved yet
+
+        :param table Table name
+        """
+        changes = self._changes[table]
+        for key, value in self._storage.items(table):
+            if key not in changes:
+                yield key, value
+        for key, value in changes.items():
+            if value is not REMOVED:
+                yield key, value
+
+    def close(self):
+        """Release the configuration file without saving the changes"""
+        self._storage.close()
+
+    def _replay_journal(self):
+        for changes in read_journal(self._file_path):
+            for table, table_changes in changes.items():
+                if table not in self._changes or table == DEPENDENTS:
+                    continue
+                for key, value in table_changes.items():
+                    self._changes[table][key] = set(value) if table == DEPENDENCIES else value
+
+    def _get(self, table, key):
+        if key not in self._changes[table]:
+            return self._storage.get(table, key)
+        value = self._changes[table][key]
+        return value if value is not REMOVED else None
+
+    def _is_changed(self, table, key, value):
+        stored_value = self._storage.get(table, key, REMOVED)
+        if value is REMOVED or stored_value is REMOVED:
+            return value is not stored_value
+        if table == DEPENDENCIES:
+            return set(value) != set(stored_value)
+        return value != stored_value
+
+    def _update_dependents(self):
+        # the dependents of the dependencies added to or removed from the changed tests are updated
+        dependents = dict()
+        for test_key, dependencies in self._changes[DEPENDENCIES].items():
+            saved_dependencies = set(self._storage.get(DEPENDENCIES, test_key) or ())
+            dependencies = set(dependencies) if dependencies is not REMOVED else set()
+            for dependency in saved_dependencies.symmetric_difference(dependencies):
+                if dependency not in dependents:
+                    dependents[dependency] = set(self._get(DEPENDENTS, dependency) or ())
+                if dependency in dependencies:
+                    dependents[dependency].add(test_key)
+                else:
+                    dependents[dependency].discard(test_key)
+        for dependency, dependent_tests in dependents.items():
+            self._changes[DEPENDENTS][dependency] = sorted(dependent_tests) if dependent_tests else REMOVED
+
+    def _get_changed_dependencies(self, test_key):
+        dependencies = self._changes[DEPENDENCIES].get(test_key)
+        if dependencies is None or dependencies is REMOVED:
+            dependencies = set(self._storage.get(DEPENDENCIES, test_key) or ()) if dependencies is None else set()
+            self._changes[DEPENDENCIES][test_key] = dependencies
+        return dependencies
+
     @staticmethod
     def get_test_key(test_file_path, test_name):
         """
@@ -0,0 +1,862 @@
+import re
+import sys
+import time
+import types
+import pathlib
+import inspect
+import hashlib
+import array
+import functools
+import concurrent.futures
+
+import pytest
+from _pytest.fixtures import resolve_fixture_function
+
+from .config import EkstaziConfiguration, TestOutcome, MODULE_UNIT_NAME
+from .storage import DEPENDENCIES, DEPENDENCIES_HASHES, TEST_HASHES, TEST_RESULTS, TEST_DURATIONS
+from .utils import hash_file_dependencies, split_dependency, dependency_hash, file_stat, is_trusted_stat, source_hash, \
+    code_fingerprint, DEFAULT_HASH_ALGORITHM, HASH_ALGORITHMS
+from .collector import create_dependency_collector
+from .profile import Profiler
+from .plugin import FUNCTION_GRANULARITY, FILE_DEPENDENCY_GRANULARITY, FUNCTION_DEPENDENCY_GRANULARITY
+
+SITE_PACKAGES_PATH = str(pathlib.Path(pytest.__file__).parent.parent)
+
+# the bytecode of the saved fingerprints depends on the Python implementation and version
+PYTHON_TAG = sys.implementation.cache_tag
+
+# memory addresses and mock ids in the representation of the parameters and of the marks change in every session
+MEMORY_ADDRESS = re.compile(r" at 0x[0-9a-fA-F]+| id='\d+'")
+# attributes of the wrappers whose representation is used as is, instead of the representation of their attributes
+FUNCTION_TYPES = (type, types.FunctionType, types.MethodType, types.BuiltinFunctionType)
+
+# counters of the selection, which every xdist worker counts over the whole collection
+SELECTION_COUNTERS = ['tests_selected', 'tests_deselected', 'tests_xfailed', 'tests_deferred']
+
+# the outcome of a test function is the most severe outcome of its parametrized tests
+OUTCOMES_SEVERITY = [TestOutcome.PASSED, TestOutcome.SKIPPED, TestOutcome.FAILED, TestOutcome.ERROR]
+
+
+class EkstaziPytestPlugin:
+    # ignorable modules dirs (Python internal modules)
+    _ignore_dirs = [sys.prefix, sys.exec_prefix, SITE_PACKAGES_PATH]
+
+    def __init__(self, configuration, rootdir, select_tests=True, ignore_modules=False, granularity=FUNCTION_GRANULARITY,
+                 dependency_granularity=FILE_DEPENDENCY_GRANULARITY, trust_mtime=True, hash_workers=None,
+                 hash_algorithm=DEFAULT_HASH_ALGORITHM, affected_tests=None, changed_files=None, normalize=False,
+                 track_reads=False, reorder=False, budget=None, profiler=None, profile_path=None):
+        """
+        Create instance of Ekstazi Pytest plugin
+
+        :param configuration EkstaziConfiguration object
+        :param rootdir Pytest root dir
+        :param select_tests Enable test selection phase
+        :param ignore_modules Do not collect test modules whose tests are all unaffected and have passed
+        :param granularity Unit of the tests whose dependencies are collected and selected together
+        :param dependency_granularity Collect dependency files or the functions and classes of the dependency files
+        :param trust_mtime Do not read the files whose stat signature is the same of when their saved hash was calculated
+        :param hash_workers Number of threads hashing the files (0 hashes the files in the main thread).
+                            By default the number of threads of concurrent.futures.ThreadPoolExecutor.
+        :param hash_algorithm Algorithm of the dependency and test file hashes
+        :param affected_tests Keys of the tests affected by the changed dependencies, when they have been
+                              found by the xdist controller
+        :param changed_files Absolute paths of the files changed since the last execution, given by a change source.
+                             The other files are not read, their saved hashes are used.
+        :param normalize Hash the normalized AST of the Python files and of the test and fixture functions,
+                         ignoring comments, docstrings and formatting
+        :param track_reads Collect the non-Python files under the root directory read by the tests as dependencies
+        :param reorder Run first the tests that have failed in the last execution, then the tests whose code has changed
+                       and then the tests affected by their dependencies, the fastest tests first
+        :param budget Time in seconds for the selected tests, by their durations in the last executions. The affected
+                      tests are picked in the order of reorder, the other ones are deferred to the next executions.
+        :param profiler Profiler recording the timers and counters of the phases of the plugin
+        :param profile_path Location of a JSON file where the profile is written at the end of the session
+        """
+        self._test_dependencies = dict()
+        self._test_results = dict()
+        self._test_keys = dict()
+        self._unit_keys = dict()
+        self._units = dict()
+        self._traced_items = dict()
+        # dependencies of the units whose tests have finished, as sorted IDs of the interned dependency names
+        self._finished_units = dict()
+        self._dependency_ids = dict()
+        self._dependency_names = []
+        # dependencies collected in the setup and teardown of the current instance of each fixture, shared by
+        # reference with the units of the tests that use the instance
+        self._fixture_dependencies = dict()
+        self._unit_fixture_dependencies = dict()
+        self._test_files = dict()
+        self._xfail_items = set()
+        # durations of the tests in this session by node ID, setup and teardown included
+        self._test_durations = dict()
+        self._affected_tests = affected_tests
+        # data of the session (and of the xdist workers) saved at its end
+        self._session_data = {'units': dict(), 'results': dict(), 'test_files': dict(), 'test_hashes': dict(),
+                              'durations': dict(), 'deferred': set(), 'deferred_items': set(), 'fingerprints': dict()}
+        self._configuration = configuration
+        self._rootdir = rootdir
+        self._select_tests = select_tests
+        self._ignore_modules = ignore_modules
+        self._granularity = granularity
+        self._trust_mtime = trust_mtime
+        self._hash_algorithm = hash_algorithm
+        self._changed_files = changed_files
+        self._reorder = reorder
+        self._budget = budget
+        self._profiler = profiler if profiler is not None else Profiler(enabled=False)
+        self._profile_path = profile_path
+        self._deferred_tests = set()
+        self._deferred_items = set()
+        self._normalize = normalize
+        self._saved_normalize = configuration.get_hash_normalization()
+        # normalized hashes of the Python files, cached by their raw content hash between sessions
+        self._normalized_hashes = configuration.get_normalized_hashes() if normalize else None
+        # unaffected units whose test hash is saved again after the normalization mode has changed
+        self._converted_units = set()
+        # every file content read in the session is read after this time
+        self._session_timestamp = time.time_ns()
+        function_dependencies = dependency_granularity == FUNCTION_DEPENDENCY_GRANULARITY
+        read_dirs = [rootdir] if track_reads else None
+        self._collector = create_dependency_collector(EkstaziPytestPlugin._ignore_dirs, function_dependencies, read_dirs)
+
+        # caching the hashes of the files to avoid re-calculate them for every test
+        self._dependencies_hashes = dict()
+        self._function_hashes = dict()
+        self._test_hashes = dict()
+        # fingerprints of the code objects, and the ones of the functions of each file saved with the file hash
+        self._code_fingerprints = dict()
+        self._file_fingerprints = dict()
+        # stat signatures of the files taken before their content is read
+        self._file_stats = dict()
+        # the files are hashed in a thread pool (hashlib releases the GIL) before their hashes are needed
+        self._hash_executor = concurrent.futures.ThreadPoolExecutor(hash_workers) if hash_workers != 0 else None
+        self._hash_futures = dict()
+
+    @pytest.hookimpl(tryfirst=True)
+    def pytest_sessionstart(self, session):
+        if self._affected_tests is not None:
+            # xdist worker: the dependencies have already been hashed by the controller
+            return
+        saved_hash_algorithm = self._configuration.get_hash_algorithm()
+        if saved_hash_algorithm not in HASH_ALGORITHMS:
+            # e.g. a xxHash algorithm without xxhash installed, the saved hashes can not be checked
+            session.config.issue_config_time_warning(pytest.PytestWarning(
+                'The hash algorithm "{}" of the configuration file is not available, the test cases whose '
+                'dependencies can not be checked are selected'.format(saved_hash_algorithm)), stacklevel=2)
+            saved_hash_algorithm = None
+        if saved_hash_algorithm != self._hash_algorithm or self._saved_normalize != self._normalize:
+            with self._profiler.timer('hash_conversion'):
+                self._convert_hashes(saved_hash_algorithm, self._saved_normalize)
+            self._configuration.set_hash_algorithm(self._hash_algorithm)
+            self._configuration.set_hash_normalization(self._normalize)
+        if not self._select_tests:
+            return
+        # hash every dependency, test file and fixture file known from the last executions
+        dependencies = self._configuration.get_dependency_files()
+        for test_location, test_file in self._configuration.get_test_files().items():
+            test_file_path = str(pathlib.Path(self._rootdir) / test_location)
+            dependencies[test_file_path] = dependencies.get(test_file_path, []) + [(test_file['hash'], test_file.get('stat'))]
+            for fixture_file in test_file['fixture_files']:
+                dependencies.setdefault(fixture_file, [])
+        if self._changed_files is not None:
+            # only the changed files are read, the saved hashes of the other files are used
+            dependencies = {d: h for d, h in dependencies.items() if split_dependency(d)[0] in self._changed_files}
+        with self._profiler.timer('prefetch'):
+            self._prefetch_hashes({d: h if self._trust_mtime else [] for d, h in dependencies.items()})
+
+    def pytest_ignore_collect(self, collection_path, config):
+        if not self._select_tests or not self._ignore_modules or not collection_path.is_file():
+            return None
+        try:
+            rel_test_location = self._get_relative_file_path(collection_path)
+        except ValueError:
+            return None
+
+        # the module can be ignored only if its content, the files of its fixtures and the dependencies of all
+        # its tests are the same and all of its tests have passed in the last execution
+        test_names = self._configuration.get_test_file_tests(rel_test_location)
+        test_file_hash = self._configuration.get_test_file_hash(rel_test_location)
+        if not test_names or self._get_file_hash(collection_path, test_file_hash,
+                                                 self._configuration.get_test_file_stat(rel_test_location)) != test_file_hash:
+            return None
+        fixture_files = self._configuration.get_test_file_fixture_files(rel_test_location)
+        if any(self._get_file_hash(f) != fixture_file_hash for f, fixture_file_hash in fixture_files.items()):
+            return None
+        affected_tests = self._get_affected_tests()
+        for unit_name in self._configuration.get_test_file_units(rel_test_location):
+            unit_key = EkstaziConfiguration.get_test_key(rel_test_location, unit_name)
+            if unit_key in affected_tests or self._configuration.get_test_dependencies(rel_test_location, unit_name) is None:
+                return None
+        if any(self._configuration.get_last_test_result(rel_test_location, t) != TestOutcome.PASSED for t in test_names):
+            return None
+        if any(self._configuration.is_test_pending(rel_test_location, t) for t in test_names):
+            return None
+        return True
+
+    @pytest.hookimpl(tryfirst=True)
+    def pytest_collection_modifyitems(self, session, config, items):
+        collected_items = len(items)
+        with self._profiler.timer('selection'):
+            self._select_items(config, items)
+        self._profiler.count('tests_selected', len(items))
+        self._profiler.count('tests_deselected', collected_items - len(items))
+        self._profiler.count('tests_xfailed', len(self._xfail_items))
+        self._profiler.count('tests_deferred', len(self._deferred_items))
+
+    def _select_items(self, config, items):
+        # compute relative locations and test keys once for all collected tests,
+        # before other plugins deselect items, so every test of a module is recorded in its test file entry
+        for item in items:
+            if not isinstance(item, pytest.Function):
+                continue
+            if item.fspath not in self._test_files:
+                rel_test_location = self._get_relative_file_path(item.fspath)
+                self._test_files[item.fspath] = {'location': rel_test_location, 'tests': set(), 'units': set(),
+                                                 'qualnames': dict(),
+                                                 'fixture_files': self._get_conftest_files(item.fspath)}
+            test_file = self._test_files[item.fspath]
+            unit_name = self._get_unit_name(item)
+            test_file['tests'].add(item.originalname)
+            test_file['units'].add(unit_name)
+            if item.cls is not None:
+                # the test name does not include its classes, which are part of the node ID
+                qualname = '{}.{}'.format(item.cls.__qualname__, item.originalname)
+                test_file['qualnames'].setdefault(item.originalname, set()).add(qualname)
+            test_file['fixture_files'].update(self._get_fixture_files(item))
+            self._test_keys[item] = EkstaziConfiguration.get_test_key(test_file['location'], item.originalname)
+            self._unit_keys[item] = EkstaziConfiguration.get_test_key(test_file['location'], unit_name)
+            self._units.setdefault(self._unit_keys[item], []).append(item)
+
+        if not self._select_tests:
+            if self._reorder:
+                items[:] = self._get_ordered_items(items)
+            return None
+
+        # if the test dependencies has been already identified and all dependencies are the same (or the test does not have any dependency)
+        # and its test file is the same the test is deselected.
+        # when the last test execution has resulted in fail, the test is marked to be reported as xfail
+        unaffected_units = {unit_key for unit_key in self._units if self._is_unaffected_unit(unit_key)}
+        selected_items = []
+        deselected_items = []
+        for item in items:
+            if self._unit_keys.get(item) not in unaffected_units or \
+                    self._configuration.is_test_pending(*EkstaziConfiguration.extract_test_from_key(self._test_keys[item])):
+                selected_items.append(item)
+                continue
+            test_result = self._configuration.get_last_test_result(*EkstaziConfiguration.extract_test_from_key(self._test_keys[item]))
+            if test_result == TestOutcome.PASSED:
+                deselected_items.append(item)
+            else:
+                if test_result in (TestOutcome.ERROR, TestOutcome.FAILED):
+                    self._xfail_items.add(item)
+                selected_items.append(item)
+
+        if self._budget is not None:
+            selected_items, deferred_items = self._get_budgeted_items(selected_items)
+            self._deferred_tests.update(self._test_keys[item] for item in deferred_items)
+            self._deferred_items.update(item.nodeid for item in deferred_items)
+            deselected_items += deferred_items
+        if deselected_items:
+            config.hook.pytest_deselected(items=deselected_items)
+            items[:] = selected_items
+        if self._reorder:
+            items[:] = self._get_ordered_items(items)
+
+    @staticmethod
+    def _get_mean_duration(durations):
+        # each parametrized test of a test function is charged the mean duration of the ones that have run
+        return round(sum(durations.values()) / len(durations), 6)
+
+    def _get_ordered_items(self, items):
+        return sorted(items, key=self._get_item_priority)
+
+    def _get_budgeted_items(self, items):
+        # the tests are picked by priority while they fit in the budget. The tests reported as xfail do not run,
+        # and the first test is always picked, so a test longer than the budget is not deferred forever
+        budget = self._budget
+        picked_items = set()
+        for item in self._get_ordered_items(items):
+            duration = self._get_item_priority(item)[1]
+            if item in self._xfail_items:
+                picked_items.add(item)
+            elif not picked_items or duration <= budget:
+                picked_items.add(item)
+                budget -= duration
+        return [item for item in items if item in picked_items], [item for item in items if item not in picked_items]
+
+    def _get_item_priority(self, item):
+        # the tests that have failed run first, then the tests whose code has changed and then the tests affected
+        # only by their dependencies. The tests reported as xfail run last. The fastest tests of each group run first
+        test_key = self._test_keys.get(item)
+        if test_key is None:
+            return 4, 0
+        test_location, test_name = EkstaziConfiguration.extract_test_from_key(test_key)
+        duration = self._configuration.get_test_duration(test_location, test_name) or 0
+        if item in self._xfail_items:
+            return 3, duration
+        if self._configuration.get_last_test_result(test_location, test_name) in (TestOutcome.FAILED, TestOutcome.ERROR):
+            return 0, duration
+        unit_key = self._unit_keys[item]
+        saved_hash = self._configuration.get_test_hash(*EkstaziConfiguration.extract_test_from_key(unit_key))
+        if self._get_unit_hash(unit_key, self._saved_normalize) != saved_hash:
+            return 1, duration
+        return 2, duration
+
+    def pytest_runtest_setup(self, item):
+        if item in self._xfail_items:
+            raise pytest.xfail.Exception('The test has failed in the last execution and its dependencies have not changed')
+
+    @pytest.hookimpl(hookwrapper=True)
+    def pytest_pyfunc_call(self, pyfuncitem):
+        test_function = pyfuncitem.obj
+        unit_key = self._unit_keys.get(pyfuncitem)
+        if unit_key is None:
+            yield
+            return
+        # the tests of a unit share the same dependency set, so the collector keeps its state between them
+        dependencies = self._test_dependencies.setdefault(unit_key, set())
+        self._traced_items.setdefault(unit_key, set()).add(pyfuncitem.nodeid)
+        ignored_names = tuple({item.originalname for item in self._units[unit_key]})
+        collector = self._collector
+        profiler = self._profiler
+        # the fixtures are already set up, so their current instances are the ones used by the test
+        unit_fixture_dependencies = self._unit_fixture_dependencies.setdefault(unit_key, dict())
+        for fixture_name in pyfuncitem.fixturenames:
+            fixture_defs = pyfuncitem._fixtureinfo.name2fixturedefs.get(fixture_name)
+            fixture_dependencies = self._fixture_dependencies.get(fixture_defs[-1]) if fixture_defs else None
+            if fixture_dependencies is not None:
+                unit_fixture_dependencies[id(fixture_dependencies)] = fixture_dependencies
+
+        @functools.wraps(test_function)
+        def tracer_wrapper(*args, **kwargs):
+            # the test functions themselves are not dependencies
+            with profiler.timer('traced_calls'), collector.collect(dependencies, ignored_names=ignored_names):
+                test_function(*args, **kwargs)
+
+        pyfuncitem.obj = tracer_wrapper
+        yield
+        # the wrapper is released with the dependency set it references
+        pyfuncitem.obj = test_function
+
+    @pytest.hookimpl(hookwrapper=True)
+    def pytest_runtest_protocol(self, item, nextitem):
+        yield
+        # the dependencies of a unit are reduced to IDs once its tests have run (and their fixtures torn down)
+        unit_key = self._unit_keys.get(item)
+        if unit_key in self._test_dependencies and (nextitem is None or self._unit_keys.get(nextitem) != unit_key):
+            self._finish_unit(unit_key)
+
+    @pytest.hookimpl(hookwrapper=True)
+    def pytest_fixture_setup(self, fixturedef, request):
+        fixture_function = fixturedef.func
+        fixture_code = getattr(fixture_function, '__code__', None)
+        if fixture_code is None or not self._collector.is_dependency_file(fixture_code.co_filename) or \
+                inspect.iscoroutinefunction(fixture_function) or inspect.isasyncgenfunction(fixture_function):
+            # fixtures of pytest and of the installed packages have no dependencies
+            yield
+            return
+        # each fixture instance is traced once, a session fixture is set up once for all tests
+        dependencies = set()
+        self._fixture_dependencies[fixturedef] = dependencies
+        # only the fixture function is traced, not the code of pytest calling it. The function is bound to the
+        # test class instance as pytest would do, as the wrapper is not a method
+        fixturedef.func = self._get_traced_fixture_function(resolve_fixture_function(fixturedef, request),
+                                                            fixture_code.co_name, dependencies)
+        try:
+            yield
+        finally:
+            fixturedef.func = fixture_function
+
+    def _get_traced_fixture_function(self, fixture_function, fixture_name, dependencies):
+        collector = self._collector
+        profiler = self._profiler
+        ignored_names = (fixture_name,)
+        if inspect.isgeneratorfunction(fixture_function):
+            # the teardown code of the fixture runs when pytest resumes the generator after the tests
+            @functools.wraps(fixture_function)
+            def traced_generator_fixture(*args, **kwargs):
+                generator = fixture_function(*args, **kwargs)
+                while True:
+                    with profiler.timer('traced_fixtures'), collector.collect(dependencies, ignored_names=ignored_names):
+                        try:
+                            value = next(generator)
+                        except StopIteration:
+                            return
+                    yield value
+
+            return traced_generator_fixture
+
+        @functools.wraps(fixture_function)
+        def traced_fixture(*args, **kwargs):
+            with profiler.timer('traced_fixtures'), collector.collect(dependencies, ignored_names=ignored_names):
+                return fixture_function(*args, **kwargs)
+
+        return traced_fixture
+
+    @pytest.hookimpl(tryfirst=True, hookwrapper=True)
+    def pytest_runtest_makereport(self, item, call):
+        outcome = yield
+        result = outcome.get_result()
+
+        test_key = self._test_keys.get(item)
+        if test_key is not None and item not in self._xfail_items:
+            durations = self._test_durations.setdefault(test_key, dict())
+            durations[item.nodeid] = durations.get(item.nodeid, 0) + result.duration
+        if result.when == 'setup' and result.outcome == 'failed':
+            test_outcome = TestOutcome.ERROR
+        elif result.when == 'call' and result.outcome == 'failed':
+            test_outcome = TestOutcome.FAILED
+        elif result.when == 'call' and result.outcome == 'passed':
+            test_outcome = TestOutcome.PASSED
+        elif result.when == 'call' and result.outcome == 'skipped':
+            test_outcome = TestOutcome.SKIPPED
+        else:
+            return
+        # the results are kept by test key, so the items are not referenced after they have run.
+        # the worst outcome of the parametrized tests is kept
+        test_key = self._test_keys.get(item, EkstaziConfiguration.get_test_key(item.fspath, item.originalname))
+        self._test_results[test_key] = self._get_worst_outcome(test_outcome, self._test_results.get(test_key))
+
+    def pytest_terminal_summary(self, terminalreporter):
+        if hasattr(terminalreporter.config, 'workerinput'):
+            return
+        if self._budget is not None:
+            terminalreporter.write_line('ekstazi: {} affected test cases deferred by the time budget of {}s'.format(
+                len(self._session_data['deferred_items']), self._budget))
+        if self._profiler.enabled:
+            terminalreporter.write_sep('-', 'ekstazi profile')
+            for line in self._profiler.get_summary_lines():
+                terminalreporter.write_line(line)
+
+    @pytest.hookimpl(optionalhook=True)
+    def pytest_configure_node(self, node):
+        # xdist workers select the tests with the changed dependencies found once by the controller
+        affected_tests = self._get_affected_tests() if self._select_tests else ()
+        node.workerinput['ekstazi_affected_tests'] = sorted(affected_tests)
+        if self._changed_files is not None:
+            node.workerinput['ekstazi_changed_files'] = sorted(self._changed_files)
+
+    @pytest.hookimpl(optionalhook=True)
+    def pytest_testnodedown(self, node, error):
+        workeroutput = getattr(node, 'workeroutput', dict())
+        if workeroutput.get('ekstazi') is not None:
+            self._merge_session_data(workeroutput['ekstazi'])
+        if workeroutput.get('ekstazi_profile') is not None:
+            self._profiler.merge(workeroutput['ekstazi_profile'], SELECTION_COUNTERS)
+
+    def pytest_sessionfinish(self, session, exitstatus):
+        with self._profiler.timer('session_data'):
+            session_data = self._get_session_data()
+        self._profiler.count('traced_events', self._collector.events)
+        workeroutput = getattr(session.config, 'workeroutput', None)
+        if workeroutput is not None:
+            # xdist worker: the controller saves the data of all workers at once
+            workeroutput['ekstazi'] = session_data
+            if self._profiler.enabled:
+                workeroutput['ekstazi_profile'] = self._profiler.as_dict()
+        else:
+            self._merge_session_data(session_data)
+            with self._profiler.timer('save'):
+                self._save_session_data()
+            if self._profile_path:
+                self._profiler.dump(self._profile_path)
+        if self._hash_executor is not None:
+            for future in self._hash_futures.values():
+                future.cancel()
+            self._hash_executor.shutdown()
+
+    def _get_session_data(self):
+        # dependencies, results and test files of the session, serializable to be sent by xdist workers
+        for unit_key in list(self._test_dependencies):
+            self._finish_unit(unit_key)
+        units = dict()
+        for unit_key, unit in self._finished_units.items():
+            # Python internal calls and the test itself were already filtered out by the collector.
+            # the fixture sets are read now, the teardown of the session fixtures runs after the tests
+            dependencies = self._get_unit_dependencies(unit)
+            units[unit_key] = {'dependencies': sorted(dependencies), 'hash': unit['hash'],
+                               'traced': len(self._traced_items[unit_key]), 'tests': len(self._units[unit_key])}
+        test_results = {test_key: outcome.value for test_key, outcome in self._test_results.items()}
+        test_files = dict()
+        for test_file_path, test_file in self._test_files.items():
+            fixture_files = {str(f): self._get_file_hash(f) for f in sorted(test_file['fixture_files'])}
+            test_file_hash = self._get_file_hash(test_file_path)
+            # the stat of the test file was taken before its content was read, after the session has started
+            test_file_stat = self._file_stats.get(str(test_file_path))
+            if test_file_stat is not None:
+                test_file_stat = test_file_stat + [self._session_timestamp]
+            test_files[str(test_file['location'])] = {'hash': test_file_hash, 'tests': sorted(test_file['tests']),
+                                                      'units': sorted(test_file['units']), 'fixture_files': fixture_files,
+                                                      'stat': test_file_stat,
+                                                      'qualnames': {name: sorted(qualnames) for name, qualnames
+                                                                    in test_file['qualnames'].items()}}
+        test_hashes = {unit_key: self._get_unit_hash(unit_key) for unit_key in self._converted_units}
+        fingerprints = {file_path: list(entry) for file_path, entry in self._file_fingerprints.items() if entry is not None}
+        return {'units': units, 'results': test_results, 'test_files': test_files,
+                'test_hashes': test_hashes, 'durations': self._test_durations, 'deferred': sorted(self._deferred_tests),
+                'deferred_items': sorted(self._deferred_items),
+                'fingerprints': fingerprints}
+
+    def _merge_session_data(self, session_data):
+        # the tests of a unit may run in different xdist workers
+        for unit_key, unit in session_data['units'].items():
+            merged_unit = self._session_data['units'].setdefault(unit_key, dict(unit, dependencies=set(), traced=0))
+            merged_unit['dependencies'].update(unit['dependencies'])
+            merged_unit['traced'] += unit['traced']
+        for test_key, outcome in session_data['results'].items():
+            self._session_data['results'][test_key] = self._get_worst_outcome(TestOutcome(outcome),
+                                                                              self._session_data['results'].get(test_key))
+        self._session_data['test_files'].update(session_data['test_files'])
+        self._session_data['test_hashes'].update(session_data['test_hashes'])
+        for test_key, durations in session_data['durations'].items():
+            self._session_data['durations'].setdefault(test_key, dict()).update(durations)
+        # the xdist workers defer the same tests
+        self._session_data['deferred'].update(session_data['deferred'])
+        self._session_data['deferred_items'].update(session_data['deferred_items'])
+        for file_path, (file_hash, fingerprints) in session_data['fingerprints'].items():
+            merged_entry = self._session_data['fingerprints'].setdefault(file_path, (file_hash, dict()))
+            merged_entry[1].update(fingerprints)
+
+    def _save_session_data(self):
+        for unit_key, test_hash in self._session_data['test_hashes'].items():
+            self._configuration.add_test_hash(*EkstaziConfiguration.extract_test_from_key(unit_key), test_hash)
+        # save test and test dependencies hashes
+        dependency_files = set()
+        for unit_key, unit in self._session_data['units'].items():
+            test_location, unit_name = EkstaziConfiguration.extract_test_from_key(unit_key)
+            dependencies = unit['dependencies']
+            if unit['traced'] < unit['tests']:
+                # the dependencies of the tests of the unit that have not run are still valid
+                dependencies = dependencies.union(self._configuration.get_test_dependencies(test_location, unit_name) or ())
+            self._configuration.remove_dependencies(test_location, unit_name)
+            self._configuration.add_test_hash(test_location, unit_name, unit['hash'])
+            self._configuration.set_test_dependencies_entry(test_location, unit_name)
+            for filepath in sorted(dependencies):
+                self._configuration.add_test_dependency(test_location, unit_name, filepath)
+            dependency_files.update(dependencies)
+        self._save_dependencies_hashes(dependency_files)
+        # save test results
+        for test_key, outcome in self._session_data['results'].items():
+            self._configuration.set_test_result(*EkstaziConfiguration.extract_test_from_key(test_key), outcome)
+        for test_key, durations in self._session_data['durations'].items():
+            self._configuration.set_test_duration(*EkstaziConfiguration.extract_test_from_key(test_key),
+                                                  self._get_mean_duration(durations))
+        # the deferred tests stay pending until they run
+        for test_key in self._session_data['results']:
+            if test_key not in self._session_data['deferred']:
+                self._configuration.set_test_pending(*EkstaziConfiguration.extract_test_from_key(test_key), False)
+        for test_key in self._session_data['deferred']:
+            self._configuration.set_test_pending(*EkstaziConfiguration.extract_test_from_key(test_key))
+        # save the test files, so unaffected modules can be ignored in the next executions without importing them
+        for test_location, test_file in self._session_data['test_files'].items():
+            self._configuration.set_test_file(test_location, test_file['hash'], test_file['tests'], test_file['fixture_files'],
+                                              test_file['units'], test_file['stat'], test_file['qualnames'])
+        for file_path, hashes in (self._normalized_hashes or dict()).items():
+            self._configuration.set_normalized_hashes(file_path, hashes)
+        for file_path, (file_hash, fingerprints) in self._session_data['fingerprints'].items():
+            self._configuration.set_function_fingerprints(file_path, file_hash, PYTHON_TAG, fingerprints)
+        self._configuration.save()
+
+    @staticmethod
+    def _get_worst_outcome(outcome, other_outcome):
+        if other_outcome is not None and OUTCOMES_SEVERITY.index(other_outcome) > OUTCOMES_SEVERITY.index(outcome):
+            return other_outcome
+        return outcome
+
+    def _finish_unit(self, unit_key):
+        dependencies = self._test_dependencies.pop(unit_key)
+        fixture_dependencies = self._unit_fixture_dependencies.pop(unit_key, dict())
+        unit = self._finished_units.get(unit_key)
+        if unit is None:
+            # the hash is computed while the test functions are still loaded
+            unit = {'dependencies': (), 'fixture_dependencies': dict(), 'hash': self._get_unit_hash(unit_key)}
+            self._finished_units[unit_key] = unit
+        dependency_ids = set(unit['dependencies'])
+        for dependency in dependencies:
+            dependency_id = self._dependency_ids.get(dependency)
+            if dependency_id is None:
+                dependency_id = self._dependency_ids[dependency] = len(self._dependency_names)
+                self._dependency_names.append(dependency)
+            dependency_ids.add(dependency_id)
+        unit['dependencies'] = array.array('L', sorted(dependency_ids))
+        # the dependency sets of the fixtures are shared by the units using the same fixture instance
+        unit['fixture_dependencies'].update(fixture_dependencies)
+        with self._profiler.timer('journal'):
+            self._journal_unit(unit_key, unit)
+
+    def _journal_unit(self, unit_key, unit):
+        # the unit is written to the journal as it would be saved at the end of the session,
+        # so the next session keeps it if this one is interrupted
+        dependencies = self._get_unit_dependencies(unit)
+        if len(self._traced_items[unit_key]) < len(self._units[unit_key]):
+            test_location, unit_name = EkstaziConfiguration.extract_test_from_key(unit_key)
+            dependencies.update(self._configuration.get_test_dependencies(test_location, unit_name) or ())
+        test_keys = {self._test_keys[item] for item in self._units[unit_key]}
+        self._configuration.append_journal({
+            DEPENDENCIES: {unit_key: sorted(dependencies)},
+            TEST_HASHES: {unit_key: unit['hash']},
+            DEPENDENCIES_HASHES: {dependency: self._get_dependency_hash(dependency) for dependency in sorted(dependencies)},
+            TEST_RESULTS: {test_key: self._test_results[test_key].value for test_key in test_keys
+                           if test_key in self._test_results},
+            TEST_DURATIONS: {test_key: self._get_mean_duration(self._test_durations[test_key]) for test_key in test_keys
+                             if test_key in self._test_durations}
+        })
+
+    def _get_unit_dependencies(self, unit):
+        dependencies = {self._dependency_names[d] for d in unit['dependencies']}
+        return dependencies.union(*unit['fixture_dependencies'].values())
+
+    def _is_unaffected_unit(self, unit_key):
+        if unit_key in self._get_affected_tests():
+            return False
+        if self._configuration.get_test_dependencies(*EkstaziConfiguration.extract_test_from_key(unit_key)) is None:
+            return False
+        # the test hashes are compared in the normalization mode they were saved
+        saved_hash = self._configuration.get_test_hash(*EkstaziConfiguration.extract_test_from_key(unit_key))
+        if self._get_unit_hash(unit_key, self._saved_normalize) != saved_hash:
+            return False
+        if self._saved_normalize != self._normalize:
+            self._converted_units.add(unit_key)
+        return True
+
+    def _get_affected_tests(self):
+        # the changed dependencies are found once, and the tests that depend on them through the reverse index
+        if self._affected_tests is None:
+            changed_dependencies = [dependency for dependency, saved_hash in self._configuration.get_dependencies_hashes().items()
+                                    if self._get_dependency_hash(dependency) != saved_hash]
+            self._affected_tests = self._configuration.get_affected_tests(changed_dependencies)
+        return self._affected_tests
+
+    def _get_unit_name(self, item):
+        if self._granularity == FUNCTION_GRANULARITY:
+            return item.originalname
+        return item.cls.__qualname__ if item.cls is not None else MODULE_UNIT_NAME
+
+    def _get_unit_hash(self, unit_key, normalize=None):
+        normalize = self._normalize if normalize is None else normalize
+        if (unit_key, normalize) not in self._test_hashes:
+            with self._profiler.timer('test_hashes'):
+                hashes = sorted({self._get_pyfuncitem_hash(item, normalize) for item in self._units[unit_key]})
+            # a unit with a single test function has the hash of the function
+            unit_hash = hashes[0] if len(hashes) == 1 else hashlib.sha1('\n'.join(hashes).encode()).hexdigest()
+            self._test_hashes[(unit_key, normalize)] = unit_hash
+        return self._test_hashes[(unit_key, normalize)]
+
+    def _get_relative_file_path(self, file_path):
+        return pathlib.Path(file_path).relative_to(self._rootdir)
+
+    def _get_file_hash(self, file_path, saved_hash=None, saved_stat=None):
+        file_path = str(file_path)
+        if file_path not in self._dependencies_hashes and file_path not in self._hash_futures:
+            unchanged_hash = self._get_unchanged_hash(file_path, saved_hash)
+            if unchanged_hash is not None:
+                self._profiler.count('unchanged_file_hits')
+                self._dependencies_hashes[file_path] = unchanged_hash
+            else:
+                self._hash_dependencies({file_path: self._get_known_hashes(file_path, saved_hash, saved_stat)})
+        return self._get_dependency_hash(file_path)
+
+    def _get_dependency_hash(self, dependency):
+        if dependency not in self._dependencies_hashes:
+            future = self._hash_futures.pop(dependency, None)
+            unchanged_hash = self._get_unchanged_hash(dependency) if future is None else None
+            if future is not None:
+                file_path, _ = split_dependency(dependency)
+                stat_signature, hashes = future.result()
+                self._file_stats.setdefault(file_path, stat_signature)
+                self._dependencies_hashes.update((d, h) for d, h in hashes.items() if d not in self._dependencies_hashes)
+            elif unchanged_hash is not None:
+                self._profiler.count('unchanged_file_hits')
+                self._dependencies_hashes[dependency] = unchanged_hash
+            else:
+                # a removed file or function has no hash, so it is always different from the saved one
+                self._hash_dependencies({dependency: self._get_known_hashes(dependency)})
+        return self._dependencies_hashes[dependency]
+
+    def _get_unchanged_hash(self, dependency, saved_hash=None):
+        # the saved hash of a file that has not changed according to the change source is used without reading the file
+        if self._changed_files is None or split_dependency(dependency)[0] in self._changed_files:
+            return None
+        return saved_hash if saved_hash is not None else self._configuration.get_dependency_hash(dependency)
+
+    def _get_known_hashes(self, dependency, saved_hash=None, saved_stat=None):
+        # hashes that can be used without reading the file while its stat signature is the same
+        if not self._trust_mtime:
+            return []
+        known_hashes = [(self._configuration.get_dependency_hash(dependency), self._configuration.get_file_stat(dependency))]
+        if saved_hash is not None:
+            known_hashes.append((saved_hash, saved_stat))
+        return known_hashes
+
+    def _group_by_file(self, dependencies):
+        files = dict()
+        for dependency, known_hashes in dependencies.items():
+            file_path, _ = split_dependency(dependency)
+            files.setdefault(file_path, dict())[dependency] = known_hashes
+        return files
+
+    def _prefetch_hashes(self, dependencies):
+        if self._hash_executor is None:
+            return
+        dependencies = {d: h for d, h in dependencies.items() if d not in self._dependencies_hashes and d not in self._hash_futures}
+        for file_path, file_dependencies in self._group_by_file(dependencies).items():
+            future = self._hash_executor.submit(self._hash_file, file_path, file_dependencies)
+            self._hash_futures.update((dependency, future) for dependency in file_dependencies)
+
+    def _hash_dependencies(self, dependencies):
+        for file_path, file_dependencies in self._group_by_file(dependencies).items():
+            # the stat of the file is taken before its content is read for the first time in the session
+            stat_signature, hashes = self._hash_file(file_path, file_dependencies, self._function_hashes)
+            self._file_stats.setdefault(file_path, stat_signature)
+            self._dependencies_hashes.update(hashes)
+
+    def _hash_file(self, file_path, dependencies, hashes_cache=None):
+        with self._profiler.timer('hashing'):
+            stat_signature, hashes = hash_file_dependencies(file_path, dependencies, hashes_cache, self._hash_algorithm,
+                                                            self._normalized_hashes)
+        if self._profiler.enabled:
+            # the file is not read when the known hashes of all its dependencies have been trusted by its stat
+            if all(any(h is not None and is_trusted_stat(stat_signature, s) for h, s in known_hashes)
+                   for known_hashes in dependencies.values()):
+                self._profiler.count('stat_cache_hits')
+            else:
+                self._profiler.count('files_hashed')
+                self._profiler.count('bytes_read', stat_signature[1] if stat_signature is not None else 0)
+        return stat_signature, hashes
+
+    def _convert_hashes(self, saved_hash_algorithm, saved_normalize):
+        # the saved hashes are replaced by the hashes of the current algorithm and normalization mode, so the tests
+        # are not selected just because they have changed. The files that have changed since their hash was saved
+        # get no hash, so the tests that depend on them are still selected. Without the saved algorithm (None),
+        # only the files whose stat signature is trusted keep their hash
+        saved_hashes_cache = dict()
+        hashes_cache = dict()
+        saved_normalized_hashes = dict() if saved_normalize else None
+
+        def convert_hash(dependency, saved_hash, saved_stat=None):
+            if saved_hash is None:
+                return None
+            file_path, _ = split_dependency(dependency)
+            if not (self._trust_mtime and is_trusted_stat(file_stat(file_path), saved_stat)) \
+                    and (saved_hash_algorithm is None or
+                         dependency_hash(dependency, saved_hashes_cache, saved_hash_algorithm, saved_normalized_hashes) != saved_hash):
+                return None
+            return dependency_hash(dependency, hashes_cache, self._hash_algorithm, self._normalized_hashes)
+
+        for dependency, [(saved_hash, saved_stat)] in self._configuration.get_dependency_files().items():
+            self._configuration.add_dependency_hash(dependency, convert_hash(dependency, saved_hash, saved_stat))
+        for test_location, test_file in self._configuration.get_test_files().items():
+            test_file_path = str(pathlib.Path(self._rootdir) / test_location)
+            test_file_hash = convert_hash(test_file_path, test_file['hash'], test_file.get('stat'))
+            fixture_files = {f: convert_hash(f, fixture_file_hash) for f, fixture_file_hash in test_file['fixture_files'].items()}
+            self._configuration.set_test_file(test_location, test_file_hash, test_file['tests'], fixture_files,
+                                              test_file.get('units'), test_file.get('stat'), test_file.get('qualnames'))
+
+    def _save_dependencies_hashes(self, dependencies):
+        # the dependency files may be modified during the session, so their current hash is saved.
+        # the hashes calculated in the session can be used if the files were not modified since before it started
+        known_dependencies = dict()
+        for dependency in dependencies:
+            unchanged_hash = self._get_unchanged_hash(dependency)
+            if unchanged_hash is not None:
+                self._configuration.add_dependency_hash(dependency, unchanged_hash)
+                continue
+            file_path, _ = split_dependency(dependency)
+            known_hashes = self._get_known_hashes(dependency)
+            if self._trust_mtime and dependency in self._dependencies_hashes and self._file_stats.get(file_path) is not None:
+                known_hashes.append((self._dependencies_hashes[dependency], self._file_stats[file_path] + [self._session_timestamp]))
+            known_dependencies[dependency] = known_hashes
+        files = self._group_by_file(known_dependencies)
+        if self._hash_executor is not None:
+            results = self._hash_executor.map(self._hash_file, files.keys(), files.values())
+        else:
+            results = (self._hash_file(file_path, file_dependencies) for file_path, file_dependencies in files.items())
+        for stat_signature, hashes in results:
+            for dependency, hashdigest in hashes.items():
+                self._configuration.add_dependency_hash(dependency, hashdigest)
+                if stat_signature is not None:
+                    self._configuration.set_file_stat(dependency, stat_signature, self._session_timestamp)
+
+    def _get_conftest_files(self, test_file_path):
+        # conftest files that may define fixtures for the test file, including the ones that still don't exist
+        conftest_files = set()
+        directory = pathlib.Path(test_file_path).parent
+        rootdir = pathlib.Path(self._rootdir)
+        while directory == rootdir or rootdir in directory.parents:
+            conftest_files.add(directory / 'conftest.py')
+            directory = directory.parent
+        return conftest_files
+
+    def _get_fixture_files(self, item):
+        fixture_files = set()
+        for fixture_defs in item._fixtureinfo.name2fixturedefs.values():
+            for fixture_def in fixture_defs:
+                fixture_file = inspect.getsourcefile(fixture_def.func)
+                if fixture_file and self._collector.is_dependency_file(fixture_file):
+                    fixture_files.add(pathlib.Path(fixture_file))
+        return fixture_files
+
+    def _get_pyfuncitem_hash(self, pyfuncitem, normalize=False):
+        hashes = []
+        for fixture_name in pyfuncitem.fixturenames:
+            # the request fixture, and the fixtures requested dynamically, have no definition in the test item
+            fixture_defs = pyfuncitem._fixtureinfo.name2fixturedefs.get(fixture_name)
+            if fixture_defs:
+                hashes.append(self._get_function_fingerprint(fixture_defs[0].func, normalize))
+        hashes.append(self._get_function_fingerprint(pyfuncitem.obj, normalize))
+        # the parameters, the marks and the arguments of the decorators are not part of the code of the test function
+        arguments = [pyfuncitem.name]
+        callspec = getattr(pyfuncitem, 'callspec', None)
+        if callspec is not None:
+            arguments.append(repr(sorted(callspec.params.items())))
+        arguments += ['{}{}{}'.format(mark.name, mark.args, sorted(mark.kwargs.items())) for mark in pyfuncitem.iter_markers()]
+        arguments += self._get_function_arguments(pyfuncitem.obj)
+        hashes.append(MEMORY_ADDRESS.sub('', '\n'.join(arguments)))
+        return hashlib.sha1('\n'.join(hashes).encode()).hexdigest()
+
+    @staticmethod
+    def _get_function_arguments(function):
+        # default values of the function and attributes of its wrappers, e.g. the patchings of mock.patch
+        function = getattr(function, '__func__', function)
+        arguments = []
+        while True:
+            arguments += [repr(getattr(function, '__defaults__', None)), repr(getattr(function, '__kwdefaults__', None))]
+            wrapped = getattr(function, '__wrapped__', None)
+            if wrapped is None:
+                return arguments
+            for name, value in sorted(vars(function).items()):
+                if name != '__wrapped__':
+                    values = value if isinstance(value, (list, tuple)) else [value]
+                    arguments.append('{}={}'.format(name, [v if isinstance(v, FUNCTION_TYPES) or not hasattr(v, '__dict__')
+                                                          else vars(v) for v in values]))
+            function = wrapped
+
+    def _get_function_fingerprint(self, function, normalize=False):
+        function = inspect.unwrap(getattr(function, '__func__', function))
+        code = getattr(function, '__code__', None)
+        if code is None:
+            return source_hash(inspect.getsource(function), normalize)
+        if (code, normalize) not in self._code_fingerprints:
+            # the fingerprints saved with the file hash are in the current normalization mode
+            fingerprints = self._get_file_fingerprints(code.co_filename) if normalize == self._normalize else None
+            function_key = '{}:{}'.format(function.__qualname__, code.co_firstlineno)
+            if fingerprints is not None and function_key in fingerprints:
+                self._profiler.count('saved_fingerprint_hits')
+                self._code_fingerprints[(code, normalize)] = fingerprints[function_key]
+            else:
+                fingerprint = code_fingerprint(code, normalize, self._code_fingerprints)
+                if fingerprints is not None:
+                    fingerprints[function_key] = fingerprint
+        return self._code_fingerprints[(code, normalize)]
+
+    def _get_file_fingerprints(self, file_path):
+        if file_path not in self._file_fingerprints:
+            file_hash = self._get_file_hash(file_path) if self._collector.is_dependency_file(file_path) else None
+            if file_hash is not None:
+                self._file_fingerprints[file_path] = (file_hash, self._configuration.get_function_fingerprints(
+                    file_path, file_hash, PYTHON_TAG))
+            else:
+                self._file_fingerprints[file_path] = None
+        entry = self._file_fingerprints[file_path]
+        return entry[1] if entry is not None else None
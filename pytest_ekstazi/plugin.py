@@ -1,153 +1,97 @@
-import re
-import sys
-import trace
-import pathlib
-import inspect
-import hashlib
-import functools
+"""
+Hooks of the pytest11 entry point. This module is imported by every pytest process, so it only registers the
+options: the plugin and its dependencies are imported in pytest_configure when it is enabled with --ekstazi.
+"""
+import argparse
 
-import pytest
+DEFAULT_CONFIG_FILE = 'ekstazi.json'
+DEFAULT_HASH_ALGORITHM = 'sha1'
 
-from .config import EkstaziConfiguration, TestOutcome
-from .utils import file_hash
+FUNCTION_GRANULARITY = 'function'
+MODULE_GRANULARITY = 'module'
+GRANULARITIES = [FUNCTION_GRANULARITY, MODULE_GRANULARITY]
 
-DEFAULT_CONFIG_FILE = 'ekstazi.json'
-DEFAULT_CONFIG_FILE_PATH = pathlib.Path.cwd() / DEFAULT_CONFIG_FILE
-TRACE_IGNORE_FILES = re.compile(r'\<.+\>')
-
-SITE_PACKAGES_PATH = str(pathlib.Path(pytest.__file__).parent.parent)
-
-
-class EkstaziPytestPlugin:
-    # ignorable modules dirs (Python internal modules)
-    _ignore_dirs = [sys.prefix, sys.exec_prefix, SITE_PACKAGES_PATH]
-
-    def __init__(self, configuration, rootdir, select_tests=True):
-        """
-        Create instance of Ekstazi Pytest plugin
-
-        :param configuration EkstaziConfiguration object
-        :param rootdir Pytest root dir
-        :param select_tests Enable test selection phase
-        """
-        self._tracers = dict()
-        self._pyfuncitems = dict()
-        self._test_results = dict()
-        self._configuration = configuration
-        self._rootdir = rootdir
-        self._select_tests = select_tests
-
-        # caching the hashes of the files to avoid re-calculate every pytest_runtest_setup call
-        self._dependencies_hashes = dict()
-        self._test_hashes = dict()
-        self._fixture_hashes = dict()
-
-    def pytest_runtest_setup(self, item):
-        if not self._select_tests:
-            return None
-
-        test_name = item.originalname
-        test_location = item.fspath
-        rel_test_location = self._get_relative_file_path(test_location)
-        dependencies = self._configuration.get_test_dependencies(rel_test_location, test_name)
-        if dependencies:
-            for dependency in dependencies:
-                self._dependencies_hashes.setdefault(dependency, file_hash(pathlib.Path(self._rootdir, dependency)))
-
-        # if the test dependencies has been already identified and all dependencies are the same (or the test does not have any dependency)
-        # and its test file is the same the should be skipped.
-        # when the last test execution has resulted in fail, an xfail is thrown
-        if dependencies is not None and all(self._dependencies_hashes[d] == self._configuration.get_dependency_hash(d) for d in dependencies):
-            test_key = EkstaziConfiguration.get_test_key(rel_test_location, test_name)
-            self._test_hashes[test_key] = self._get_pyfuncitem_hash(item._pyfuncitem)
-            if self._test_hashes[test_key] == self._configuration.get_test_hash(rel_test_location, test_name):
-                test_result = self._configuration.get_last_test_result(rel_test_location, test_name)
-                if test_result in (TestOutcome.ERROR, TestOutcome.FAILED):
-                    raise pytest.xfail.Exception('The test has failed in the last execution and its dependencies have not changed')
-                elif test_result == TestOutcome.PASSED:
-                    raise pytest.skip.Exception('The test and its dependencies were not changed since the last test execution')
-
-    def pytest_pyfunc_call(self, pyfuncitem):
-        test_name = pyfuncitem.originalname
-        test_function = pyfuncitem.obj
-        test_location = pyfuncitem.fspath
-        test_location = self._get_relative_file_path(test_location)
-
-        test_key = EkstaziConfiguration.get_test_key(test_location, test_name)
-        tracer = trace.Trace(trace=0, count=1, countfuncs=1, ignoredirs=EkstaziPytestPlugin._ignore_dirs)
-        self._tracers[test_key] = tracer
-        self._pyfuncitems[test_key] = pyfuncitem
-
-        @functools.wraps(test_function)
-        def tracer_wrapper(*args, **kwargs):
-            tracer.runfunc(test_function, *args, **kwargs)
-
-        pyfuncitem.obj = tracer_wrapper
-
-    @pytest.hookimpl(tryfirst=True, hookwrapper=True)
-    def pytest_runtest_makereport(self, item, call):
-        outcome = yield
-        result = outcome.get_result()
-
-        if result.when == 'setup' and result.outcome == 'failed':
-            self._test_results[item] = TestOutcome.ERROR
-        elif result.when == 'call' and result.outcome == 'failed':
-            self._test_results[item] = TestOutcome.FAILED
-        elif result.when == 'call' and result.outcome == 'passed':
-            self._test_results[item] = TestOutcome.PASSED
-        elif result.when == 'call' and result.outcome == 'skipped':
-            self._test_results[item] = TestOutcome.SKIPPED
-
-    def pytest_sessionfinish(self, session, exitstatus):
-        # save test and test dependencies hashes
-        dependency_files = set()
-        for test_key, tracer in self._tracers.items():
-            test_location, test_name = EkstaziConfiguration.extract_test_from_key(test_key)
-            results = tracer.results()
-            self._configuration.remove_dependencies(test_location, test_name)
-            if test_key not in self._test_hashes:
-                self._test_hashes[test_key] = self._get_pyfuncitem_hash(self._pyfuncitems[test_key])
-            self._configuration.add_test_hash(test_location, test_name, self._test_hashes[test_key])
-            self._configuration.set_test_dependencies_entry(test_location, test_name)
-            calls = sorted(results.calledfuncs)
-            for filepath, _, funcname in calls:
-                # ignore Python internal calls and the test itself
-                if all(not filepath.startswith(path) for path in self._ignore_dirs) \
-                        and filepath != test_location and funcname != test_name \
-                        and not TRACE_IGNORE_FILES.match(filepath):
-                    self._configuration.add_test_dependency(test_location, test_name, filepath)
-                    if filepath not in dependency_files:
-                        self._configuration.add_dependency_hash(filepath, file_hash(filepath))
-                        # add file to a set, so we can avoid recalculate the hash for the same dependency
-                        dependency_files.add(filepath)
-        # save test results
-        for item, outcome in self._test_results.items():
-            self._configuration.set_test_result(item.fspath, item.originalname, outcome)
-        self._configuration.save()
-
-    def _get_relative_file_path(self, file_path):
-        return pathlib.Path(file_path).relative_to(self._rootdir)
-
-    def _get_pyfuncitem_hash(self, pyfuncitem):
-        hashes = []
-        for fixture_name in pyfuncitem.fixturenames:
-            fixture_def = pyfuncitem._fixtureinfo.name2fixturedefs[fixture_name][0]
-            cache_key = '{}_{}'.format(fixture_def.baseid, fixture_def.argname)
-            if cache_key not in self._fixture_hashes:
-                fixture_content = inspect.getsource(fixture_def.func).encode()
-                fixture_hash = hashlib.sha1(fixture_content).hexdigest()
-                self._fixture_hashes[cache_key] = fixture_hash
-            hashes.append(self._fixture_hashes[cache_key])
-        function_content = inspect.getsource(pyfuncitem.obj).encode()
-        hashes.append(hashlib.sha1(function_content).hexdigest())
-        return hashlib.sha1('\n'.join(hashes).encode()).hexdigest()
+FILE_DEPENDENCY_GRANULARITY = 'file'
+FUNCTION_DEPENDENCY_GRANULARITY = 'function'
+DEPENDENCY_GRANULARITIES = [FILE_DEPENDENCY_GRANULARITY, FUNCTION_DEPENDENCY_GRANULARITY]
+
+
+def non_negative_int(value):
+    """
+    Convert an option value to a non-negative integer
+
+    :param value Value of the option
+    """
+    number = int(value)
+    if number < 0:
+        raise argparse.ArgumentTypeError('{} is negative'.format(value))
+    return number
+
+
+def __getattr__(name):
+    """
+    Import the plugin class on demand, as it was defined in this module before
+
+    :param name Name of the module attribute
+    """
+    if name == 'EkstaziPytestPlugin':
+        from .core import EkstaziPytestPlugin
+        return EkstaziPytestPlugin
+    raise AttributeError('module {!r} has no attribute {!r}'.format(__name__, name))
 
 
 def pytest_configure(config):
     if config.getvalue('use_ekstazi'):
-        configuration = EkstaziConfiguration(config.getvalue('ekstazi_file'))
+        import pytest
+
+        from .core import EkstaziPytestPlugin
+        from .config import EkstaziConfiguration
+        from .changes import get_changed_files, ChangeSourceError
+        from .profile import Profiler
+        from .utils import HASH_ALGORITHMS
+
+        profile_path = config.getvalue('ekstazi_profile')
+        profiler = Profiler(enabled=profile_path is not None)
+        with profiler.timer('configuration_load'):
+            configuration = EkstaziConfiguration(config.getvalue('ekstazi_file'))
         select_tests = config.getvalue('ekstazi_selection')
-        config.pluginmanager.register(EkstaziPytestPlugin(configuration, config.rootdir, select_tests), 'ekstazi_plugin')
+        ignore_modules = config.getvalue('ekstazi_ignore_modules')
+        granularity = config.getvalue('ekstazi_granularity')
+        dependency_granularity = config.getvalue('ekstazi_dependency_granularity')
+        trust_mtime = config.getvalue('ekstazi_trust_mtime')
+        hash_workers = config.getvalue('ekstazi_hash_workers')
+        hash_algorithm = config.getvalue('ekstazi_hash')
+        if hash_algorithm not in HASH_ALGORITHMS:
+            raise pytest.UsageError('Invalid hash algorithm "{}", expected one of: {}'.format(hash_algorithm,
+                                                                                            ', '.join(HASH_ALGORITHMS)))
+        workerinput = getattr(config, 'workerinput', None)
+        if workerinput is not None:
+            # xdist worker: the affected tests and the changed files are found by the controller
+            affected_tests = set(workerinput.get('ekstazi_affected_tests', ()))
+            changed_files = workerinput.get('ekstazi_changed_files')
+            changed_files = set(changed_files) if changed_files is not None else None
+        else:
+            affected_tests = None
+            changed_files_path = config.getvalue('ekstazi_changed_files')
+            capture_manager = config.pluginmanager.getplugin('capturemanager')
+            if changed_files_path == '-' and capture_manager is not None:
+                # the capture of the standard input is started before the configuration, and it is resumed
+                # with the capture of the output when the tests run
+                capture_manager.suspend_global_capture(in_=True)
+            try:
+                changed_files = get_changed_files(config.getvalue('ekstazi_changed_from'), changed_files_path,
+                                                  config.invocation_params.dir)
+            except ChangeSourceError as error:
+                raise pytest.UsageError(str(error))
+        normalize = config.getvalue('ekstazi_normalize')
+        track_reads = config.getvalue('ekstazi_track_reads')
+        reorder = config.getvalue('ekstazi_reorder')
+        budget = config.getvalue('ekstazi_budget')
+        plugin = EkstaziPytestPlugin(configuration, config.rootdir, select_tests, ignore_modules, granularity,
+                                     dependency_granularity, trust_mtime, hash_workers, hash_algorithm, affected_tests,
+                                     changed_files, normalize, track_reads, reorder, budget, profiler,
+                                     profile_path)
+        config.pluginmanager.register(plugin, 'ekstazi_plugin')
 
 
 def pytest_addoption(parser):
@@ -164,7 +108,7 @@ def pytest_addoption(parser):
     parser.addoption(
         '--ekstazi-file',
         dest='ekstazi_file',
-        default=DEFAULT_CONFIG_FILE_PATH,
+        default=DEFAULT_CONFIG_FILE,
         help='Ekstazi configuration file. '
              'The file contains the test cases\' file dependencies and the hashes of their content.'
     )
@@ -177,3 +121,131 @@ def pytest_addoption(parser):
         help='Selection phase of Ekstazi plugin is skipped. The hashes and test dependencies '
              'is still calculated and updated at end of the test session.'
     )
+
+    parser.addoption(
+        '--ekstazi-ignore-modules',
+        dest='ekstazi_ignore_modules',
+        action='store_true',
+        default=False,
+        help='Test modules are not collected (imported) when their content and fixtures have not changed, '
+             'and all of their test cases are unaffected and have passed in the last execution.'
+    )
+
+    parser.addoption(
+        '--ekstazi-granularity',
+        dest='ekstazi_granularity',
+        choices=GRANULARITIES,
+        default=FUNCTION_GRANULARITY,
+        help='Unit of the test cases whose dependencies are collected and selected together. '
+             'With "module", the dependencies are collected once per test module (and per test class) '
+             'and the tests of a module are selected as a whole. Default: "function".'
+    )
+
+    parser.addoption(
+        '--ekstazi-dependency-granularity',
+        dest='ekstazi_dependency_granularity',
+        choices=DEPENDENCY_GRANULARITIES,
+        default=FILE_DEPENDENCY_GRANULARITY,
+        help='Unit of the dependencies of the test cases. With "function", the functions and classes '
+             'used by a test case (and the module level code of their files) are its dependencies, so editing '
+             'other functions of the same files does not select the test case. Requires Python 3.11+. Default: "file".'
+    )
+
+    parser.addoption(
+        '--ekstazi-paranoid',
+        dest='ekstazi_trust_mtime',
+        action='store_false',
+        help='The content of every file is hashed again, even when its stat signature has not changed. By default, '
+             'files whose modification time, size and inode are the same of when their saved hash was calculated '
+             'are not read again, except the ones modified around that time, as in git\'s racy-clean handling.'
+    )
+
+    parser.addoption(
+        '--ekstazi-hash-workers',
+        dest='ekstazi_hash_workers',
+        type=non_negative_int,
+        default=None,
+        help='Number of threads hashing the dependency files. The files known from the last executions are hashed '
+             'when the session starts, before their hashes are needed. 0 hashes the files in the main thread. '
+             'Default: the default number of threads of concurrent.futures.ThreadPoolExecutor.'
+    )
+
+    parser.addoption(
+        '--ekstazi-hash',
+        dest='ekstazi_hash',
+        default=DEFAULT_HASH_ALGORITHM,
+        help='Algorithm of the hashes of the dependency and test files. The xxHash algorithms are available '
+             'if xxhash is installed. When the algorithm changes, the saved hashes are converted instead of '
+             'selecting all test cases. Default: "{}".'.format(DEFAULT_HASH_ALGORITHM)
+    )
+
+    parser.addoption(
+        '--ekstazi-changed-from',
+        dest='ekstazi_changed_from',
+        default=None,
+        metavar='git:REV',
+        help='Find the changed files with git (the files changed since REV, plus the untracked files) '
+             'instead of hashing every dependency file. Only the changed files are hashed.'
+    )
+
+    parser.addoption(
+        '--ekstazi-changed-files',
+        dest='ekstazi_changed_files',
+        default=None,
+        metavar='FILE',
+        help='File listing the changed files, one path per line ("-" reads the standard input), '
+             'used instead of hashing every dependency file. Only the changed files are hashed.'
+    )
+
+    parser.addoption(
+        '--ekstazi-normalize',
+        dest='ekstazi_normalize',
+        action='store_true',
+        default=False,
+        help='Hash the AST of the Python dependency files and of the test and fixture functions, without docstrings, '
+             'so editing comments, docstrings or the formatting does not select the test cases. '
+             'The normalized hashes are cached by the raw content hash of each file.'
+    )
+
+    parser.addoption(
+        '--ekstazi-track-reads',
+        dest='ekstazi_track_reads',
+        action='store_true',
+        default=False,
+        help='Collect the non-Python files under the root directory that the test cases open for reading '
+             '(e.g. JSON, YAML or SQL fixtures) as dependencies, using an audit hook. '
+             'The files written by the test case are not dependencies.'
+    )
+
+    parser.addoption(
+        '--ekstazi-reorder',
+        dest='ekstazi_reorder',
+        action='store_true',
+        default=False,
+        help='Run first the test cases that have failed in the last execution, then the test cases whose code has '
+             'changed and then the ones affected by their dependencies. The fastest test cases of each group run first, '
+             'by the durations recorded in the last executions.'
+    )
+
+    parser.addoption(
+        '--ekstazi-budget',
+        dest='ekstazi_budget',
+        type=float,
+        default=None,
+        metavar='SECONDS',
+        help='Run the affected test cases that fit in a time budget, by their durations in the last executions and '
+             'in the order of --ekstazi-reorder. The other affected test cases are deferred: they are pending and '
+             'selected in the next executions even if nothing else has changed.'
+    )
+
+    parser.addoption(
+        '--ekstazi-profile',
+        dest='ekstazi_profile',
+        nargs='?',
+        const='',
+        default=None,
+        metavar='PATH',
+        help='Time the phases of the plugin and count the files hashed, the bytes read, the cache hits, the traced '
+             'events and the selected test cases. The profile is shown in the terminal summary and written '
+             'as JSON to PATH, if given.'
+    )
@@ -0,0 +1,104 @@
+import json
+import time
+import threading
+import contextlib
+
+
+class Profiler:
+    def __init__(self, enabled=True):
+        """
+        Timers and counters of the phases of the plugin. A disabled profiler records nothing.
+
+        :param enabled Whether the timers and counters are recorded
+        """
+        self.enabled = enabled
+        # total seconds and number of calls of each timer
+        self._timers = dict()
+        self._counters = dict()
+        # the files are hashed in a thread pool
+        self._lock = threading.Lock()
+
+    @contextlib.contextmanager
+    def timer(self, name):
+        """
+        Add the time spent inside the context to a timer
+
+        :param name Timer name
+        """
+        if not self.enabled:
+            yield
+            return
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(name, time.perf_counter() - start)
+
+    def add_time(self, name, seconds, calls=1):
+        """
+        Add time to a timer
+
+        :param name Timer name
+        :param seconds Time in seconds
+        :param calls Number of calls timed
+        """
+        if not self.enabled:
+            return
+        with self._lock:
+            timer = self._timers.setdefault(name, [0.0, 0])
+            timer[0] += seconds
+            timer[1] += calls
+
+    def count(self, name, value=1):
+        """
+        Increment a counter
+
+        :param name Counter name
+        :param value Value added to the counter
+        """
+        if not self.enabled:
+            return
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + value
+
+    def as_dict(self):
+        """Get the timers and the counters as a JSON serializable dictionary"""
+        return {
+            'timers': {name: {'seconds': seconds, 'calls': calls} for name, (seconds, calls) in sorted(self._timers.items())},
+            'counters': dict(sorted(self._counters.items()))
+        }
+
+    def merge(self, profile, shared_counters=()):
+        """
+        Add the timers and counters of another profile, e.g. of a xdist worker
+
+        :param profile Dictionary returned by as_dict
+        :param shared_counters Names of the counters that both profiles have counted over the same values
+                               (e.g. the tests collected by every xdist worker), which keep their maximum
+        """
+        for name, timer in profile['timers'].items():
+            self.add_time(name, timer['seconds'], timer['calls'])
+        for name, value in profile['counters'].items():
+            if name in shared_counters:
+                if self.enabled:
+                    with self._lock:
+                        self._counters[name] = max(self._counters.get(name, 0), value)
+            else:
+                self.count(name, value)
+
+    def get_summary_lines(self):
+        """Get the lines of the summary of the timers and the counters"""
+        profile = self.as_dict()
+        lines = ['{:<28}{:>10.3f}s {:>8} calls'.format(name, timer['seconds'], timer['calls'])
+                 for name, timer in profile['timers'].items()]
+        lines += ['{:<28}{:>11}'.format(name, value) for name, value in profile['counters'].items()]
+        return lines
+
+    def dump(self, file_path):
+        """
+        Write the timers and the counters in a JSON file
+
+        :param file_path Location of the JSON file
+        """
+        with open(file_path, 'w') as file:
+            json.dump(self.as_dict(), file, indent=4)
@@ -0,0 +1,598 @@
+import os
+import json
+import mmap
+import struct
+import sqlite3
+import pathlib
+import tempfile
+import contextlib
+
+DEPENDENCIES = 'dependencies'
+DEPENDENCIES_HASHES = 'dependencies_hashes'
+TEST_HASHES = 'test_hashes'
+TEST_RESULTS = 'test_results'
+TEST_FILES = 'test_files'
+FILE_STATS = 'file_stats'
+METADATA = 'metadata'
+# reverse index of the dependencies: the keys of the tests that depend on each dependency
+DEPENDENTS = 'dependents'
+NORMALIZED_HASHES = 'normalized_hashes'
+TEST_DURATIONS = 'test_durations'
+# affected tests deferred by a time budget, which must run in the next sessions
+PENDING_TESTS = 'pending_tests'
+# fingerprints of the test and fixture functions of each file, valid while the file hash is the same
+FINGERPRINTS = 'fingerprints'
+TABLES = [DEPENDENCIES, DEPENDENCIES_HASHES, TEST_HASHES, TEST_RESULTS, TEST_FILES, FILE_STATS, METADATA, DEPENDENTS,
+          NORMALIZED_HASHES, TEST_DURATIONS, PENDING_TESTS, FINGERPRINTS]
+
+# value of a change that removes the entry from the table
+REMOVED = object()
+
+# the changes of the finished tests are appended to a journal next to the configuration file until it is saved
+JOURNAL_SUFFIX = '.journal'
+
+BINARY_MAGIC = b'EKSTAZI\x00'
+BINARY_VERSION = 2
+BINARY_SUFFIXES = ['.bin', '.ekstazi']
+# magic, version, dependency hash width, test hash width, number of strings, files, sets, set members and tests,
+# offsets of the string offsets, strings, files, set offsets, set members, tests, dependent offsets,
+# dependent members and extra sections, extra size
+BINARY_HEADER = struct.Struct('<8sIIIIIIII10Q')
+NO_SET = 0xFFFFFFFF
+BINARY_RESULTS = [None, 'passed', 'failed', 'skipped', 'error']
+
+SQLITE_MAGIC = b'SQLite format 3\x00'
+SQLITE_SUFFIXES = ['.db', '.sqlite', '.sqlite3']
+SQLITE_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS tests (
+    key TEXT PRIMARY KEY,
+    hash TEXT,
+    result TEXT,
+    has_dependencies INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS dependencies (
+    test_key TEXT NOT NULL,
+    dependency TEXT NOT NULL,
+    PRIMARY KEY (test_key, dependency)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS dependencies_dependency ON dependencies (dependency);
+CREATE TABLE IF NOT EXISTS dependencies_hashes (
+    path TEXT PRIMARY KEY,
+    hash TEXT
+);
+CREATE TABLE IF NOT EXISTS entries (
+    name TEXT NOT NULL,
+    key TEXT NOT NULL,
+    value TEXT NOT NULL,
+    PRIMARY KEY (name, key)
+) WITHOUT ROWID;
+'''
+# columns of the tests table of each configuration table saved in it
+SQLITE_TEST_COLUMNS = {TEST_HASHES: 'hash', TEST_RESULTS: 'result'}
+
+
+class InvalidConfigurationFile(ValueError):
+    pass
+
+
+class ConfigurationStorage:
+    """
+    Storage of the tables of an Ekstazi configuration. Each table maps a key to a JSON serializable value:
+    test keys to dependency lists, hashes, results, and test file paths to test file entries.
+    """
+
+    def __init__(self, file_path):
+        self._file_path = file_path
+
+    def get(self, table, key, default=None):
+        """
+        Get a value of a table
+
+        :param table Table name
+        :param key Entry key
+        :param default Value returned if the entry does not exist
+        """
+        raise NotImplementedError
+
+    def items(self, table):
+        """
+        Iterate over the entries of a table
+
+        :param table Table name
+        """
+        raise NotImplementedError
+
+    def save(self, changes):
+        """
+        Save the changes into the configuration file
+
+        :param changes Dictionary mapping each table to a dictionary of new values (or REMOVED) by key
+        """
+        raise NotImplementedError
+
+    def close(self):
+        """Release the resources used to read the configuration file"""
+        pass
+
+    def _merge(self, changes):
+        tables = {table: dict(self.items(table)) for table in TABLES}
+        for table, table_changes in changes.items():
+            for key, value in table_changes.items():
+                if value is REMOVED:
+                    tables[table].pop(key, None)
+                else:
+                    tables[table][key] = value
+        return tables
+
+
+class JsonStorage(ConfigurationStorage):
+    """
+    Storage keeping the whole configuration in a JSON file, which is parsed at once. The dependents of each file are
+    not saved, they are indexed from the dependencies when the file is loaded.
+    """
+
+    def __init__(self, file_path):
+        super().__init__(file_path)
+        self._tables = {table: dict() for table in TABLES}
+
+        if pathlib.Path(file_path).exists():
+            with open(file_path) as file:
+                try:
+                    parsed_json = json.load(file)
+                except json.JSONDecodeError as error:
+                    raise InvalidConfigurationFile('{} is not a valid JSON file: {}'.format(file_path, error))
+                for table, local_dict in self._tables.items():
+                    if table == DEPENDENTS:
+                        continue
+                    json_object = parsed_json.get(table, local_dict)
+                    if not isinstance(json_object, dict):
+                        raise InvalidConfigurationFile('{} is not a dictionary'.format(table))
+                    local_dict.update(json_object)
+        self._index_dependents()
+
+    def get(self, table, key, default=None):
+        return self._tables[table].get(key, default)
+
+    def items(self, table):
+        return self._tables[table].items()
+
+    def save(self, changes):
+        self._tables = self._merge(changes)
+        self._tables[DEPENDENCIES] = {key: list(value) for key, value in self._tables[DEPENDENCIES].items()}
+        self._index_dependents()
+        with atomic_write(self._file_path, 'w') as file:
+            json.dump({table: values for table, values in self._tables.items() if table != DEPENDENTS}, file, indent=4)
+
+    def _index_dependents(self):
+        dependents = dict()
+        for test_key, dependencies in self._tables[DEPENDENCIES].items():
+            for dependency in dependencies:
+                dependents.setdefault(dependency, set()).add(test_key)
+        self._tables[DEPENDENTS] = {dependency: sorted(tests) for dependency, tests in dependents.items()}
+
+
+class BinaryStorage(ConfigurationStorage):
+    """
+    Storage keeping the configuration in a compact binary file, which is read through mmap on demand.
+    The file has a table of the strings, the dependencies as integer ids with fixed-width hashes, the dependency
+    sets shared by all tests that have the same dependencies, the tests sorted by key with fixed-width hashes, and
+    the ids of the tests that depend on each file. The other tables are saved as JSON.
+    """
+
+    def __init__(self, file_path):
+        super().__init__(file_path)
+        self._file = None
+        self._mmap = None
+        self._extra = None
+        self._header = None
+        self._open()
+
+    def get(self, table, key, default=None):
+        if self._mmap is None:
+            return default
+        if table == DEPENDENCIES_HASHES:
+            index = self._search(self._header['files'], self._files_struct, self._header['n_files'], key)
+            if index is None:
+                return default
+            _, flag, digest = self._files_struct.unpack_from(self._mmap, self._header['files'] + index * self._files_struct.size)
+            return digest.hex() if flag else None
+        if table in (DEPENDENCIES, TEST_HASHES, TEST_RESULTS):
+            index = self._search(self._header['tests'], self._tests_struct, self._header['n_tests'], key)
+            if index is None:
+                return default
+            value = self._read_test_value(table, index)
+            return default if value is None else value
+        if table == DEPENDENTS:
+            index = self._search(self._header['files'], self._files_struct, self._header['n_files'], key)
+            return (self._read_dependents(index) if index is not None else None) or default
+        return self._read_extra().get(table, dict()).get(key, default)
+
+    def items(self, table):
+        if self._mmap is None:
+            return
+        if table == DEPENDENCIES_HASHES:
+            for index in range(self._header['n_files']):
+                string_id, flag, digest = self._files_struct.unpack_from(self._mmap, self._header['files'] + index * self._files_struct.size)
+                yield self._read_string(string_id), (digest.hex() if flag else None)
+        elif table in (DEPENDENCIES, TEST_HASHES, TEST_RESULTS):
+            for index in range(self._header['n_tests']):
+                value = self._read_test_value(table, index)
+                if value is not None:
+                    yield self._read_string(self._tests_struct.unpack_from(self._mmap, self._header['tests'] + index * self._tests_struct.size)[0]), value
+        elif table == DEPENDENTS:
+            for index in range(self._header['n_files']):
+                dependent_tests = self._read_dependents(index)
+                if dependent_tests:
+                    yield self._read_string(struct.unpack_from('<I', self._mmap, self._header['files'] + index * self._files_struct.size)[0]), dependent_tests
+        else:
+            yield from self._read_extra().get(table, dict()).items()
+
+    def save(self, changes):
+        tables = self._merge(changes)
+        self.close()
+        with atomic_write(self._file_path, 'wb') as file:
+            write_binary_configuration(file, tables)
+        self._open()
+
+    def close(self):
+        if self._mmap is not None:
+            self._mmap.close()
+            self._file.close()
+        self._mmap = self._file = self._extra = self._header = None
+
+    def _open(self):
+        if not pathlib.Path(self._file_path).exists() or pathlib.Path(self._file_path).stat().st_size == 0:
+            return
+        self._file = open(self._file_path, 'rb')
+        self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        if len(self._mmap) < BINARY_HEADER.size:
+            self.close()
+            raise InvalidConfigurationFile('{} is not a binary configuration file'.format(self._file_path))
+        values = BINARY_HEADER.unpack_from(self._mmap, 0)
+        if values[0] != BINARY_MAGIC or values[1] != BINARY_VERSION:
+            self.close()
+            raise InvalidConfigurationFile('{} is not a binary configuration file'.format(self._file_path))
+        names = ['magic', 'version', 'hash_width', 'test_hash_width', 'n_strings', 'n_files', 'n_sets', 'n_members',
+                 'n_tests', 'string_offsets', 'strings', 'files', 'set_offsets', 'set_members', 'tests',
+                 'dependent_offsets', 'dependent_members', 'extra', 'extra_size']
+        self._header = dict(zip(names, values))
+        self._files_struct = struct.Struct('<IB{}s'.format(self._header['hash_width']))
+        self._tests_struct = struct.Struct('<IIB{}sB'.format(self._header['test_hash_width']))
+
+    def _read_string(self, string_id):
+        start, end = struct.unpack_from('<2Q', self._mmap, self._header['string_offsets'] + string_id * 8)
+        strings = self._header['strings']
+        return self._mmap[strings + start:strings + end].decode()
+
+    def _search(self, offset, record_struct, size, key):
+        # binary search over records sorted by their string (the first field)
+        low, high = 0, size - 1
+        while low <= high:
+            middle = (low + high) // 2
+            string_id = struct.unpack_from('<I', self._mmap, offset + middle * record_struct.size)[0]
+            middle_key = self._read_string(string_id)
+            if middle_key == key:
+                return middle
+            if middle_key < key:
+                low = middle + 1
+            else:
+                high = middle - 1
+        return None
+
+    def _read_test_value(self, table, index):
+        _, set_id, flag, digest, result = self._tests_struct.unpack_from(self._mmap, self._header['tests'] + index * self._tests_struct.size)
+        if table == DEPENDENCIES:
+            return self._read_set(set_id) if set_id != NO_SET else None
+        if table == TEST_HASHES:
+            return digest.hex() if flag else None
+        return BINARY_RESULTS[result]
+
+    def _read_set(self, set_id):
+        start, end = struct.unpack_from('<2I', self._mmap, self._header['set_offsets'] + set_id * 4)
+        file_ids = struct.unpack_from('<{}I'.format(end - start), self._mmap, self._header['set_members'] + start * 4)
+        files = self._header['files']
+        return [self._read_string(self._files_struct.unpack_from(self._mmap, files + i * self._files_struct.size)[0]) for i in file_ids]
+
+    def _read_dependents(self, file_index):
+        start, end = struct.unpack_from('<2I', self._mmap, self._header['dependent_offsets'] + file_index * 4)
+        test_ids = struct.unpack_from('<{}I'.format(end - start), self._mmap, self._header['dependent_members'] + start * 4)
+        tests = self._header['tests']
+        return [self._read_string(self._tests_struct.unpack_from(self._mmap, tests + i * self._tests_struct.size)[0]) for i in test_ids]
+
+    def _read_extra(self):
+        if self._extra is None:
+            start = self._header['extra']
+            self._extra = json.loads(self._mmap[start:start + self._header['extra_size']].decode())
+        return self._extra
+
+
+class SqliteStorage(ConfigurationStorage):
+    """
+    Storage keeping the configuration in an SQLite database. Every lookup is an indexed query and only
+    the changed entries are written, in a single transaction.
+    The tables other than the dependencies, hashes and results are saved as JSON values. The dependents of a
+    dependency are read from the index of the dependencies table, so their changes are not saved.
+    """
+
+    def __init__(self, file_path):
+        super().__init__(file_path)
+        self._connection = None
+        if pathlib.Path(file_path).exists():
+            self._connect()
+
+    def get(self, table, key, default=None):
+        if self._connection is None:
+            return default
+        if table == DEPENDENCIES:
+            row = self._connection.execute('SELECT has_dependencies FROM tests WHERE key = ?', (key,)).fetchone()
+            if not row or not row[0]:
+                return default
+            return [r[0] for r in self._connection.execute('SELECT dependency FROM dependencies WHERE test_key = ?', (key,))]
+        if table == DEPENDENTS:
+            dependents = [r[0] for r in self._connection.execute('SELECT test_key FROM dependencies WHERE dependency = ?', (key,))]
+            return dependents or default
+        if table == DEPENDENCIES_HASHES:
+            row = self._connection.execute('SELECT hash FROM dependencies_hashes WHERE path = ?', (key,)).fetchone()
+            return row[0] if row else default
+        if table in SQLITE_TEST_COLUMNS:
+            row = self._connection.execute('SELECT {} FROM tests WHERE key = ?'.format(SQLITE_TEST_COLUMNS[table]), (key,)).fetchone()
+            return row[0] if row and row[0] is not None else default
+        row = self._connection.execute('SELECT value FROM entries WHERE name = ? AND key = ?', (table, key)).fetchone()
+        return json.loads(row[0]) if row else default
+
+    def items(self, table):
+        if self._connection is None:
+            return
+        if table == DEPENDENCIES:
+            dependencies = {r[0]: [] for r in self._connection.execute('SELECT key FROM tests WHERE has_dependencies')}
+            for test_key, dependency in self._connection.execute('SELECT test_key, dependency FROM dependencies'):
+                dependencies[test_key].append(dependency)
+            yield from dependencies.items()
+        elif table == DEPENDENTS:
+            dependents = dict()
+            for dependency, test_key in self._connection.execute('SELECT dependency, test_key FROM dependencies'):
+                dependents.setdefault(dependency, []).append(test_key)
+            yield from dependents.items()
+        elif table == DEPENDENCIES_HASHES:
+            yield from self._connection.execute('SELECT path, hash FROM dependencies_hashes')
+        elif table in SQLITE_TEST_COLUMNS:
+            column = SQLITE_TEST_COLUMNS[table]
+            yield from self._connection.execute('SELECT key, {0} FROM tests WHERE {0} IS NOT NULL'.format(column))
+        else:
+            for key, value in self._connection.execute('SELECT key, value FROM entries WHERE name = ?', (table,)):
+                yield key, json.loads(value)
+
+    def save(self, changes):
+        if self._connection is None:
+            self._connect()
+        with self._connection:
+            for table, table_changes in changes.items():
+                for key, value in table_changes.items():
+                    self._save_entry(table, key, value)
+
+    def close(self):
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+
+    def _connect(self):
+        self._connection = sqlite3.connect(str(self._file_path))
+        self._connection.executescript(SQLITE_SCHEMA)
+
+    def _save_entry(self, table, key, value):
+        execute = self._connection.execute
+        if table == DEPENDENCIES:
+            execute('INSERT OR IGNORE INTO tests (key) VALUES (?)', (key,))
+            execute('DELETE FROM dependencies WHERE test_key = ?', (key,))
+            execute('UPDATE tests SET has_dependencies = ? WHERE key = ?', (value is not REMOVED, key))
+            if value is not REMOVED:
+                self._connection.executemany('INSERT INTO dependencies (test_key, dependency) VALUES (?, ?)',
+                                             ((key, dependency) for dependency in set(value)))
+        elif table == DEPENDENTS:
+            pass
+        elif table == DEPENDENCIES_HASHES:
+            if value is REMOVED:
+                execute('DELETE FROM dependencies_hashes WHERE path = ?', (key,))
+            else:
+                execute('INSERT OR REPLACE INTO dependencies_hashes (path, hash) VALUES (?, ?)', (key, value))
+        elif table in SQLITE_TEST_COLUMNS:
+            execute('INSERT OR IGNORE INTO tests (key) VALUES (?)', (key,))
+            execute('UPDATE tests SET {} = ? WHERE key = ?'.format(SQLITE_TEST_COLUMNS[table]),
+                    (None if value is REMOVED else value, key))
+        elif value is REMOVED:
+            execute('DELETE FROM entries WHERE name = ? AND key = ?', (table, key))
+        else:
+            execute('INSERT OR REPLACE INTO entries (name, key, value) VALUES (?, ?, ?)', (table, key, json.dumps(value)))
+
+
+def write_binary_configuration(file, tables):
+    """
+    Write the tables of a configuration in the binary format
+
+    :param file File object opened in binary mode
+    :param tables Dictionary mapping each table to its entries
+    """
+    dependencies = {key: sorted(set(value)) for key, value in tables[DEPENDENCIES].items()}
+    dependencies_hashes = dict(tables[DEPENDENCIES_HASHES])
+    for dependency_list in dependencies.values():
+        for dependency in dependency_list:
+            dependencies_hashes.setdefault(dependency, None)
+    test_keys = sorted(set(dependencies) | set(tables[TEST_HASHES]) | set(tables[TEST_RESULTS]))
+    file_paths = sorted(dependencies_hashes)
+
+    # string table: every path and test key is written only once
+    strings = file_paths + test_keys
+    string_ids = {string: i for i, string in enumerate(strings)}
+    encoded_strings = [string.encode() for string in strings]
+    string_offsets = [0]
+    for encoded_string in encoded_strings:
+        string_offsets.append(string_offsets[-1] + len(encoded_string))
+
+    hash_width = _get_digest_width(dependencies_hashes.values())
+    test_hash_width = _get_digest_width(tables[TEST_HASHES].values())
+    files_struct = struct.Struct('<IB{}s'.format(hash_width))
+    tests_struct = struct.Struct('<IIB{}sB'.format(test_hash_width))
+
+    # dependency sets are shared (hash-consed) between the tests with the same dependencies
+    file_ids = {path: i for i, path in enumerate(file_paths)}
+    set_ids = dict()
+    set_offsets = [0]
+    set_members = []
+    tests = []
+    # the reverse index of the dependencies: the ids of the tests that depend on each file
+    dependents = [[] for _ in file_paths]
+    for test_id, test_key in enumerate(test_keys):
+        set_id = NO_SET
+        if test_key in dependencies:
+            for path in dependencies[test_key]:
+                dependents[file_ids[path]].append(test_id)
+            dependency_set = tuple(file_ids[path] for path in dependencies[test_key])
+            if dependency_set not in set_ids:
+                set_ids[dependency_set] = len(set_ids)
+                set_members.extend(dependency_set)
+                set_offsets.append(len(set_members))
+            set_id = set_ids[dependency_set]
+        test_hash = tables[TEST_HASHES].get(test_key)
+        result = tables[TEST_RESULTS].get(test_key)
+        tests.append(tests_struct.pack(string_ids[test_key], set_id, test_hash is not None,
+                                       bytes.fromhex(test_hash or ''), BINARY_RESULTS.index(result)))
+
+    files = [files_struct.pack(string_ids[path], dependencies_hashes[path] is not None,
+                               bytes.fromhex(dependencies_hashes[path] or '')) for path in file_paths]
+    dependent_offsets = [0]
+    for dependent_tests in dependents:
+        dependent_offsets.append(dependent_offsets[-1] + len(dependent_tests))
+    dependent_members = [test_id for dependent_tests in dependents for test_id in dependent_tests]
+    extra = json.dumps({table: tables[table] for table in TABLES
+                        if table not in (DEPENDENCIES, DEPENDENCIES_HASHES, TEST_HASHES, TEST_RESULTS, DEPENDENTS)}).encode()
+
+    sections = [struct.pack('<{}Q'.format(len(string_offsets)), *string_offsets), b''.join(encoded_strings),
+                b''.join(files), struct.pack('<{}I'.format(len(set_offsets)), *set_offsets),
+                struct.pack('<{}I'.format(len(set_members)), *set_members), b''.join(tests),
+                struct.pack('<{}I'.format(len(dependent_offsets)), *dependent_offsets),
+                struct.pack('<{}I'.format(len(dependent_members)), *dependent_members), extra]
+    offsets = []
+    offset = BINARY_HEADER.size
+    for section in sections:
+        offsets.append(offset)
+        offset += len(section)
+    file.write(BINARY_HEADER.pack(BINARY_MAGIC, BINARY_VERSION, hash_width, test_hash_width, len(strings),
+                                  len(file_paths), len(set_ids), len(set_members), len(test_keys), *offsets, len(extra)))
+    for section in sections:
+        file.write(section)
+
+
+@contextlib.contextmanager
+def atomic_write(file_path, mode='w'):
+    """
+    Open a temporary file in the directory of a file, which replaces the file when the context exits without errors.
+    The file is never left partially written, even if the process is killed while writing it.
+
+    :param file_path Location of the file
+    :param mode Mode of the temporary file, 'w' or 'wb'
+    """
+    path = pathlib.Path(file_path)
+    file_descriptor, temp_path = tempfile.mkstemp(dir=str(path.parent), prefix=path.name + '.', suffix='.tmp')
+    try:
+        with os.fdopen(file_descriptor, mode) as file:
+            yield file
+            file.flush()
+            os.fsync(file.fileno())
+        # the temporary file is only readable by its owner, it gets the permissions the file would have
+        try:
+            file_mode = os.stat(str(path)).st_mode & 0o7777
+        except FileNotFoundError:
+            umask = os.umask(0)
+            os.umask(umask)
+            file_mode = 0o666 & ~umask
+        os.chmod(temp_path, file_mode)
+        os.replace(temp_path, str(path))
+    except BaseException:
+        with contextlib.suppress(OSError):
+            os.remove(temp_path)
+        raise
+
+
+def get_journal_path(file_path):
+    """
+    Get the location of the journal of a configuration file
+
+    :param file_path Configuration file path
+    """
+    return pathlib.Path(str(file_path) + JOURNAL_SUFFIX)
+
+
+def append_journal(file_path, changes):
+    """
+    Append changes to the journal of a configuration file. Each change set is written as a JSON line with a single
+    write, so concurrent processes (e.g. xdist workers) can append to the same journal.
+
+    :param file_path Configuration file path
+    :param changes Dictionary mapping each table to a dictionary of new values by key
+    """
+    line = (json.dumps(changes) + '\n').encode()
+    file_descriptor = os.open(str(get_journal_path(file_path)), os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+    try:
+        os.write(file_descriptor, line)
+    finally:
+        os.close(file_descriptor)
+
+
+def read_journal(file_path):
+    """
+    Iterate over the change sets of the journal of a configuration file. A line left incomplete by an interrupted
+    process is skipped.
+
+    :param file_path Configuration file path
+    """
+    journal_path = get_journal_path(file_path)
+    if not journal_path.exists():
+        return
+    with open(journal_path) as file:
+        for line in file:
+            try:
+                changes = json.loads(line)
+            except ValueError:
+                continue
+            if isinstance(changes, dict):
+                yield changes
+
+
+def remove_journal(file_path):
+    """
+    Remove the journal of a configuration file, once its changes have been saved into the file
+
+    :param file_path Configuration file path
+    """
+    with contextlib.suppress(FileNotFoundError):
+        os.remove(str(get_journal_path(file_path)))
+
+
+def open_storage(file_path):
+    """
+    Open the storage of a configuration file. Existing files are detected by their content, new files by their
+    suffix (.bin and .ekstazi are binary files, .db, .sqlite and .sqlite3 are SQLite databases, any other is a JSON file).
+
+    :param file_path Configuration file path
+    """
+    path = pathlib.Path(file_path)
+    if path.exists() and path.stat().st_size:
+        with open(path, 'rb') as file:
+            magic = file.read(len(SQLITE_MAGIC))
+        if magic.startswith(BINARY_MAGIC):
+            return BinaryStorage(file_path)
+        if magic == SQLITE_MAGIC:
+            return SqliteStorage(file_path)
+        return JsonStorage(file_path)
+    if path.suffix in BINARY_SUFFIXES:
+        return BinaryStorage(file_path)
+    if path.suffix in SQLITE_SUFFIXES:
+        return SqliteStorage(file_path)
+    return JsonStorage(file_path)
+
+
+def _get_digest_width(hashes):
+    widths = {len(h) for h in hashes if h is not None}
+    if len(widths) > 1:
+        raise ValueError('All the hashes of a binary configuration must have the same size')
+    return widths.pop() // 2 if widths else 0
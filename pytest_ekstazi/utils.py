@@ -1,8 +1,394 @@
+import os
+import ast
+import sys
+import types
 import hashlib
+import textwrap
 
+try:
+    import xxhash
+except ImportError:
+    xxhash = None
 
-def file_hash(file_path):
-    """Calculate SHA1 of the content of a file"""
+from .plugin import DEFAULT_HASH_ALGORITHM
+
+# the fixed size algorithms of hashlib, and the xxHash algorithms if xxhash is installed
+HASH_ALGORITHMS = sorted(a for a in hashlib.algorithms_guaranteed if not a.startswith('shake_'))
+XXHASH_ALGORITHMS = ['xxh3_64', 'xxh3_128', 'xxh64']
+if xxhash is not None:
+    HASH_ALGORITHMS += XXHASH_ALGORITHMS
+# files larger than this are read in chunks, so the memory used to hash them is constant
+LARGE_FILE_SIZE = 1024 * 1024
+HASH_CHUNK_SIZE = 256 * 1024
+FUNCTION_DEPENDENCY_SEPARATOR = '::'
+# scope of the code that is not inside any function or class of a module
+MODULE_SCOPE = '<module>'
+# files modified less than this before their stat signature was recorded are never trusted,
+# because the file systems may truncate the modification time to this resolution
+STAT_TIMESTAMP_RESOLUTION_NS = 10 ** 9
+
+# flags of the code objects of the functions, and of the ones with a docstring since Python 3.14
+CO_NEWLOCALS = 0x0002
+CO_HAS_DOCSTRING = 0x4000000 if sys.version_info >= (3, 14) else None
+# code objects of the comprehensions, whose first constant is not a docstring
+COMPREHENSION_NAMES = ('<listcomp>', '<setcomp>', '<dictcomp>', '<genexpr>')
+
+
+def new_hash(algorithm=DEFAULT_HASH_ALGORITHM):
+    """
+    Create a hash object of an algorithm of HASH_ALGORITHMS
+
+    :param algorithm Name of the hash algorithm
+    """
+    if algorithm in XXHASH_ALGORITHMS and xxhash is not None:
+        return getattr(xxhash, algorithm)()
+    return hashlib.new(algorithm)
+
+
+def file_hash(file_path, algorithm=DEFAULT_HASH_ALGORITHM, normalized_cache=None):
+    """
+    Calculate the hash of the content of a file. Files larger than LARGE_FILE_SIZE are read in chunks.
+
+    :param file_path Location of the file
+    :param algorithm Name of the hash algorithm
+    :param normalized_cache Dictionary of the normalized hashes of the Python files by path. When provided,
+                            the hash of a Python file is the hash of its normalized AST (see normalized_hashes).
+    """
+    if normalized_cache is not None and str(file_path).endswith('.py'):
+        return normalized_hashes(file_path, algorithm, normalized_cache)['file']
+    hash_object = new_hash(algorithm)
+    with open(file_path, 'rb') as file:
+        if os.fstat(file.fileno()).st_size <= LARGE_FILE_SIZE:
+            hash_object.update(file.read())
+        else:
+            buffer = bytearray(HASH_CHUNK_SIZE)
+            view = memoryview(buffer)
+            size = file.readinto(buffer)
+            while size:
+                hash_object.update(view[:size])
+                size = file.readinto(buffer)
+    return hash_object.hexdigest()
+
+
+def file_stat(file_path):
+    """
+    Get the stat signature of a file: modification time in nanoseconds, size and inode number.
+    Return None if the file does not exist.
+
+    :param file_path Location of the file
+    """
+    try:
+        stat = os.stat(file_path)
+    except (OSError, ValueError):
+        return None
+    return [stat.st_mtime_ns, stat.st_size, stat.st_ino]
+
+
+def is_stat_clean(stat_signature, timestamp):
+    """
+    Check whether a file can be considered unchanged while it has the same stat signature. As git's racy-clean
+    handling, a file modified around the time its signature was recorded may be modified again without changing
+    its modification time, so it is not trusted.
+
+    :param stat_signature Stat signature of the file
+    :param timestamp Time (in nanoseconds) before the file content was read when its signature was recorded
+    """
+    return stat_signature[0] + STAT_TIMESTAMP_RESOLUTION_NS < timestamp
+
+
+def is_trusted_stat(stat_signature, saved_stat):
+    """
+    Check whether a file has not changed since a saved stat signature was taken
+
+    :param stat_signature Current stat signature of the file (None if it does not exist)
+    :param saved_stat Saved stat signature followed by its timestamp (None if it has not been saved)
+    """
+    if stat_signature is None or saved_stat is None:
+        return False
+    return stat_signature == saved_stat[:-1] and is_stat_clean(stat_signature, saved_stat[-1])
+
+
+def hash_file_dependencies(file_path, dependencies, hashes_cache=None, algorithm=DEFAULT_HASH_ALGORITHM,
+                           normalized_cache=None):
+    """
+    Calculate the hashes of the dependency entries of a file. The stat signature of the file is taken before its
+    content is read, and a known hash of a dependency is used without reading the file if it was calculated when
+    the file had the same stat signature.
+    Return the stat signature of the file (None if it does not exist) and a dictionary with the hash of each dependency.
+
+    :param file_path Location of the file
+    :param dependencies Dictionary with the known hashes of each dependency entry of the file, as a list of
+                        (hash, stat signature and timestamp) pairs
+    :param hashes_cache Optional dictionary used to cache the function hashes of each file
+    :param algorithm Name of the hash algorithm
+    :param normalized_cache Dictionary of the normalized hashes of the Python files, to hash their normalized AST
+    """
+    stat_signature = file_stat(file_path)
+    hashes_cache = hashes_cache if hashes_cache is not None else dict()
+    hashes = dict()
+    for dependency, known_hashes in dependencies.items():
+        for hashdigest, saved_stat in known_hashes:
+            if hashdigest is not None and is_trusted_stat(stat_signature, saved_stat):
+                hashes[dependency] = hashdigest
+                break
+        else:
+            hashes[dependency] = dependency_hash(dependency, hashes_cache, algorithm, normalized_cache)
+    return stat_signature, hashes
+
+
+def get_function_dependency(file_path, scope):
+    """
+    Get the dependency entry of a function, class or module level code of a file
+
+    :param file_path Location of the file
+    :param scope Qualified name of the function or class, or MODULE_SCOPE
+    """
+    return '{}{}{}'.format(file_path, FUNCTION_DEPENDENCY_SEPARATOR, scope)
+
+
+def split_dependency(dependency):
+    """
+    Extract the file and the scope of a dependency entry. The scope is None when the dependency is the whole file.
+
+    :param dependency Dependency entry
+    """
+    file_path, _, scope = str(dependency).partition(FUNCTION_DEPENDENCY_SEPARATOR)
+    return file_path, scope or None
+
+
+def get_code_scopes(qualname):
+    """
+    Get the scopes whose code is used when a code object is executed: the module level code, the enclosing classes
+    and the outermost function. Nested functions, lambdas and comprehensions belong to their enclosing scope.
+
+    :param qualname Qualified name of the code object
+    """
+    names = []
+    for name in qualname.split('.'):
+        if name == '<locals>':
+            break
+        if not name.startswith('<'):
+            names.append(name)
+    return [MODULE_SCOPE] + ['.'.join(names[:i]) for i in range(1, len(names) + 1)]
+
+
+def function_hashes(file_path, algorithm=DEFAULT_HASH_ALGORITHM, normalized_cache=None):
+    """
+    Calculate the hash of the source code of each scope of a Python file. The hash of a class or of the module level
+    code does not include the code of the functions and classes defined in it, just their names.
+    Return an empty dictionary if the file can not be parsed.
+
+    :param file_path Location of the Python file
+    :param algorithm Name of the hash algorithm
+    :param normalized_cache Dictionary of the normalized hashes of the Python files, to hash the normalized AST of each scope
+    """
+    if normalized_cache is not None:
+        try:
+            return normalized_hashes(file_path, algorithm, normalized_cache)['scopes']
+        except OSError:
+            return dict()
+    try:
+        with open(file_path, 'rb') as file:
+            source = file.read()
+        tree = ast.parse(source)
+    except (OSError, SyntaxError, ValueError):
+        return dict()
+    lines = source.splitlines(keepends=True)
+    hashes = dict()
+    _add_scope_hashes(tree, MODULE_SCOPE, lines, 1, len(lines), hashes, algorithm)
+    return hashes
+
+
+def dependency_hash(dependency, hashes_cache=None, algorithm=DEFAULT_HASH_ALGORITHM, normalized_cache=None):
+    """
+    Calculate the hash of a dependency entry: the hash of the file content or of the function source code.
+    Return None if the file or the function do not exist anymore.
+
+    :param dependency Dependency entry
+    :param hashes_cache Optional dictionary used to cache the function hashes of each file
+    :param algorithm Name of the hash algorithm
+    :param normalized_cache Dictionary of the normalized hashes of the Python files, to hash their normalized AST
+    """
+    file_path, scope = split_dependency(dependency)
+    if scope is None:
+        try:
+            return file_hash(file_path, algorithm, normalized_cache)
+        except (FileNotFoundError, IsADirectoryError, NotADirectoryError):
+            return None
+    if hashes_cache is None:
+        return function_hashes(file_path, algorithm, normalized_cache).get(scope)
+    if file_path not in hashes_cache:
+        hashes_cache[file_path] = function_hashes(file_path, algorithm, normalized_cache)
+    return hashes_cache[file_path].get(scope)
+
+
+def normalized_hashes(file_path, algorithm=DEFAULT_HASH_ALGORITHM, normalized_cache=None):
+    """
+    Calculate the hashes of the normalized AST of a Python file and of each of its scopes (see function_hashes),
+    ignoring comments, docstrings and formatting. The hashes are cached by the hash of the raw content of the file,
+    so the file is only parsed again when its content changes. A file that can not be parsed has the hash of
+    its raw content and no scope hashes.
+    Return a dictionary with the raw content hash ("raw"), the file hash ("file") and the scope hashes ("scopes").
+
+    :param file_path Location of the Python file
+    :param algorithm Name of the hash algorithm
+    :param normalized_cache Dictionary with the normalized hashes of the Python files by path
+    """
     with open(file_path, 'rb') as file:
-        file_content = file.read()
-        return hashlib.sha1(file_content).hexdigest()
+        source = file.read()
+    raw_hash = new_hash(algorithm)
+    raw_hash.update(source)
+    raw_hash = raw_hash.hexdigest()
+    normalized_cache = normalized_cache if normalized_cache is not None else dict()
+    hashes = normalized_cache.get(str(file_path))
+    if hashes is None or hashes['raw'] != raw_hash:
+        try:
+            tree = strip_docstrings(ast.parse(source))
+        except (SyntaxError, ValueError):
+            hashes = {'raw': raw_hash, 'file': raw_hash, 'scopes': dict()}
+        else:
+            scopes = dict()
+            _add_normalized_scope_hashes(tree, MODULE_SCOPE, scopes, algorithm)
+            hashes = {'raw': raw_hash, 'file': _hash_text(ast.dump(tree), algorithm), 'scopes': scopes}
+        normalized_cache[str(file_path)] = hashes
+    return hashes
+
+
+def source_hash(source, normalize=False):
+    """
+    Calculate SHA1 of a source code, e.g. of a function. When normalized, the hash of its AST without docstrings
+    is calculated, so comments, docstrings and formatting are ignored.
+
+    :param source Source code
+    :param normalize Hash the normalized AST of the source code instead of its text
+    """
+    if normalize:
+        try:
+            source = ast.dump(strip_docstrings(ast.parse(textwrap.dedent(source))))
+        except (SyntaxError, ValueError):
+            pass
+    return _hash_text(source, 'sha1')
+
+
+def code_fingerprint(code, normalize=False, cache=None):
+    """
+    Calculate SHA1 of a code object, e.g. of a function, from its bytecode, constants, names and nested code objects.
+    Unlike the hash of its source code, it does not change with the comments, the formatting or the line numbers.
+    When normalized, the docstrings of the functions are ignored.
+
+    :param code Code object
+    :param normalize Ignore the docstrings of the function and of its nested functions
+    :param cache Optional dictionary used to cache the fingerprint of each code object
+    """
+    cache_key = (code, normalize)
+    if cache is not None and cache_key in cache:
+        return cache[cache_key]
+    consts = code.co_consts
+    if normalize and _has_docstring(code):
+        # the docstring is replaced by None, the first constant of the functions without docstring
+        consts = (None,) + consts[1:]
+    hash_object = hashlib.sha1()
+    # co_posonlyargcount does not exist before Python 3.8
+    for value in (code.co_name, code.co_argcount, getattr(code, 'co_posonlyargcount', 0), code.co_kwonlyargcount, code.co_flags,
+                  code.co_names, code.co_varnames, code.co_freevars, code.co_cellvars):
+        hash_object.update(repr(value).encode())
+    hash_object.update(code.co_code)
+    hash_object.update(getattr(code, 'co_exceptiontable', b''))
+    for const in consts:
+        if isinstance(const, types.CodeType):
+            hash_object.update(code_fingerprint(const, normalize, cache).encode())
+        else:
+            hash_object.update(_const_repr(const).encode())
+    fingerprint = hash_object.hexdigest()
+    if cache is not None:
+        cache[cache_key] = fingerprint
+    return fingerprint
+
+
+def strip_docstrings(tree):
+    """
+    Remove the docstrings of the module, classes and functions of an AST
+
+    :param tree AST parsed from a source code
+    """
+    for node in ast.walk(tree):
+        if isinstance(node, (ast.Module, ast.ClassDef, ast.FunctionDef, ast.AsyncFunctionDef)) and node.body:
+            first_statement = node.body[0]
+            if isinstance(first_statement, ast.Expr) and isinstance(first_statement.value, ast.Constant) \
+                    and isinstance(first_statement.value.value, str):
+                node.body = node.body[1:] or [ast.Pass()]
+    return tree
+
+
+def _has_docstring(code):
+    if CO_HAS_DOCSTRING is not None:
+        return bool(code.co_flags & CO_HAS_DOCSTRING)
+    # before Python 3.14, the first constant of a function is its docstring or None
+    return bool(code.co_flags & CO_NEWLOCALS) and code.co_name not in COMPREHENSION_NAMES \
+        and bool(code.co_consts) and isinstance(code.co_consts[0], str)
+
+
+def _const_repr(const):
+    # the order of the frozenset constants depends on the hash seed of the strings
+    if isinstance(const, frozenset):
+        return 'frozenset({{{}}})'.format(', '.join(sorted(_const_repr(c) for c in const)))
+    if isinstance(const, tuple):
+        return '({})'.format(', '.join(_const_repr(c) for c in const))
+    return repr(const)
+
+
+def _hash_text(text, algorithm):
+    hash_object = new_hash(algorithm)
+    hash_object.update(text.encode())
+    return hash_object.hexdigest()
+
+
+def _dump_scope(node, scope_node):
+    # like ast.dump, with the functions and classes defined in the scope (outside of functions) replaced by their names
+    if isinstance(node, ast.AST):
+        if node is not scope_node and isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+            return '<{}>'.format(node.name)
+        fields = ', '.join('{}={}'.format(name, _dump_scope(value, scope_node)) for name, value in ast.iter_fields(node))
+        return '{}({})'.format(type(node).__name__, fields)
+    if isinstance(node, list):
+        return '[{}]'.format(', '.join(_dump_scope(child, scope_node) for child in node))
+    return repr(node)
+
+
+def _add_normalized_scope_hashes(node, scope, hashes, algorithm):
+    if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+        hashes[scope] = _hash_text(ast.dump(node), algorithm)
+        return
+    hashes[scope] = _hash_text(_dump_scope(node, node), algorithm)
+    for definition in _get_definitions(node):
+        definition_scope = definition.name if scope == MODULE_SCOPE else '{}.{}'.format(scope, definition.name)
+        _add_normalized_scope_hashes(definition, definition_scope, hashes, algorithm)
+
+
+def _get_definitions(node):
+    # functions and classes defined in the scope of the node, including the ones inside if/try/with blocks
+    definitions = []
+    for child in ast.iter_child_nodes(node):
+        if isinstance(child, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+            definitions.append(child)
+        elif isinstance(child, ast.stmt):
+            definitions.extend(_get_definitions(child))
+    return definitions
+
+
+def _add_scope_hashes(node, scope, lines, first_line, last_line, hashes, algorithm):
+    definitions = _get_definitions(node) if not isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)) else []
+    # the source of each definition is replaced by its name in the source of the enclosing scope
+    scope_lines = []
+    line = first_line
+    for definition in sorted(definitions, key=lambda d: d.lineno):
+        definition_first_line = min([definition.lineno] + [d.lineno for d in definition.decorator_list])
+        scope_lines.extend(lines[line - 1:definition_first_line - 1])
+        scope_lines.append('<{}>\n'.format(definition.name).encode())
+        line = definition.end_lineno + 1
+        definition_scope = definition.name if scope == MODULE_SCOPE else '{}.{}'.format(scope, definition.name)
+        _add_scope_hashes(definition, definition_scope, lines, definition_first_line, definition.end_lineno, hashes, algorithm)
+    scope_lines.extend(lines[line - 1:last_line])
+    hash_object = new_hash(algorithm)
+    hash_object.update(b''.join(scope_lines))
+    hashes[scope] = hash_object.hexdigest()
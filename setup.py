@@ -26,6 +26,6 @@ setuptools.setup(
     entry_points={
         'pytest11': ['pytest_ekstazi = pytest_ekstazi.plugin']
     },
-    install_requires=['pytest'],
+    install_requires=['pytest>=7.0.0'],
     python_requires='>=3.7',
 )
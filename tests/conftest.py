@@ -4,11 +4,13 @@ import pathlib
 import pytest
 
 from pytest_ekstazi.plugin import DEFAULT_CONFIG_FILE
+from pytest_ekstazi.storage import JOURNAL_SUFFIX
 
-from .constants import TESTING_PROJECT_TEST_ROOT, CUSTOM_CONFIGURATION_FILE
+from .constants import TESTING_PROJECT_TEST_ROOT, CUSTOM_CONFIGURATION_FILE, BINARY_CONFIGURATION_FILE
 from .utils import run_pytest, extract_test_case_results
 
-CONFIGURATION_FILES = [DEFAULT_CONFIG_FILE, CUSTOM_CONFIGURATION_FILE]
+CONFIGURATION_FILES = [DEFAULT_CONFIG_FILE, CUSTOM_CONFIGURATION_FILE, BINARY_CONFIGURATION_FILE]
+CONFIGURATION_FILES += [configuration_file + JOURNAL_SUFFIX for configuration_file in CONFIGURATION_FILES]
 
 
 @pytest.fixture(autouse=True)
@@ -1,8 +1,10 @@
 import pathlib
 
 CUSTOM_CONFIGURATION_FILE = 'custom_ekstazi.json'
+BINARY_CONFIGURATION_FILE = 'ekstazi.bin'
 DEFAULT_PYTEST_OPTIONS = ['--ekstazi']
 CONFIGURATION_FILE_OPTIONS = DEFAULT_PYTEST_OPTIONS + ['--ekstazi-file', CUSTOM_CONFIGURATION_FILE]
+BINARY_CONFIGURATION_FILE_OPTIONS = DEFAULT_PYTEST_OPTIONS + ['--ekstazi-file', BINARY_CONFIGURATION_FILE]
 
 TESTING_PROJECT_ROOT = pathlib.Path(__file__).parent / 'project'
 TESTING_PROJECT_TEST_ROOT = TESTING_PROJECT_ROOT / 'tests'
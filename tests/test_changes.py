@@ -0,0 +1,57 @@
+import os
+import subprocess
+
+import pytest
+
+from pytest_ekstazi.changes import get_changed_files, parse_change_source, ChangeSourceError
+
+
+def git(*arguments, cwd):
+    subprocess.run(['git', '-c', 'user.name=test', '-c', 'user.email=test@test'] + list(arguments), cwd=cwd,
+                   check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+
+
+def test_parse_change_source():
+    """The change source should be split in its kind and its revision"""
+    assert parse_change_source('git:HEAD~2') == ('git', 'HEAD~2')
+    assert parse_change_source('git:') == ('git', 'HEAD'), 'The revision should be HEAD by default'
+    with pytest.raises(ChangeSourceError):
+        parse_change_source('svn:10')
+
+
+def test_git_changed_files(tmp_path):
+    """The changed and untracked files of the git repository should be found"""
+    git('init', '-q', cwd=tmp_path)
+    for file_name in ('changed.py', 'unchanged.py'):
+        (tmp_path / file_name).write_text('x = 1\n')
+    git('add', '.', cwd=tmp_path)
+    git('commit', '-q', '-m', 'initial', cwd=tmp_path)
+
+    (tmp_path / 'changed.py').write_text('x = 2\n')
+    (tmp_path / 'untracked.py').write_text('y = 1\n')
+    assert get_changed_files('git:HEAD', directory=tmp_path) == \
+        {os.path.abspath(tmp_path / 'changed.py'), os.path.abspath(tmp_path / 'untracked.py')}
+
+
+def test_git_renamed_files(tmp_path):
+    """Both paths of a renamed file and the paths with special characters should be found"""
+    git('init', '-q', cwd=tmp_path)
+    for file_name in ('old.py', 'módulo.py'):
+        (tmp_path / file_name).write_text('x = 1\n')
+    git('add', '.', cwd=tmp_path)
+    git('commit', '-q', '-m', 'initial', cwd=tmp_path)
+
+    git('mv', 'old.py', 'new.py', cwd=tmp_path)
+    (tmp_path / 'módulo.py').write_text('x = 2\n')
+    assert get_changed_files('git:HEAD', directory=tmp_path) == \
+        {os.path.abspath(tmp_path / 'old.py'), os.path.abspath(tmp_path / 'new.py'),
+         os.path.abspath(tmp_path / 'módulo.py')}
+
+
+def test_changed_files_list(tmp_path):
+    """The changed files should be read from a file, relative to the directory"""
+    changed_files_path = tmp_path / 'changed.txt'
+    changed_files_path.write_text('src/a.py\n\n{}\n'.format(tmp_path / 'b.py'))
+    assert get_changed_files(changed_files_path=str(changed_files_path), directory=tmp_path) == \
+        {os.path.abspath(tmp_path / 'src' / 'a.py'), os.path.abspath(tmp_path / 'b.py')}
+    assert get_changed_files(directory=tmp_path) is None, 'There are no changed files without a change source'
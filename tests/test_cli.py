@@ -0,0 +1,72 @@
+import os
+import sys
+import subprocess
+
+from .constants import DEFAULT_PYTEST_OPTIONS, TESTING_PROJECT_ROOT, TESTING_PROJECT_TEST_ROOT
+from .utils import run_pytest, edit_file_content
+
+
+def run_cli(*arguments):
+    """
+    Run the command line of the plugin in the testing project
+
+    :param arguments Command line arguments
+    :return process exit code and standard output
+    """
+    process = subprocess.run([sys.executable, '-m', 'pytest_ekstazi'] + list(arguments), stdout=subprocess.PIPE,
+                             stderr=subprocess.PIPE, universal_newlines=True, cwd=TESTING_PROJECT_TEST_ROOT, timeout=30)
+    return process.returncode, process.stdout
+
+
+def test_affected_command(project_test_cases):
+    """The command line should print the tests affected by the changed files without running pytest"""
+    assert run_cli('affected')[0] != 0, 'The command should fail without a configuration file'
+    run_pytest(DEFAULT_PYTEST_OPTIONS)
+    assert run_cli('affected') == (0, ''), 'No test should be affected'
+
+    readers = TESTING_PROJECT_ROOT / 'project' / 'readers.py'
+    readers_test_cases = {test.split('[')[0] for test in project_test_cases if test.startswith('test_code_readers.py')}
+    with edit_file_content(readers, readers.read_text() + '\n# edited\n'):
+        exit_code, output = run_cli('affected')
+        assert exit_code == 0
+        assert set(output.splitlines()) == readers_test_cases, 'The tests dependent of the changed file should be affected'
+        assert run_cli('affected', '--count') == (0, '{}\n'.format(len(readers_test_cases)))
+        assert run_cli('affected', '--test-files') == (0, 'test_code_readers.py\n')
+        assert run_cli('affected', '../project/user.py') == (0, ''), 'Only the given changed files should be hashed'
+        assert set(run_cli('affected', '../project/readers.py')[1].splitlines()) == readers_test_cases
+
+
+def test_affected_command_test_class():
+    """The node IDs of the affected test methods should include their test classes"""
+    test_class = TESTING_PROJECT_TEST_ROOT / 'test_class.py'
+    try:
+        test_class.write_text('from project.readers import read_qrcode\n\n\nclass TestReaders:\n'
+                              '    def test_read_qr_code(self):\n        assert read_qrcode([1, 2, 3]) == 3\n')
+        run_pytest(DEFAULT_PYTEST_OPTIONS)
+        readers = TESTING_PROJECT_ROOT / 'project' / 'readers.py'
+        with edit_file_content(readers, readers.read_text() + '\n# edited\n'):
+            exit_code, output = run_cli('affected', '../project/readers.py')
+            assert exit_code == 0
+            assert 'test_class.py::TestReaders::test_read_qr_code' in output.splitlines()
+
+            process = subprocess.run([sys.executable, '-m', 'pytest', '-q', 'test_class.py::TestReaders::test_read_qr_code'],
+                                     stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True,
+                                     cwd=TESTING_PROJECT_TEST_ROOT, timeout=30)
+            assert process.returncode == 0, 'pytest should find the node ID of the test method'
+    finally:
+        os.remove(test_class)
+
+
+def test_stats_and_show_commands():
+    """The command line should print the size of the configuration file and the entry of a test"""
+    run_pytest(DEFAULT_PYTEST_OPTIONS)
+    exit_code, output = run_cli('stats', '--top', '1')
+    assert exit_code == 0
+    assert 'dependencies: ' in output and 'hub files:' in output
+    assert output.splitlines()[-1].split()[-1].endswith('.py'), 'The hub file should be listed'
+
+    exit_code, output = run_cli('show', 'test_code_readers.py::test_read_barcode')
+    assert exit_code == 0
+    assert 'result: failed' in output
+    assert str(TESTING_PROJECT_ROOT / 'project' / 'readers.py') in output, 'The dependencies should be listed'
+    assert run_cli('show', 'test_code_readers.py::test_unknown')[0] == 1
@@ -0,0 +1,146 @@
+import sys
+import json
+import threading
+
+import pytest
+
+from pytest_ekstazi import changes
+from pytest_ekstazi.collector import create_dependency_collector
+
+from . import utils
+
+PYTEST_OUTPUT = '\n====== 1 passed in 0.01s ======\n'
+
+
+def test_collect_dependency_files():
+    """
+    The collector should record the files of the called functions, ignoring files under the ignored directories
+    and the code objects with ignored names
+    """
+    collector = create_dependency_collector([sys.prefix, sys.exec_prefix])
+
+    def test_function():
+        json.dumps({})
+        utils.extract_pytest_results(PYTEST_OUTPUT)
+
+    dependencies = set()
+    with collector.collect(dependencies, ignored_names=('test_function',)):
+        test_function()
+
+    assert dependencies == {utils.__file__}, 'Only the non-ignored called files should be dependencies'
+
+
+def test_collect_without_ignored_dirs():
+    """
+    The frames of the collection itself should not be dependencies, even when the standard library is not ignored
+    (e.g. in a virtual environment, whose sys.prefix does not contain it)
+    """
+    collector = create_dependency_collector([])
+    dependencies = set()
+    with collector.collect(dependencies):
+        pass
+    assert not dependencies, 'No dependency should be recorded when no code is executed'
+
+
+def test_collect_dependency_files_per_collection():
+    """
+    A code object already seen by a collection should be reported again for a new collection
+    """
+    collector = create_dependency_collector([sys.prefix, sys.exec_prefix])
+
+    for _ in range(2):
+        dependencies = set()
+        with collector.collect(dependencies):
+            utils.extract_pytest_results(PYTEST_OUTPUT)
+        assert dependencies == {utils.__file__}, 'Every collection should record its own dependencies'
+
+    dependencies = set()
+    with collector.collect(dependencies):
+        pass
+    assert not dependencies, 'No dependency should be recorded when no code is executed'
+
+
+def test_collect_read_files(tmp_path):
+    """
+    The collector should record the non-Python files read under the tracked directories, once per collection,
+    except the files written in the same collection
+    """
+    collector = create_dependency_collector([sys.prefix, sys.exec_prefix], read_dirs=[tmp_path])
+    data_file = tmp_path / 'data.json'
+    data_file.write_text('{}')
+    output_file = tmp_path / 'output.json'
+    output_file.write_text('{}')
+    python_file = tmp_path / 'module.py'
+    python_file.write_text('')
+
+    dependencies = set()
+    with collector.collect(dependencies):
+        for _ in range(3):
+            json.loads(data_file.read_text())
+        python_file.read_text()
+        output_file.read_text()
+        output_file.write_text('[]')
+        output_file.read_text()
+    assert dependencies == {str(data_file)}, 'Only the read data files should be dependencies'
+
+    data_file.read_text()
+    dependencies = set()
+    with collector.collect(dependencies):
+        pass
+    assert not dependencies, 'The files read out of a collection should not be dependencies'
+
+    dependencies = set()
+    with collector.collect(dependencies):
+        thread = threading.Thread(target=data_file.read_text)
+        thread.start()
+        thread.join()
+    assert not dependencies, 'The files read by other threads should not be dependencies'
+
+
+@pytest.mark.skipif(not hasattr(sys, 'monitoring'), reason='sys.monitoring requires Python 3.12+')
+def test_collect_keeps_disabled_events_of_other_tools():
+    """The collections should not enable again the code locations disabled by the other sys.monitoring tools"""
+    collector = create_dependency_collector([sys.prefix, sys.exec_prefix])
+    with collector.collect(set()):
+        pass
+    tool_id = next(i for i in range(6) if sys.monitoring.get_tool(i) is None)
+    calls = []
+
+    def callback(code, instruction_offset):
+        calls.append(code)
+        return sys.monitoring.DISABLE
+
+    def function():
+        pass
+
+    sys.monitoring.use_tool_id(tool_id, 'test')
+    try:
+        sys.monitoring.register_callback(tool_id, sys.monitoring.events.PY_START, callback)
+        sys.monitoring.set_events(tool_id, sys.monitoring.events.PY_START)
+        function()
+        for _ in range(2):
+            dependencies = set()
+            with collector.collect(dependencies):
+                function()
+            assert dependencies == {__file__}, 'Every collection should record its own dependencies'
+    finally:
+        sys.monitoring.set_events(tool_id, sys.monitoring.events.NO_EVENTS)
+        sys.monitoring.free_tool_id(tool_id)
+    assert calls.count(function.__code__) == 1, 'The location disabled by the other tool should stay disabled'
+
+
+def test_collect_nested_dependencies():
+    """
+    A collection started inside another one should pause the outer collection until it ends
+    """
+    collector = create_dependency_collector([sys.prefix, sys.exec_prefix])
+
+    dependencies = set()
+    inner_dependencies = set()
+    with collector.collect(dependencies):
+        with collector.collect(inner_dependencies):
+            changes.parse_change_source('git:HEAD')
+        utils.extract_pytest_results(PYTEST_OUTPUT)
+
+    assert inner_dependencies == {changes.__file__}, 'The inner collection should record its own dependencies'
+    assert dependencies == {utils.__file__}, 'The outer collection should be resumed after the inner one'
@@ -0,0 +1,192 @@
+import os
+import json
+import stat
+
+import pytest
+
+from pytest_ekstazi.config import EkstaziConfiguration, TestOutcome
+from pytest_ekstazi.storage import BINARY_MAGIC, DEPENDENCIES, TEST_HASHES, get_journal_path, atomic_write
+
+DEPENDENCY_HASHES = {
+    '/project/database.py': '3822ed5dddaa1ea8e4559fc59cb46df61e7a4db0',
+    '/project/product.py': 'ace7f5c2de1963b01d91da0ee1f123b7abffe5c9',
+    '/project/user.py': None
+}
+
+
+def fill_configuration(configuration):
+    for test_name in ('test_insert_product', 'test_delete_product'):
+        configuration.set_test_dependencies_entry('test_product.py', test_name)
+        configuration.add_test_dependency('test_product.py', test_name, '/project/database.py')
+        configuration.add_test_dependency('test_product.py', test_name, '/project/product.py')
+        configuration.add_test_hash('test_product.py', test_name, '286591afcdf99594b07d89861ffa189f8195b265')
+        configuration.set_test_result('test_product.py', test_name, TestOutcome.PASSED)
+    configuration.set_test_dependencies_entry('test_assert.py', 'test_assert_false')
+    configuration.set_test_result('test_assert.py', 'test_assert_false', TestOutcome.FAILED)
+    configuration.set_test_duration('test_assert.py', 'test_assert_false', 0.25)
+    configuration.set_test_pending('test_assert.py', 'test_assert_false')
+    configuration.set_function_fingerprints('/tests/test_product.py', '26d4d371f6a70c5ae13f33c22a497fb1797ad7f6',
+                                            'cpython-311', {'test_insert_product:5': '0' * 40})
+    for file_path, hashdigest in DEPENDENCY_HASHES.items():
+        configuration.add_dependency_hash(file_path, hashdigest)
+    configuration.set_test_file('test_product.py', '26d4d371f6a70c5ae13f33c22a497fb1797ad7f6',
+                                ['test_insert_product', 'test_delete_product'], {'/project/conftest.py': None})
+
+
+def assert_configuration(configuration):
+    assert configuration.get_test_dependencies('test_product.py', 'test_insert_product') == \
+        {'/project/database.py', '/project/product.py'}, 'The test dependencies are not right'
+    assert configuration.get_test_dependencies('test_assert.py', 'test_assert_false') == set(), \
+        'The test without dependencies should have an empty entry'
+    assert configuration.get_test_dependencies('test_assert.py', 'test_assert_passed') is None, \
+        'The test not executed should have no entry'
+    assert configuration.get_test_hash('test_product.py', 'test_delete_product') == '286591afcdf99594b07d89861ffa189f8195b265'
+    assert configuration.get_last_test_result('test_assert.py', 'test_assert_false') == TestOutcome.FAILED
+    assert configuration.get_last_test_result('test_product.py', 'test_insert_product') == TestOutcome.PASSED
+    assert configuration.get_test_duration('test_assert.py', 'test_assert_false') == 0.25
+    assert configuration.get_test_duration('test_product.py', 'test_insert_product') is None
+    assert configuration.is_test_pending('test_assert.py', 'test_assert_false'), 'The test should be pending'
+    assert not configuration.is_test_pending('test_product.py', 'test_insert_product')
+    assert configuration.get_function_fingerprints('/tests/test_product.py', '26d4d371f6a70c5ae13f33c22a497fb1797ad7f6',
+                                                   'cpython-311') == {'test_insert_product:5': '0' * 40}
+    assert configuration.get_function_fingerprints('/tests/test_product.py', '0' * 40, 'cpython-311') == dict(), \
+        'The fingerprints of a changed file should not be used'
+    for file_path, hashdigest in DEPENDENCY_HASHES.items():
+        assert configuration.get_dependency_hash(file_path) == hashdigest, 'The dependency hashes are not right'
+    assert configuration.get_test_file_tests('test_product.py') == ['test_delete_product', 'test_insert_product']
+    assert configuration.get_test_file_fixture_files('test_product.py') == {'/project/conftest.py': None}
+    assert configuration.get_dependent_tests('/project/product.py') == \
+        {'test_product.py::test_insert_product', 'test_product.py::test_delete_product'}, 'The dependent tests are not right'
+    assert configuration.get_dependent_tests('/project/user.py') == set(), 'A file without dependent tests has no dependents'
+
+
+@pytest.mark.parametrize('file_name', ['ekstazi.json', 'ekstazi.bin', 'ekstazi.db'])
+def test_save_and_load_configuration(tmp_path, file_name):
+    """The configuration should be the same after saving and loading it again in any file format"""
+    configuration = EkstaziConfiguration(tmp_path / file_name)
+    fill_configuration(configuration)
+    assert_configuration(configuration)
+    configuration.save()
+    configuration.close()
+
+    with open(tmp_path / file_name, 'rb') as file:
+        assert (file.read(len(BINARY_MAGIC)) == BINARY_MAGIC) == file_name.endswith('.bin'), \
+            'The file format should be chosen by the file suffix'
+
+    configuration = EkstaziConfiguration(tmp_path / file_name)
+    assert_configuration(configuration)
+
+    configuration.remove_dependencies('test_product.py', 'test_insert_product')
+    configuration.save()
+    configuration.close()
+    configuration = EkstaziConfiguration(tmp_path / file_name)
+    assert configuration.get_test_dependencies('test_product.py', 'test_insert_product') is None, \
+        'The removed dependencies should not be saved'
+    assert configuration.get_dependent_tests('/project/product.py') == {'test_product.py::test_delete_product'}, \
+        'The removed dependencies should be removed from the dependents'
+    configuration.close()
+
+
+def test_index_dependents_of_json_configuration(tmp_path):
+    """The dependents of a JSON configuration file should be indexed when loading it, not saved in the file"""
+    file_path = tmp_path / 'ekstazi.json'
+    file_path.write_text(json.dumps({'dependencies': {'test_product.py::test_insert_product': ['/project/product.py']}}))
+
+    configuration = EkstaziConfiguration(file_path)
+    assert configuration.get_affected_tests(['/project/product.py', '/project/user.py']) == \
+        {'test_product.py::test_insert_product'}, 'The dependents should be indexed'
+    configuration.add_test_dependency('test_user.py', 'test_create_user', '/project/user.py')
+    configuration.save()
+
+    with open(file_path) as file:
+        assert 'dependents' not in json.load(file), 'The reverse index should not be saved'
+    configuration = EkstaziConfiguration(file_path)
+    assert configuration.get_affected_tests(['/project/user.py']) == {'test_user.py::test_create_user'}, \
+        'The dependents of the saved dependencies should be indexed'
+
+
+def test_atomic_write_file_mode(tmp_path):
+    """The file written atomically should keep its permissions, or get the default ones of a new file"""
+    file_path = tmp_path / 'ekstazi.json'
+    umask = os.umask(0o022)
+    try:
+        with atomic_write(file_path) as file:
+            file.write('{}')
+        assert stat.S_IMODE(os.stat(str(file_path)).st_mode) == 0o644, 'A new file should get the default permissions'
+        os.chmod(str(file_path), 0o640)
+        with atomic_write(file_path) as file:
+            file.write('{}')
+        assert stat.S_IMODE(os.stat(str(file_path)).st_mode) == 0o640, 'The file should keep its permissions'
+    finally:
+        os.umask(umask)
+
+
+def test_export_configuration(tmp_path):
+    """The configuration should be converted between JSON and binary formats"""
+    configuration = EkstaziConfiguration(tmp_path / 'ekstazi.json')
+    fill_configuration(configuration)
+    configuration.save()
+
+    configuration.export(tmp_path / 'ekstazi.bin')
+    binary_configuration = EkstaziConfiguration(tmp_path / 'ekstazi.bin')
+    assert_configuration(binary_configuration)
+    assert binary_configuration.get_dependents() == configuration.get_dependents()
+    assert b'"dependents"' not in (tmp_path / 'ekstazi.bin').read_bytes(), \
+        'The reverse index should be derived from the binary dependencies instead of being saved as JSON'
+
+    binary_configuration.export(tmp_path / 'exported.json')
+    assert_configuration(EkstaziConfiguration(tmp_path / 'exported.json'))
+    binary_configuration.export(tmp_path / 'ekstazi.db')
+    binary_configuration.close()
+
+    sqlite_configuration = EkstaziConfiguration(tmp_path / 'ekstazi.db')
+    assert_configuration(sqlite_configuration)
+    sqlite_configuration.close()
+
+
+def test_save_only_changed_entries(tmp_path):
+    """Saving a SQLite configuration should write only the entries that changed"""
+    configuration = EkstaziConfiguration(tmp_path / 'ekstazi.db')
+    fill_configuration(configuration)
+    configuration.save()
+    configuration.close()
+
+    configuration = EkstaziConfiguration(tmp_path / 'ekstazi.db')
+    connection = configuration._storage._connection
+    configuration.add_dependency_hash('/project/database.py', DEPENDENCY_HASHES['/project/database.py'])
+    configuration.set_test_result('test_product.py', 'test_insert_product', TestOutcome.PASSED)
+    configuration.save()
+    assert connection.total_changes == 0, 'The unchanged entries should not be written'
+
+    configuration.set_test_result('test_product.py', 'test_insert_product', TestOutcome.FAILED)
+    configuration.save()
+    assert connection.total_changes == 1, 'Only the changed test row should be written'
+    configuration.close()
+
+
+@pytest.mark.parametrize('file_name', ['ekstazi.json', 'ekstazi.bin', 'ekstazi.db'])
+def test_replay_journal(tmp_path, file_name):
+    """The changes appended to the journal should be loaded with the configuration until it is saved"""
+    configuration = EkstaziConfiguration(tmp_path / file_name)
+    fill_configuration(configuration)
+    configuration.save()
+    configuration.append_journal({DEPENDENCIES: {'test_user.py::test_login': ['/project/login.py']},
+                                  TEST_HASHES: {'test_user.py::test_login': '286591afcdf99594b07d89861ffa189f8195b265'}})
+    assert configuration.get_test_dependencies('test_user.py', 'test_login') is None, \
+        'The journal should not change the loaded configuration'
+    configuration.close()
+    with open(get_journal_path(tmp_path / file_name), 'a') as file:
+        file.write('{"dependencies": {"test_user.py::test_log')
+
+    configuration = EkstaziConfiguration(tmp_path / file_name)
+    assert_configuration(configuration)
+    assert configuration.get_test_dependencies('test_user.py', 'test_login') == {'/project/login.py'}, \
+        'The journal should be replayed, skipping the incomplete line'
+    assert configuration.get_dependent_tests('/project/login.py') == {'test_user.py::test_login'}
+    configuration.save()
+    configuration.close()
+    assert not get_journal_path(tmp_path / file_name).exists(), 'The journal should be removed when saving'
+
+    configuration = EkstaziConfiguration(tmp_path / file_name)
+    assert configuration.get_test_hash('test_user.py', 'test_login') == '286591afcdf99594b07d89861ffa189f8195b265'
+    configuration.close()
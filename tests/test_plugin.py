@@ -1,4 +1,10 @@
+import os
+import json
+import sys
+import subprocess
+import hashlib
 import pathlib
+import importlib.util
 
 import pytest
 
@@ -6,9 +12,15 @@ from pytest_ekstazi.plugin import DEFAULT_CONFIG_FILE
 from pytest_ekstazi.config import EkstaziConfiguration
 
 from .constants import CUSTOM_CONFIGURATION_FILE, DEFAULT_PYTEST_OPTIONS, CONFIGURATION_FILE_OPTIONS, \
-    TESTING_PROJECT_TEST_ROOT, XFAIL_TEST_CASES, TESTING_PROJECT_ROOT
+    TESTING_PROJECT_TEST_ROOT, XFAIL_TEST_CASES, TESTING_PROJECT_ROOT, BINARY_CONFIGURATION_FILE, \
+    BINARY_CONFIGURATION_FILE_OPTIONS
 from .utils import run_pytest, extract_pytest_results, extract_test_case_results, TestResult, edit_file_content
 
+TEST_CASES = ['test_assert.py::test_assert_false', 'test_assert.py::test_assert_passed',
+              'test_code_readers.py::test_read_qr_code', 'test_code_readers.py::test_read_barcode',
+              'test_product.py::test_product_access_level', 'test_product.py::test_delete_product',
+              'test_product.py::test_insert_product', 'test_product.py::test_unauthorized_access']
+
 
 def test_pytest_ekstazi_flag(project_test_cases):
     """
@@ -48,10 +60,28 @@ def test_pytest_ekstazi_flag(project_test_cases):
         'Configuration file should be created when the plugin is enabled and the execution has finished'
 
     results = extract_pytest_results(output)
-    assert results and all(test_result in (TestResult.SKIPPED, TestResult.XFAILED) for test_result in results), \
+    assert results and all(test_result in (TestResult.DESELECTED, TestResult.XFAILED) for test_result in results), \
         'The second execution in pytest with the plugin enabled shuold select no test cases (no test dependency has changed)'
     
 
+def test_plugin_import():
+    """
+    The hook module of the plugin should only register the options, the plugin and its dependencies
+    should be imported when the plugin is enabled.
+    """
+    script = 'import sys, pytest\n' \
+             'pytest.main(sys.argv[1:] + ["-q", "--collect-only", "-p", "no:cacheprovider"])\n' \
+             'print(sorted(m for m in sys.modules if m.startswith("pytest_ekstazi")))\n'
+    process = subprocess.run([sys.executable, '-c', script], stdout=subprocess.PIPE, universal_newlines=True,
+                             cwd=TESTING_PROJECT_TEST_ROOT, timeout=30)
+    assert process.stdout.splitlines()[-1] == str(['pytest_ekstazi', 'pytest_ekstazi.plugin']), \
+        'The plugin should not be imported when it is not enabled'
+
+    process = subprocess.run([sys.executable, '-c', script, '--ekstazi', '--no-ekstazi-selection'], stdout=subprocess.PIPE,
+                             universal_newlines=True, cwd=TESTING_PROJECT_TEST_ROOT, timeout=30)
+    assert 'pytest_ekstazi.core' in process.stdout.splitlines()[-1], 'The plugin should be imported when it is enabled'
+
+
 @pytest.mark.parametrize('pytest_options', [DEFAULT_PYTEST_OPTIONS, CONFIGURATION_FILE_OPTIONS])
 def test_save_test_dependencies(pytest_options):
     """
@@ -141,16 +171,14 @@ def test_save_test_dependencies_hashes(pytest_options, project_test_cases):
         results = extract_test_case_results(output)
         used_test_case = 'test_code_readers.py::test_read_qr_code'
         failed_test_cases = ['test_code_readers.py::test_read_barcode']
-        skipped_test_cases = list(project_test_cases)
-        skipped_test_cases.remove(used_test_case)
+        deselected_test_cases = list(project_test_cases)
+        deselected_test_cases.remove(used_test_case)
         for xfail_test_case in XFAIL_TEST_CASES:
-            skipped_test_cases.remove(xfail_test_case)
-        assert set(results.keys()) == project_test_cases, 'Some test cases was not selected'
+            deselected_test_cases.remove(xfail_test_case)
+        assert set(results.keys()) == project_test_cases - set(deselected_test_cases), 'The other test cases should be deselected'
         assert all(results[test] == TestResult.XFAIL for test in XFAIL_TEST_CASES if test not in failed_test_cases), 'Test cases dependent of modified files did not run again'
         assert all(results[test] == TestResult.FAILED for test in failed_test_cases), 'Test cases dependent of modified files did not failed again'
         assert results[used_test_case] == TestResult.PASSED, 'The edit test case should pass after being changed'
-        assert all(result == TestResult.SKIPPED for test, result in results.items() if test in skipped_test_cases), \
-            'The other test cases should be marked as skipped'
 
     configuration = EkstaziConfiguration(configuration_file)
     
@@ -164,7 +192,7 @@ def test_save_test_dependencies_hashes(pytest_options, project_test_cases):
 def test_save_test_hashes(pytest_options):
     """
     The plugin should save each test hash in the configuration file at end of the test sesssion. The hash of a test case is
-    the hash of whole file + its content. 
+    the fingerprint of the code of the test function and of its fixtures, so it is the same in the next executions.
     """
     run_pytest(pytest_options)
 
@@ -173,24 +201,18 @@ def test_save_test_hashes(pytest_options):
         configuration_file = CUSTOM_CONFIGURATION_FILE
     
     configuration_file = TESTING_PROJECT_ROOT / 'tests' / configuration_file
-    expected_test_hashes = {
-        'test_assert.py::test_assert_false': '9d9b0600bb562b97148debeb8335f94f365380c3',
-        'test_assert.py::test_assert_passed': 'bd36527867ab74ebf6c5425a5e337fdaaee22078',
-        'test_code_readers.py::test_read_qr_code': '2c18c1bc2b1cead94a664cfa1a5e0996efc79b4f',
-        'test_code_readers.py::test_read_barcode': '6ef94e6263e3db18f4c2a6fd79c1314eb06e75c2',
-        'test_product.py::test_product_access_level': '286591afcdf99594b07d89861ffa189f8195b265',
-        'test_product.py::test_delete_product': 'db3636144e35d2a4b52f3d059bf56df324b848aa',
-        'test_product.py::test_insert_product': 'ec454c82648d1ebbf8ecddbff0ceea6492a815aa',
-        'test_product.py::test_unauthorized_access': '57f6a1a7d13628228209553abd5458898b369388'
-    }
+    configuration = EkstaziConfiguration(configuration_file)
+    test_hashes = {test_case: configuration.get_test_hash(*test_case.split('::', 1)) for test_case in TEST_CASES}
+    assert all(test_hash is not None and len(test_hash) == 40 for test_hash in test_hashes.values()), \
+        'The hash of every test case should be saved'
+    assert len(set(test_hashes.values())) == len(test_hashes), 'The test cases with different code should have different hashes'
 
+    # the fingerprints are saved with the test module hashes, and used again while the test modules are the same
+    run_pytest(pytest_options + ['--no-ekstazi-selection'])
     configuration = EkstaziConfiguration(configuration_file)
-    for test_case in expected_test_hashes:
-        test_file, test_name = test_case.split('::', 1)
-        test_file = TESTING_PROJECT_ROOT / 'tests' / test_file
-        test_hash = configuration.get_test_hash(test_file.name, test_name)
-        assert expected_test_hashes[test_case] == test_hash, \
-            f'The test hash of "{test_file.name}" are not right'
+    assert test_hashes == {test_case: configuration.get_test_hash(*test_case.split('::', 1)) for test_case in TEST_CASES}, \
+        'The test hashes should be the same in the next executions'
+
 
 @pytest.mark.parametrize('pytest_options', [DEFAULT_PYTEST_OPTIONS, CONFIGURATION_FILE_OPTIONS])
 def test_save_test_hashes_changes(pytest_options, project_test_cases):
@@ -205,24 +227,8 @@ def test_save_test_hashes_changes(pytest_options, project_test_cases):
         configuration_file = CUSTOM_CONFIGURATION_FILE
     
     configuration_file = TESTING_PROJECT_ROOT / 'tests' / configuration_file
-    expected_test_hashes = {
-        'test_assert.py::test_assert_false': '9d9b0600bb562b97148debeb8335f94f365380c3',
-        'test_assert.py::test_assert_passed': 'bd36527867ab74ebf6c5425a5e337fdaaee22078',
-        'test_code_readers.py::test_read_qr_code': '2c18c1bc2b1cead94a664cfa1a5e0996efc79b4f',
-        'test_code_readers.py::test_read_barcode': '6ef94e6263e3db18f4c2a6fd79c1314eb06e75c2',
-        'test_product.py::test_product_access_level': '286591afcdf99594b07d89861ffa189f8195b265',
-        'test_product.py::test_delete_product': 'db3636144e35d2a4b52f3d059bf56df324b848aa',
-        'test_product.py::test_insert_product': 'ec454c82648d1ebbf8ecddbff0ceea6492a815aa',
-        'test_product.py::test_unauthorized_access': '57f6a1a7d13628228209553abd5458898b369388'
-    }
-
     configuration = EkstaziConfiguration(configuration_file)
-    for test_case in expected_test_hashes:
-        test_file, test_name = test_case.split('::', 1)
-        test_file = TESTING_PROJECT_ROOT / 'tests' / test_file
-        test_hash = configuration.get_test_hash(test_file.name, test_name)
-        assert expected_test_hashes[test_case] == test_hash, \
-            f'The test hash of "{test_file.name}" are not right'
+    test_hashes = {test_case: configuration.get_test_hash(*test_case.split('::', 1)) for test_case in TEST_CASES}
     
     test_code_readers = TESTING_PROJECT_ROOT / 'tests' / 'test_code_readers.py'
     test_code_readers_content = ''
@@ -240,22 +246,23 @@ def test_save_test_hashes_changes(pytest_options, project_test_cases):
         output = run_pytest(pytest_options)[1]
         results = extract_test_case_results(output)
         edited_test_case = 'test_code_readers.py::test_read_qr_code'
-        skipped_test_cases = list(project_test_cases)
-        skipped_test_cases.remove(edited_test_case)
+        deselected_test_cases = list(project_test_cases)
+        deselected_test_cases.remove(edited_test_case)
         
         for xfail_test_case in XFAIL_TEST_CASES:
-            skipped_test_cases.remove(xfail_test_case)
+            deselected_test_cases.remove(xfail_test_case)
         
-        assert set(results.keys()) == project_test_cases, 'Some test cases was not selected'
+        assert set(results.keys()) == project_test_cases - set(deselected_test_cases), 'The other test cases should be deselected'
         assert all(results[test] == TestResult.XFAIL for test in XFAIL_TEST_CASES), 'Test cases dependent of modified files did not run again'
         assert results[edited_test_case] == TestResult.PASSED, 'The edit test case should pass after being changed'
-        assert all(result == TestResult.SKIPPED for test, result in results.items() if test in skipped_test_cases), \
-            'The other test cases should be marked as skipped'
     
-        expected_test_hashes['test_code_readers.py::test_read_qr_code'] = '9d3f2b462862ed8f1932a0b59d446ab60ac28f1b'
         configuration = EkstaziConfiguration(configuration_file)
-        test_hash = configuration.get_test_hash('test_code_readers.py', 'test_read_qr_code')
-        assert expected_test_hashes[edited_test_case] == test_hash, f'The test hash has not changed correctly'
+        for test_case, test_hash in test_hashes.items():
+            if test_case == edited_test_case:
+                assert configuration.get_test_hash(*test_case.split('::', 1)) != test_hash, 'The test hash has not changed'
+            else:
+                assert configuration.get_test_hash(*test_case.split('::', 1)) == test_hash, \
+                    'The hash of the test cases that have not changed should be the same'
     
 
 @pytest.mark.parametrize('pytest_options', [DEFAULT_PYTEST_OPTIONS, CONFIGURATION_FILE_OPTIONS])
@@ -327,45 +334,39 @@ def test_save_test_results_changes(pytest_options, project_test_cases):
         output = run_pytest(pytest_options)[1]
         results = extract_test_case_results(output)
         failed_tests = ['test_code_readers.py::test_read_qr_code', 'test_code_readers.py::test_read_barcode']
-        assert set(results.keys()) == project_test_cases, 'Some test cases was not selected'
+        assert set(results.keys()) == set(failed_tests + XFAIL_TEST_CASES), 'The other test cases should be deselected'
         assert all(results[test] == TestResult.FAILED for test in failed_tests), 'Test cases dependent of modified files did not run again'
         assert all(results[test] == TestResult.XFAIL for test in XFAIL_TEST_CASES if test not in failed_tests), 'Test cases was not marked as xfail'
-        assert all(result == TestResult.SKIPPED for test, result in results.items() if test not in XFAIL_TEST_CASES and test not in failed_tests), \
-        'The other test cases should be marked as skipped'
     
         expected_test_results['test_code_readers.py::test_read_qr_code'] = 'failed'
 
         configuration = EkstaziConfiguration(configuration_file)
         test_result = configuration.get_last_test_result('test_code_readers.py', 'test_read_qr_code')
-        assert expected_test_results['test_code_readers.py::test_read_qr_code'] == test_result, f'The test result has not changed correctly'
+        assert expected_test_results['test_code_readers.py::test_read_qr_code'] == test_result, 'The test result has not changed correctly'
 
 
 @pytest.mark.parametrize('pytest_options', [DEFAULT_PYTEST_OPTIONS, CONFIGURATION_FILE_OPTIONS])
 def test_select_test_cases(pytest_options, project_test_cases):
     """
     The plugin should just run the test cases that have their dependencies updated.
-    The other tests should be skipped.
+    The other tests should be deselected.
     """
     output = run_pytest(pytest_options)[1]
     assert set(extract_test_case_results(output).keys()) == project_test_cases, 'Some test cases was not selected'
 
     output = run_pytest(pytest_options)[1]
     results = extract_test_case_results(output)
-    assert set(results.keys()) == project_test_cases, 'Some test cases was not selected'
+    assert set(results.keys()) == set(XFAIL_TEST_CASES), 'The other test cases should be deselected'
     assert all(results[test] == TestResult.XFAIL for test in XFAIL_TEST_CASES), 'Test cases was not marked as xfail'
-    assert all(result == TestResult.SKIPPED for test, result in results.items() if test not in XFAIL_TEST_CASES), \
-        'The other test cases should be marked as skipped'
 
     new_content = 'def read_qrcode(im_array):\n    return len(im_array) / 3\n\ndef read_barcode(im_array):\n    return len(im_array) / 2\n'
     with edit_file_content(TESTING_PROJECT_ROOT / 'project' / 'readers.py', new_content):
         output = run_pytest(pytest_options)[1]
         results = extract_test_case_results(output)
         failed_tests = ['test_code_readers.py::test_read_qr_code', 'test_code_readers.py::test_read_barcode']
-        assert set(results.keys()) == project_test_cases, 'Some test cases was not selected'
+        assert set(results.keys()) == set(failed_tests + XFAIL_TEST_CASES), 'The other test cases should be deselected'
         assert all(results[test] == TestResult.FAILED for test in failed_tests), 'Test cases dependent of modified files did not run again'
         assert all(results[test] == TestResult.XFAIL for test in XFAIL_TEST_CASES if test not in failed_tests), 'Test cases was not marked as xfail'
-        assert all(result == TestResult.SKIPPED for test, result in results.items() if test not in XFAIL_TEST_CASES and test not in failed_tests), \
-        'The other test cases should be marked as skipped'
 
 
 @pytest.mark.parametrize('pytest_options', [DEFAULT_PYTEST_OPTIONS, CONFIGURATION_FILE_OPTIONS])
@@ -376,10 +377,8 @@ def test_select_changed_test_cases(pytest_options, project_test_cases):
     
     output = run_pytest(pytest_options)[1]
     results = extract_test_case_results(output)
-    assert set(results.keys()) == project_test_cases, 'Some test cases was not selected'
+    assert set(results.keys()) == set(XFAIL_TEST_CASES), 'The other test cases should be deselected'
     assert all(results[test] == TestResult.XFAIL for test in XFAIL_TEST_CASES), 'Test cases was not marked as xfail'
-    assert all(result == TestResult.SKIPPED for test, result in results.items() if test not in XFAIL_TEST_CASES), \
-        'The other test cases should be marked as skipped'
 
     new_content = 'from project.readers import read_qrcode, read_barcode\n\n\ndef test_read_qr_code():\n    assert read_qrcode([1, 2, 3]) == 3\n    assert read_qrcode([1, 2, 3, 4]) == 4\n\n\ndef test_read_barcode():\n    assert read_barcode([0, 1, 0, 1]) == 2\n\n'
     with edit_file_content(TESTING_PROJECT_ROOT / 'tests' / 'test_code_readers.py', new_content):
@@ -387,14 +386,12 @@ def test_select_changed_test_cases(pytest_options, project_test_cases):
         results = extract_test_case_results(output)
         edited_test_case = 'test_code_readers.py::test_read_barcode'
         xfail_test_cases = ['test_assert.py::test_assert_false']
-        skipped_test_cases = list(project_test_cases)
-        skipped_test_cases.remove(edited_test_case)
-        skipped_test_cases.remove(xfail_test_cases[0])
-        assert set(results.keys()) == project_test_cases, 'Some test cases was not selected'
+        deselected_test_cases = list(project_test_cases)
+        deselected_test_cases.remove(edited_test_case)
+        deselected_test_cases.remove(xfail_test_cases[0])
+        assert set(results.keys()) == project_test_cases - set(deselected_test_cases), 'The other test cases should be deselected'
         assert all(results[test] == TestResult.XFAIL for test in xfail_test_cases), 'Test cases dependent of modified files did not run again'
         assert results[edited_test_case] == TestResult.PASSED, 'The edit test case should pass after being changed'
-        assert all(result == TestResult.SKIPPED for test, result in results.items() if test in skipped_test_cases), \
-            'The other test cases should be marked as skipped'
 
 @pytest.mark.parametrize('pytest_options', [DEFAULT_PYTEST_OPTIONS, CONFIGURATION_FILE_OPTIONS])
 def test_select_arguments_changed_test_cases(pytest_options, project_test_cases):
@@ -404,10 +401,8 @@ def test_select_arguments_changed_test_cases(pytest_options, project_test_cases)
     
     output = run_pytest(pytest_options)[1]
     results = extract_test_case_results(output)
-    assert set(results.keys()) == project_test_cases, 'Some test cases was not selected'
+    assert set(results.keys()) == set(XFAIL_TEST_CASES), 'The other test cases should be deselected'
     assert all(results[test] == TestResult.XFAIL for test in XFAIL_TEST_CASES), 'Test cases was not marked as xfail'
-    assert all(result == TestResult.SKIPPED for test, result in results.items() if test not in XFAIL_TEST_CASES), \
-        'The other test cases should be marked as skipped'
 
     test_product = TESTING_PROJECT_ROOT / 'tests' / 'test_product.py'
     test_product_content = ''
@@ -422,15 +417,13 @@ def test_select_arguments_changed_test_cases(pytest_options, project_test_cases)
         output = run_pytest(pytest_options)[1]
         results = extract_test_case_results(output)
         edited_test_case = 'test_product.py::test_unauthorized_access'
-        skipped_test_cases = list(project_test_cases)
-        skipped_test_cases.remove(edited_test_case)
+        deselected_test_cases = list(project_test_cases)
+        deselected_test_cases.remove(edited_test_case)
         for xfail_test_case in XFAIL_TEST_CASES:
-            skipped_test_cases.remove(xfail_test_case)
-        assert set(results.keys()) == project_test_cases, 'Some test cases was not selected'
+            deselected_test_cases.remove(xfail_test_case)
+        assert set(results.keys()) == project_test_cases - set(deselected_test_cases), 'The other test cases should be deselected'
         assert all(results[test] == TestResult.XFAIL for test in XFAIL_TEST_CASES), 'Test cases dependent of modified files did not run again'
         assert results[edited_test_case] == TestResult.PASSED, 'The edit test case should pass after being changed'
-        assert all(result == TestResult.SKIPPED for test, result in results.items() if test in skipped_test_cases), \
-            'The other test cases should be marked as skipped'
 
 @pytest.mark.parametrize('pytest_options', [DEFAULT_PYTEST_OPTIONS, CONFIGURATION_FILE_OPTIONS])
 def test_select_fixture_steps_changed_test_cases(pytest_options, project_test_cases):
@@ -440,10 +433,8 @@ def test_select_fixture_steps_changed_test_cases(pytest_options, project_test_ca
 
     output = run_pytest(pytest_options)[1]
     results = extract_test_case_results(output)
-    assert set(results.keys()) == project_test_cases, 'Some test cases was not selected'
+    assert set(results.keys()) == set(XFAIL_TEST_CASES), 'The other test cases should be deselected'
     assert all(results[test] == TestResult.XFAIL for test in XFAIL_TEST_CASES), 'Test cases was not marked as xfail'
-    assert all(result == TestResult.SKIPPED for test, result in results.items() if test not in XFAIL_TEST_CASES), \
-        'The other test cases should be marked as skipped'
 
     conftest = TESTING_PROJECT_ROOT / 'tests' / 'conftest.py'
     conftest_content = ''
@@ -458,20 +449,18 @@ def test_select_fixture_steps_changed_test_cases(pytest_options, project_test_ca
         output = run_pytest(pytest_options)[1]
         results = extract_test_case_results(output)
         edited_test_case = 'test_product.py::test_unauthorized_access'
-        skipped_test_cases = list(project_test_cases)
-        skipped_test_cases.remove(edited_test_case)
+        deselected_test_cases = list(project_test_cases)
+        deselected_test_cases.remove(edited_test_case)
         for xfail_test_case in XFAIL_TEST_CASES:
-            skipped_test_cases.remove(xfail_test_case)
-        assert set(results.keys()) == project_test_cases, 'Some test cases was not selected'
+            deselected_test_cases.remove(xfail_test_case)
+        assert set(results.keys()) == project_test_cases - set(deselected_test_cases), 'The other test cases should be deselected'
         assert all(results[test] == TestResult.XFAIL for test in XFAIL_TEST_CASES), 'Test cases dependent of modified files did not run again'
         assert results[edited_test_case] == TestResult.PASSED, 'The edit test case should pass after being changed'
-        assert all(result == TestResult.SKIPPED for test, result in results.items() if test in skipped_test_cases), \
-            'The other test cases should be marked as skipped'
 
 @pytest.mark.parametrize('pytest_options', [DEFAULT_PYTEST_OPTIONS, CONFIGURATION_FILE_OPTIONS])
 def test_xfail_cached_failed_test_cases(pytest_options, project_test_cases):
     """
-    The plugin shuold mark as xfail test cases would be skipped due no dependency changes or test itself 
+    The plugin shuold mark as xfail test cases would be deselected due no dependency changes or test itself 
     or fixture changes, but it has failed in previous execution.
     """
     output = run_pytest(pytest_options)[1]
@@ -483,10 +472,8 @@ def test_xfail_cached_failed_test_cases(pytest_options, project_test_cases):
 
     output = run_pytest(pytest_options)[1]
     results = extract_test_case_results(output)
-    assert set(results.keys()) == project_test_cases, 'Some test cases was not selected'
+    assert set(results.keys()) == set(XFAIL_TEST_CASES), 'The other test cases should be deselected'
     assert all(results[test] == TestResult.XFAIL for test in XFAIL_TEST_CASES), 'Test cases was not marked as xfail'
-    assert all(result == TestResult.SKIPPED for test, result in results.items() if test not in XFAIL_TEST_CASES), \
-        'The other test cases should be marked as skipped'
 
 @pytest.mark.parametrize('pytest_options', [DEFAULT_PYTEST_OPTIONS, CONFIGURATION_FILE_OPTIONS])
 def test_no_ekstazi_selection_option(pytest_options, project_test_cases):
@@ -498,10 +485,8 @@ def test_no_ekstazi_selection_option(pytest_options, project_test_cases):
 
     output = run_pytest(pytest_options)[1]
     results = extract_test_case_results(output)
-    assert set(results.keys()) == project_test_cases, 'Some test cases was not selected'
+    assert set(results.keys()) == set(XFAIL_TEST_CASES), 'The other test cases should be deselected'
     assert all(results[test] == TestResult.XFAIL for test in XFAIL_TEST_CASES), 'Test cases was not marked as xfail'
-    assert all(result == TestResult.SKIPPED for test, result in results.items() if test not in XFAIL_TEST_CASES), \
-        'The other test cases should be marked as skipped'
     
     output = run_pytest(pytest_options + ['--no-ekstazi-selection'])[1]
     results = extract_test_case_results(output)
@@ -546,15 +531,13 @@ def test_save_new_test_dependency(pytest_options, project_test_cases):
         output = run_pytest(pytest_options)[1]
         results = extract_test_case_results(output)
         edited_test_case = 'test_code_readers.py::test_read_qr_code'
-        skipped_test_cases = list(project_test_cases)
-        skipped_test_cases.remove(edited_test_case)
+        deselected_test_cases = list(project_test_cases)
+        deselected_test_cases.remove(edited_test_case)
         for xfail_test_case in XFAIL_TEST_CASES:
-            skipped_test_cases.remove(xfail_test_case)
-        assert set(results.keys()) == project_test_cases, 'Some test cases was not selected'
+            deselected_test_cases.remove(xfail_test_case)
+        assert set(results.keys()) == project_test_cases - set(deselected_test_cases), 'The other test cases should be deselected'
         assert all(results[test] == TestResult.XFAIL for test in XFAIL_TEST_CASES), 'Test cases dependent of modified files did not run again'
         assert results[edited_test_case] == TestResult.PASSED, 'The edit test case should pass after being changed'
-        assert all(result == TestResult.SKIPPED for test, result in results.items() if test in skipped_test_cases), \
-            'The other test cases should be marked as skipped'
     
 
     configuration = EkstaziConfiguration(configuration_file)
@@ -562,3 +545,581 @@ def test_save_new_test_dependency(pytest_options, project_test_cases):
     expected_test_dependencies = [str(TESTING_PROJECT_ROOT / pathlib.Path('project') / 'readers.py'), str(TESTING_PROJECT_ROOT / pathlib.Path('project') / 'database.py')]
     
     assert set(new_test_dependencies) == set(expected_test_dependencies), 'The test dependencies was not updated'
+
+
+@pytest.mark.parametrize('pytest_options', [DEFAULT_PYTEST_OPTIONS, CONFIGURATION_FILE_OPTIONS])
+def test_ignore_unaffected_modules_option(pytest_options, project_test_cases):
+    """
+    The plugin should not collect the test modules whose test cases are all unaffected and have passed
+    in the last execution when --ekstazi-ignore-modules flag is provided.
+    """
+    pytest_options = pytest_options + ['--ekstazi-ignore-modules']
+    run_pytest(pytest_options)
+
+    output = run_pytest(pytest_options)[1]
+    results = extract_test_case_results(output)
+    assert set(results.keys()) == set(XFAIL_TEST_CASES), 'The other test cases should not be selected'
+    assert 'test_product.py' not in output, 'The module with all test cases passed should not be collected'
+
+    product = TESTING_PROJECT_ROOT / 'project' / 'product.py'
+    with open(product) as file:
+        product_content = file.read()
+
+    with edit_file_content(product, product_content + '\n# edited\n'):
+        output = run_pytest(pytest_options)[1]
+        results = extract_test_case_results(output)
+        product_test_cases = {test for test in project_test_cases if test.startswith('test_product.py')}
+        assert set(results.keys()) == product_test_cases | set(XFAIL_TEST_CASES), \
+            'The module with test cases dependent of modified files should be collected again'
+        assert all(results[test] == TestResult.PASSED for test in product_test_cases), \
+            'Test cases dependent of modified files did not run again'
+
+
+@pytest.mark.parametrize('pytest_options', [DEFAULT_PYTEST_OPTIONS, CONFIGURATION_FILE_OPTIONS])
+def test_module_granularity_option(pytest_options, project_test_cases):
+    """
+    The plugin should save one dependency entry per test module and select the test cases of a module as a whole
+    when --ekstazi-granularity=module is provided.
+    """
+    pytest_options = pytest_options + ['--ekstazi-granularity', 'module']
+    run_pytest(pytest_options)
+
+    configuration_file = DEFAULT_CONFIG_FILE
+    if CUSTOM_CONFIGURATION_FILE in pytest_options:
+        configuration_file = CUSTOM_CONFIGURATION_FILE
+
+    configuration = EkstaziConfiguration(TESTING_PROJECT_ROOT / 'tests' / configuration_file)
+    test_dependencies = configuration.get_test_dependencies('test_product.py', '<module>')
+    expected_test_dependencies = [str(TESTING_PROJECT_ROOT / 'project' / f) for f in ('database.py', 'access_level.py', 'product.py', 'user.py')]
+    assert set(test_dependencies) == set(expected_test_dependencies), 'The module dependencies are not right'
+    assert configuration.get_test_dependencies('test_product.py', 'test_insert_product') is None, \
+        'No dependency should be saved per test function'
+
+    output = run_pytest(pytest_options)[1]
+    results = extract_test_case_results(output)
+    assert set(results.keys()) == set(XFAIL_TEST_CASES), 'The other test cases should be deselected'
+
+    user = TESTING_PROJECT_ROOT / 'project' / 'user.py'
+    with open(user) as file:
+        user_content = file.read()
+
+    with edit_file_content(user, user_content + '\n# edited\n'):
+        output = run_pytest(pytest_options)[1]
+        results = extract_test_case_results(output)
+        product_test_cases = {test for test in project_test_cases if test.startswith('test_product.py')}
+        assert set(results.keys()) == product_test_cases | set(XFAIL_TEST_CASES), \
+            'All test cases of the module dependent of modified files should run again'
+        assert all(results[test] == TestResult.PASSED for test in product_test_cases), \
+            'Test cases dependent of modified files did not run again'
+
+
+@pytest.mark.skipif(sys.version_info < (3, 11), reason='Function dependencies require co_qualname (Python 3.11+)')
+@pytest.mark.parametrize('pytest_options', [DEFAULT_PYTEST_OPTIONS, CONFIGURATION_FILE_OPTIONS])
+def test_function_dependency_granularity_option(pytest_options, project_test_cases):
+    """
+    The plugin should just select the test cases that used the changed functions of a dependency file
+    when --ekstazi-dependency-granularity=function is provided.
+    """
+    pytest_options = pytest_options + ['--ekstazi-dependency-granularity', 'function']
+    run_pytest(pytest_options)
+
+    output = run_pytest(pytest_options)[1]
+    results = extract_test_case_results(output)
+    assert set(results.keys()) == set(XFAIL_TEST_CASES), 'The other test cases should be deselected'
+
+    database = TESTING_PROJECT_ROOT / 'project' / 'database.py'
+    with open(database) as file:
+        database_content = file.readlines()
+
+    # Edit the body of Database.search_products_by_name (line 61)
+    database_content[60] = '        # edited\n' + database_content[60]
+    edited_database_content = ''.join(database_content)
+
+    with edit_file_content(database, edited_database_content):
+        output = run_pytest(pytest_options)[1]
+        results = extract_test_case_results(output)
+        edited_test_case = 'test_product.py::test_insert_product'
+        assert set(results.keys()) == {edited_test_case} | set(XFAIL_TEST_CASES), \
+            'Just the test cases that used the edited function should be selected'
+        assert results[edited_test_case] == TestResult.PASSED, 'The test case should pass after being changed'
+
+
+@pytest.mark.parametrize('pytest_options', [DEFAULT_PYTEST_OPTIONS, CONFIGURATION_FILE_OPTIONS])
+def test_trust_mtime_option(pytest_options, project_test_cases):
+    """
+    The plugin should not read again the dependency files whose modification time, size and inode have not changed,
+    unless --ekstazi-paranoid is provided.
+    """
+    readers = TESTING_PROJECT_ROOT / 'project' / 'readers.py'
+    # files modified just before their hash is calculated are always read again (racy-clean)
+    readers_stat = os.stat(readers)
+    os.utime(readers, ns=(readers_stat.st_atime_ns, readers_stat.st_mtime_ns - 60 * 10 ** 9))
+    readers_stat = os.stat(readers)
+
+    run_pytest(pytest_options)
+    with open(readers) as file:
+        readers_content = file.read()
+
+    # same size and modification time, just a different content
+    with edit_file_content(readers, readers_content[:-1] + '#'):
+        os.utime(readers, ns=(readers_stat.st_atime_ns, readers_stat.st_mtime_ns))
+
+        output = run_pytest(pytest_options)[1]
+        results = extract_test_case_results(output)
+        assert set(results.keys()) == set(XFAIL_TEST_CASES), \
+            'The files with the same stat signature should not be read again'
+
+        output = run_pytest(pytest_options + ['--ekstazi-paranoid'])[1]
+        results = extract_test_case_results(output)
+        assert 'test_code_readers.py::test_read_qr_code' in results, \
+            'The content of every file should be hashed again with --ekstazi-paranoid'
+
+
+@pytest.mark.parametrize('hash_workers', ['0', '4'])
+def test_hash_workers_option(hash_workers, project_test_cases):
+    """
+    The plugin should select the same test cases hashing the files in the main thread or in a thread pool
+    when --ekstazi-hash-workers is provided.
+    """
+    pytest_options = DEFAULT_PYTEST_OPTIONS + ['--ekstazi-hash-workers', hash_workers]
+    output = run_pytest(pytest_options)[1]
+    assert set(extract_test_case_results(output).keys()) == project_test_cases, 'Some test cases was not selected'
+
+    output = run_pytest(pytest_options)[1]
+    assert set(extract_test_case_results(output).keys()) == set(XFAIL_TEST_CASES), 'The other test cases should be deselected'
+
+    readers = TESTING_PROJECT_ROOT / 'project' / 'readers.py'
+    with open(readers) as file:
+        readers_content = file.read()
+
+    with edit_file_content(readers, readers_content + '\n# edited\n'):
+        output = run_pytest(pytest_options)[1]
+        results = extract_test_case_results(output)
+        readers_test_cases = {test for test in project_test_cases if test.startswith('test_code_readers.py')}
+        assert set(results.keys()) == readers_test_cases | set(XFAIL_TEST_CASES), \
+            'The test cases dependent of the modified file should be selected'
+
+
+def test_negative_hash_workers_option():
+    """A negative number of threads given by --ekstazi-hash-workers should be a usage error"""
+    exit_code, _, stderr = run_pytest(DEFAULT_PYTEST_OPTIONS + ['--ekstazi-hash-workers', '-1'])
+    assert exit_code == pytest.ExitCode.USAGE_ERROR and '--ekstazi-hash-workers' in stderr
+
+
+def test_hash_algorithm_option(project_test_cases):
+    """
+    The plugin should convert the saved hashes when --ekstazi-hash changes the hash algorithm,
+    instead of selecting all test cases again.
+    """
+    output = run_pytest(DEFAULT_PYTEST_OPTIONS)[1]
+    assert set(extract_test_case_results(output).keys()) == project_test_cases, 'Some test cases was not selected'
+
+    pytest_options = DEFAULT_PYTEST_OPTIONS + ['--ekstazi-hash', 'blake2b']
+    output = run_pytest(pytest_options)[1]
+    assert set(extract_test_case_results(output).keys()) == set(XFAIL_TEST_CASES), \
+        'The other test cases should be deselected after changing the hash algorithm'
+
+    configuration = EkstaziConfiguration(TESTING_PROJECT_TEST_ROOT / DEFAULT_CONFIG_FILE)
+    assert configuration.get_hash_algorithm() == 'blake2b', 'The hash algorithm should be saved in the configuration'
+    readers = TESTING_PROJECT_ROOT / 'project' / 'readers.py'
+    assert configuration.get_dependency_hash(readers) == hashlib.blake2b(readers.read_bytes()).hexdigest(), \
+        'The saved hashes should be converted to the new algorithm'
+    configuration.close()
+
+    with edit_file_content(readers, readers.read_text() + '\n# edited\n'):
+        output = run_pytest(pytest_options)[1]
+        results = extract_test_case_results(output)
+        readers_test_cases = {test for test in project_test_cases if test.startswith('test_code_readers.py')}
+        assert set(results.keys()) == readers_test_cases | set(XFAIL_TEST_CASES), \
+            'The test cases dependent of the modified file should be selected'
+
+    exit_code, _, stderr = run_pytest(DEFAULT_PYTEST_OPTIONS + ['--ekstazi-hash', 'unknown'])
+    assert exit_code == pytest.ExitCode.USAGE_ERROR and 'Invalid hash algorithm "unknown"' in stderr, \
+        'An unknown hash algorithm should be a usage error'
+
+
+def test_unavailable_hash_algorithm(project_test_cases):
+    """
+    The plugin should warn and select the test cases whose dependencies can not be checked when the hash algorithm
+    of the configuration file is not available, e.g. a xxHash algorithm without xxhash installed.
+    """
+    run_pytest(DEFAULT_PYTEST_OPTIONS)
+    configuration = EkstaziConfiguration(TESTING_PROJECT_TEST_ROOT / DEFAULT_CONFIG_FILE)
+    configuration.set_hash_algorithm('unavailable')
+    configuration.save()
+
+    exit_code, output, stderr = run_pytest(DEFAULT_PYTEST_OPTIONS + ['--ekstazi-paranoid'])
+    assert 'INTERNALERROR' not in output + stderr
+    assert 'The hash algorithm "unavailable" of the configuration file is not available' in output, \
+        'The unavailable hash algorithm should be reported'
+    readers_test_cases = {test for test in project_test_cases if test.startswith('test_code_readers.py')}
+    assert readers_test_cases <= set(extract_test_case_results(output).keys()), \
+        'The test cases whose dependencies can not be checked should be selected'
+
+
+@pytest.mark.skipif(importlib.util.find_spec('xdist') is None, reason='pytest-xdist is not installed')
+def test_xdist_workers(project_test_cases):
+    """
+    The plugin should save the dependencies traced by all xdist workers at once in the controller,
+    and the workers should select the test cases in the same way.
+    """
+    run_pytest(DEFAULT_PYTEST_OPTIONS)
+    configuration = EkstaziConfiguration(TESTING_PROJECT_TEST_ROOT / DEFAULT_CONFIG_FILE)
+    expected_dependencies = {test_key: set(dependencies) for test_key, dependencies in configuration.items('dependencies')}
+    configuration.close()
+    os.remove(TESTING_PROJECT_TEST_ROOT / DEFAULT_CONFIG_FILE)
+
+    # the tests of a module share a database file, so they run in the same worker
+    pytest_options = DEFAULT_PYTEST_OPTIONS + ['-n', '2', '--dist', 'loadfile']
+    run_pytest(pytest_options)
+    configuration = EkstaziConfiguration(TESTING_PROJECT_TEST_ROOT / DEFAULT_CONFIG_FILE)
+    dependencies = {test_key: set(dependencies) for test_key, dependencies in configuration.items('dependencies')}
+    configuration.close()
+    assert dependencies == expected_dependencies, 'The dependencies of the tests of all workers should be saved'
+
+    output = run_pytest(pytest_options)[1]
+    assert extract_pytest_results(output) == {TestResult.XFAILED: len(XFAIL_TEST_CASES)}, \
+        'The workers should only run the test cases that have failed in the last execution'
+
+
+def test_changed_files_option(project_test_cases):
+    """
+    The plugin should only read the files listed by --ekstazi-changed-files, trusting that the other files
+    have not changed.
+    """
+    run_pytest(DEFAULT_PYTEST_OPTIONS)
+
+    readers = TESTING_PROJECT_ROOT / 'project' / 'readers.py'
+    changed_files = TESTING_PROJECT_TEST_ROOT / 'changed_files.txt'
+    with edit_file_content(readers, readers.read_text() + '\n# edited\n'):
+        try:
+            changed_files.write_text(str(TESTING_PROJECT_ROOT / 'project' / 'user.py') + '\n')
+            output = run_pytest(DEFAULT_PYTEST_OPTIONS + ['--ekstazi-changed-files', str(changed_files)])[1]
+            assert set(extract_test_case_results(output).keys()) == set(XFAIL_TEST_CASES), \
+                'The files not listed as changed should not be read'
+
+            changed_files.write_text('../project/readers.py\n')
+            output = run_pytest(DEFAULT_PYTEST_OPTIONS + ['--ekstazi-changed-files', str(changed_files)])[1]
+            readers_test_cases = {test for test in project_test_cases if test.startswith('test_code_readers.py')}
+            assert set(extract_test_case_results(output).keys()) == readers_test_cases | set(XFAIL_TEST_CASES), \
+                'The test cases dependent of the changed files should be selected'
+        finally:
+            os.remove(changed_files)
+
+
+def test_changed_files_standard_input(project_test_cases):
+    """The changed files should be read from the standard input while pytest captures it (without -s)"""
+    run_pytest(DEFAULT_PYTEST_OPTIONS)
+
+    readers = TESTING_PROJECT_ROOT / 'project' / 'readers.py'
+    with edit_file_content(readers, readers.read_text() + '\n# edited\n'):
+        process = subprocess.run(['pytest'] + DEFAULT_PYTEST_OPTIONS + ['--ekstazi-changed-files', '-', '-v', '.'],
+                                 input='../project/readers.py\n', stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                                 text=True, cwd=TESTING_PROJECT_TEST_ROOT, timeout=30)
+    assert 'INTERNALERROR' not in process.stdout + process.stderr
+    readers_test_cases = {test for test in project_test_cases if test.startswith('test_code_readers.py')}
+    assert set(extract_test_case_results(process.stdout).keys()) == readers_test_cases | set(XFAIL_TEST_CASES), \
+        'The test cases dependent of the changed files read from the standard input should be selected'
+
+
+def test_normalize_option(project_test_cases):
+    """
+    The plugin should not select the test cases when only comments, docstrings or the formatting of their
+    dependencies has changed with --ekstazi-normalize.
+    """
+    output = run_pytest(DEFAULT_PYTEST_OPTIONS + ['--ekstazi-normalize'])[1]
+    assert set(extract_test_case_results(output).keys()) == project_test_cases, 'Some test cases was not selected'
+
+    readers = TESTING_PROJECT_ROOT / 'project' / 'readers.py'
+    with edit_file_content(readers, '"""Readers"""\n# edited\n' + readers.read_text() + '\n\n'):
+        output = run_pytest(DEFAULT_PYTEST_OPTIONS + ['--ekstazi-normalize'])[1]
+        assert set(extract_test_case_results(output).keys()) == set(XFAIL_TEST_CASES), \
+            'The comments, docstrings and formatting should not select the test cases'
+
+        output = run_pytest(DEFAULT_PYTEST_OPTIONS)[1]
+        assert set(extract_test_case_results(output).keys()) == set(XFAIL_TEST_CASES), \
+            'Turning the normalization off should not select the test cases'
+
+    output = run_pytest(DEFAULT_PYTEST_OPTIONS)[1]
+    readers_test_cases = {test for test in project_test_cases if test.startswith('test_code_readers.py')}
+    assert set(extract_test_case_results(output).keys()) == readers_test_cases | set(XFAIL_TEST_CASES), \
+        'Without normalization the restored file should select its dependent test cases'
+
+
+def test_track_reads_option(project_test_cases):
+    """
+    The plugin should not add the files written by the test cases as dependencies with --ekstazi-track-reads,
+    so they do not select the test cases again.
+    """
+    output = run_pytest(DEFAULT_PYTEST_OPTIONS + ['--ekstazi-track-reads'])[1]
+    assert set(extract_test_case_results(output).keys()) == project_test_cases, 'Some test cases was not selected'
+
+    configuration = EkstaziConfiguration(TESTING_PROJECT_TEST_ROOT / DEFAULT_CONFIG_FILE)
+    test_dependencies = configuration.get_test_dependencies('test_product.py', 'test_insert_product')
+    assert not any(dependency.endswith('.json') for dependency in test_dependencies), \
+        'The database file written by the test case should not be a dependency'
+
+    output = run_pytest(DEFAULT_PYTEST_OPTIONS + ['--ekstazi-track-reads'])[1]
+    assert set(extract_test_case_results(output).keys()) == set(XFAIL_TEST_CASES), \
+        'The other test cases should be deselected'
+
+
+def test_parametrize_changes():
+    """
+    The plugin should select a test case when its parameters change, even if their ids are the same,
+    and when the default values of its arguments change.
+    """
+    test_parametrize = TESTING_PROJECT_TEST_ROOT / 'test_parametrize.py'
+    test_content = "import pytest\n\n\n@pytest.mark.parametrize('data', [{'a': 1}])\n" \
+                   "def test_data(data, expected=1):\n    assert data['a'] == expected\n"
+    try:
+        test_parametrize.write_text(test_content)
+        run_pytest(DEFAULT_PYTEST_OPTIONS)
+
+        with edit_file_content(test_parametrize, test_content.replace("{'a': 1}", "{'a': 2}")):
+            output = run_pytest(DEFAULT_PYTEST_OPTIONS)[1]
+            assert extract_test_case_results(output).get('test_parametrize.py::test_data[data0]') == TestResult.FAILED, \
+                'The test case should be selected when its parameters change'
+        run_pytest(DEFAULT_PYTEST_OPTIONS)
+
+        with edit_file_content(test_parametrize, test_content.replace('expected=1', 'expected=2')):
+            output = run_pytest(DEFAULT_PYTEST_OPTIONS)[1]
+            assert extract_test_case_results(output).get('test_parametrize.py::test_data[data0]') == TestResult.FAILED, \
+                'The test case should be selected when the default values of its arguments change'
+    finally:
+        os.remove(test_parametrize)
+
+
+def test_fixture_dependencies_standard_library():
+    """
+    The plugin should only trace the code of the fixtures, not the code of pytest running them, even when the
+    standard library is not ignored (e.g. in a virtual environment, whose sys.prefix does not contain it)
+    """
+    script = 'import sys, pytest\n' \
+             'from pytest_ekstazi import core\n' \
+             'core.EkstaziPytestPlugin._ignore_dirs = [core.SITE_PACKAGES_PATH]\n' \
+             'sys.exit(pytest.main(sys.argv[1:]))\n'
+    subprocess.run([sys.executable, '-c', script] + DEFAULT_PYTEST_OPTIONS + ['-p', 'no:cacheprovider', '.'],
+                   stdout=subprocess.PIPE, stderr=subprocess.PIPE, cwd=TESTING_PROJECT_TEST_ROOT, timeout=30)
+    configuration = EkstaziConfiguration(TESTING_PROJECT_TEST_ROOT / DEFAULT_CONFIG_FILE)
+    dependencies = configuration.get_test_dependencies('test_assert.py', 'test_assert_passed')
+    configuration.close()
+    # the autouse fixture of the testing project uses pathlib
+    expected_prefixes = (str(TESTING_PROJECT_ROOT), os.path.splitext(pathlib.__file__)[0])
+    assert dependencies is not None and all(d.startswith(expected_prefixes) for d in dependencies), \
+        'Only the files used by the fixture should be dependencies, not the ones used by pytest'
+
+
+def test_request_fixture():
+    """The plugin should hash the test cases using the request fixture, which has no fixture definition"""
+    test_request = TESTING_PROJECT_TEST_ROOT / 'test_request.py'
+    try:
+        test_request.write_text("def test_request(request):\n    assert request.node.name == 'test_request'\n")
+        exit_code, output, stderr = run_pytest(DEFAULT_PYTEST_OPTIONS)
+        assert 'INTERNALERROR' not in output + stderr
+        assert extract_test_case_results(output).get('test_request.py::test_request') == TestResult.PASSED
+    finally:
+        os.remove(test_request)
+
+
+def test_parametrize_argument_fixture():
+    """
+    The plugin should hash and select the test cases with a parametrized argument, which is in the fixture names of
+    the test without a fixture definition
+    """
+    test_argument = TESTING_PROJECT_TEST_ROOT / 'test_argument.py'
+    try:
+        test_argument.write_text(
+            "import pytest\n\n\n@pytest.mark.parametrize('argument', [1, 2])\n"
+            "def test_argument(argument):\n    assert argument in (1, 2)\n"
+        )
+        exit_code, output, stderr = run_pytest(DEFAULT_PYTEST_OPTIONS)
+        assert 'INTERNALERROR' not in output + stderr
+        test_results = extract_test_case_results(output)
+        assert test_results.get('test_argument.py::test_argument[1]') == TestResult.PASSED and \
+            test_results.get('test_argument.py::test_argument[2]') == TestResult.PASSED
+        configuration = EkstaziConfiguration(TESTING_PROJECT_TEST_ROOT / DEFAULT_CONFIG_FILE)
+        assert configuration.get_test_dependencies('test_argument.py', 'test_argument') is not None, \
+            'The parametrized test case should have been hashed'
+        configuration.close()
+
+        exit_code, output, stderr = run_pytest(DEFAULT_PYTEST_OPTIONS)
+        assert 'INTERNALERROR' not in output + stderr
+        assert not any(test.startswith('test_argument.py') for test in extract_test_case_results(output)), \
+            'The unchanged parametrized test cases should not be selected'
+    finally:
+        os.remove(test_argument)
+
+
+def test_fixture_dependencies(project_test_cases):
+    """
+    The plugin should add the code called in the setup and teardown of the fixtures to the dependencies of the tests
+    that use them, and select those tests when that code changes.
+    """
+    conftest = TESTING_PROJECT_TEST_ROOT / 'conftest.py'
+    fixture_content = conftest.read_text().replace(
+        "@pytest.fixture\ndef dummy_fixture():\n    return 'I do nothing'",
+        "@pytest.fixture(scope='session')\ndef dummy_fixture():\n"
+        "    yield 'I do nothing'\n    from project.readers import read_qrcode\n    read_qrcode([])\n"
+    )
+    with edit_file_content(conftest, fixture_content):
+        run_pytest(DEFAULT_PYTEST_OPTIONS)
+        configuration = EkstaziConfiguration(TESTING_PROJECT_TEST_ROOT / DEFAULT_CONFIG_FILE)
+        test_dependencies = configuration.get_test_dependencies('test_product.py', 'test_unauthorized_access')
+        assert str(TESTING_PROJECT_ROOT / 'project' / 'readers.py') in test_dependencies, \
+            'The code called in the fixture teardown should be a dependency'
+        assert configuration.get_test_dependencies('test_product.py', 'test_insert_product') >= \
+            {str(TESTING_PROJECT_ROOT / 'project' / 'database.py')}, 'The tests dependencies are not right'
+        assert str(TESTING_PROJECT_ROOT / 'project' / 'readers.py') not in \
+            configuration.get_test_dependencies('test_product.py', 'test_insert_product'), \
+            'The fixture dependencies should only be added to the tests using the fixture'
+
+        readers = TESTING_PROJECT_ROOT / 'project' / 'readers.py'
+        with edit_file_content(readers, readers.read_text() + '\n# edited\n'):
+            output = run_pytest(DEFAULT_PYTEST_OPTIONS)[1]
+        readers_test_cases = {test for test in project_test_cases if test.startswith('test_code_readers.py')}
+        assert set(extract_test_case_results(output).keys()) == \
+            readers_test_cases | set(XFAIL_TEST_CASES) | {'test_product.py::test_unauthorized_access'}, \
+            'The tests using the fixture should be selected'
+
+
+def test_interrupted_session(project_test_cases):
+    """
+    The plugin should keep the dependencies of the tests that have finished when the session is interrupted
+    before the configuration file is saved, and save them in the next session.
+    """
+    conftest = TESTING_PROJECT_TEST_ROOT / 'conftest.py'
+    interrupted_conftest = conftest.read_text() + \
+        '\n\n@pytest.hookimpl(tryfirst=True)\ndef pytest_sessionfinish():\n    os._exit(1)\n'
+    with edit_file_content(conftest, interrupted_conftest):
+        run_pytest(DEFAULT_PYTEST_OPTIONS)
+    configuration_file = TESTING_PROJECT_TEST_ROOT / DEFAULT_CONFIG_FILE
+    journal_file = TESTING_PROJECT_TEST_ROOT / (DEFAULT_CONFIG_FILE + '.journal')
+    assert not configuration_file.exists(), 'The configuration file should not be saved'
+    assert journal_file.exists(), 'The finished tests should be in the journal'
+
+    output = run_pytest(DEFAULT_PYTEST_OPTIONS)[1]
+    assert set(extract_test_case_results(output).keys()) == set(XFAIL_TEST_CASES), \
+        'The tests finished in the interrupted session should be deselected'
+    assert not journal_file.exists(), 'The journal should be removed once it has been saved'
+
+
+def test_reorder_option(project_test_cases):
+    """
+    The plugin should run first the tests that have failed, then the tests whose code has changed and then the tests
+    affected by their dependencies with --ekstazi-reorder.
+    """
+    run_pytest(DEFAULT_PYTEST_OPTIONS)
+
+    readers = TESTING_PROJECT_ROOT / 'project' / 'readers.py'
+    test_product = TESTING_PROJECT_TEST_ROOT / 'test_product.py'
+    docstring = '    Non-logged user should not be able to do any action in the database\n    """\n'
+    with edit_file_content(readers, readers.read_text() + '\n# edited\n'), \
+            edit_file_content(test_product, test_product.read_text().replace(docstring, docstring + '    assert True\n')):
+        output = run_pytest(DEFAULT_PYTEST_OPTIONS + ['--ekstazi-reorder'])[1]
+    assert list(extract_test_case_results(output).keys()) == [
+        'test_code_readers.py::test_read_barcode', 'test_product.py::test_unauthorized_access',
+        'test_code_readers.py::test_read_qr_code', 'test_assert.py::test_assert_false'
+    ], 'The test cases should be ordered by their last result and by what has changed'
+
+
+def test_budget_option(project_test_cases):
+    """
+    The plugin should defer the affected test cases that do not fit in the time budget of --ekstazi-budget,
+    and select them in the next execution.
+    """
+    run_pytest(DEFAULT_PYTEST_OPTIONS)
+
+    readers = TESTING_PROJECT_ROOT / 'project' / 'readers.py'
+    with edit_file_content(readers, readers.read_text() + '\n# edited\n'):
+        output = run_pytest(DEFAULT_PYTEST_OPTIONS + ['--ekstazi-budget', '0'])[1]
+    assert set(extract_test_case_results(output).keys()) == set(XFAIL_TEST_CASES), \
+        'Only the test case that has failed should run in the budget'
+    assert 'ekstazi: 1 affected test cases deferred by the time budget of 0.0s' in output, \
+        'The deferred test cases should be reported'
+
+    output = run_pytest(DEFAULT_PYTEST_OPTIONS)[1]
+    assert set(extract_test_case_results(output).keys()) == \
+        {'test_code_readers.py::test_read_qr_code'} | set(XFAIL_TEST_CASES), 'The deferred test case should be selected'
+
+    output = run_pytest(DEFAULT_PYTEST_OPTIONS)[1]
+    assert set(extract_test_case_results(output).keys()) == set(XFAIL_TEST_CASES), \
+        'The deferred test case should not be pending after it has run'
+
+
+def test_budget_parametrized_tests():
+    """
+    The plugin should charge each parametrized test case its own duration, and report the number of
+    deferred test cases.
+    """
+    test_sleep = TESTING_PROJECT_TEST_ROOT / 'test_sleep.py'
+    test_content = "import time\n\nimport pytest\n\n\n@pytest.mark.parametrize('value', [1, 2, 3])\n" \
+                   "def test_sleep(value):\n    time.sleep(0.2)\n    assert value > 0\n"
+    test_cases = ['test_sleep.py::test_sleep[{}]'.format(value) for value in (1, 2, 3)]
+    try:
+        test_sleep.write_text(test_content)
+        run_pytest(DEFAULT_PYTEST_OPTIONS)
+
+        with edit_file_content(test_sleep, test_content.replace('value > 0', 'value >= 0')):
+            output = run_pytest(DEFAULT_PYTEST_OPTIONS + ['--ekstazi-budget', '1'])[1]
+            assert set(test_cases) <= set(extract_test_case_results(output).keys()), \
+                'The parametrized test cases should fit in the budget'
+        with edit_file_content(test_sleep, test_content.replace('value > 0', 'value > -1')):
+            output = run_pytest(DEFAULT_PYTEST_OPTIONS + ['--ekstazi-budget', '0.3'])[1]
+            assert 'ekstazi: 2 affected test cases deferred by the time budget of 0.3s' in output, \
+                'The deferred parametrized test cases should be counted'
+    finally:
+        os.remove(test_sleep)
+
+
+def test_profile_option(project_test_cases):
+    """
+    The plugin should show the timers and counters of its phases with --ekstazi-profile and write them to a JSON file
+    """
+    profile_file = TESTING_PROJECT_TEST_ROOT / 'profile.json'
+    try:
+        output = run_pytest(DEFAULT_PYTEST_OPTIONS + ['--ekstazi-profile', str(profile_file)])[1]
+        assert 'ekstazi profile' in output, 'The profile should be shown in the terminal summary'
+        with open(profile_file) as file:
+            profile = json.load(file)
+    finally:
+        if profile_file.exists():
+            os.remove(profile_file)
+    assert {'configuration_load', 'selection', 'traced_calls', 'test_hashes', 'save'} <= set(profile['timers']), \
+        'The phases of the plugin should be timed'
+    assert profile['counters']['tests_selected'] == len(project_test_cases)
+    assert profile['counters']['files_hashed'] > 0 and profile['counters']['traced_events'] > 0
+
+
+@pytest.mark.skipif(importlib.util.find_spec('xdist') is None, reason='pytest-xdist is not installed')
+def test_profile_option_xdist_workers(project_test_cases):
+    """The controller should not add up the test cases that every xdist worker has counted in its collection"""
+    profile_file = TESTING_PROJECT_TEST_ROOT / 'profile.json'
+    try:
+        run_pytest(DEFAULT_PYTEST_OPTIONS + ['-n', '2', '--ekstazi-profile', str(profile_file)])
+        with open(profile_file) as file:
+            profile = json.load(file)
+    finally:
+        if profile_file.exists():
+            os.remove(profile_file)
+    assert profile['counters']['tests_selected'] == len(project_test_cases)
+    assert profile['counters'].get('tests_deselected', 0) == 0
+
+
+def test_binary_configuration_file(project_test_cases):
+    """
+    The plugin should save the configuration in the binary format when the configuration file has a binary suffix
+    and select the test cases in the same way.
+    """
+    output = run_pytest(BINARY_CONFIGURATION_FILE_OPTIONS)[1]
+    assert set(extract_test_case_results(output).keys()) == project_test_cases, 'Some test cases was not selected'
+
+    configuration = EkstaziConfiguration(TESTING_PROJECT_TEST_ROOT / BINARY_CONFIGURATION_FILE)
+    test_dependencies = configuration.get_test_dependencies('test_code_readers.py', 'test_read_qr_code')
+    assert test_dependencies == {str(TESTING_PROJECT_ROOT / 'project' / 'readers.py')}, 'The test dependencies are not right'
+    configuration.close()
+
+    output = run_pytest(BINARY_CONFIGURATION_FILE_OPTIONS)[1]
+    results = extract_test_case_results(output)
+    assert set(results.keys()) == set(XFAIL_TEST_CASES), 'The other test cases should be deselected'
+    assert all(results[test] == TestResult.XFAIL for test in XFAIL_TEST_CASES), 'Test cases was not marked as xfail'
@@ -0,0 +1,56 @@
+import hashlib
+
+import pytest
+
+from pytest_ekstazi.utils import file_hash, normalized_hashes, source_hash, code_fingerprint, LARGE_FILE_SIZE
+
+
+@pytest.mark.parametrize('algorithm', ['sha1', 'blake2b'])
+@pytest.mark.parametrize('file_size', [10, LARGE_FILE_SIZE * 3 + 10])
+def test_file_hash(tmp_path, algorithm, file_size):
+    """The hash of a file should be the hash of its whole content, even when the file is read in chunks"""
+    content = bytes(range(256)) * (file_size // 256) + b'\x01' * (file_size % 256)
+    file_path = tmp_path / 'file.bin'
+    file_path.write_bytes(content)
+    assert file_hash(file_path, algorithm) == hashlib.new(algorithm, content).hexdigest()
+
+
+def test_normalized_hashes(tmp_path):
+    """The normalized hashes should ignore comments, docstrings and formatting, but not the code"""
+    file_path = tmp_path / 'module.py'
+    file_path.write_text('def add(a, b):\n    return a + b\n')
+    hashes = normalized_hashes(file_path)
+
+    file_path.write_text('"""Module"""\n\n\ndef add(a,   b):\n    """Add two numbers"""\n    # sum\n    return (a + b)\n')
+    assert normalized_hashes(file_path) == {**hashes, 'raw': file_hash(file_path)}, \
+        'The comments, docstrings and formatting should not change the normalized hashes'
+
+    file_path.write_text('def add(a, b):\n    return a - b\n')
+    assert normalized_hashes(file_path)['file'] != hashes['file'], 'A code change should change the normalized hash'
+    assert source_hash('def f():\n    # comment\n    pass\n', True) == source_hash('def f():\n    pass\n', True)
+
+
+def compile_function(source):
+    namespace = dict()
+    exec(compile(source, 'module.py', 'exec'), namespace)
+    return namespace['f'].__code__
+
+
+def test_code_fingerprint():
+    """The fingerprints should ignore comments, formatting and line numbers, and the docstrings if normalized"""
+    code = compile_function('def f(a):\n    """Function"""\n    return [b for b in a if b in {"x", "y"}]\n')
+    moved_code = compile_function('\n\ndef f(a):\n    """Function"""\n    # comment\n    return [b for b in a\n            if b in {"y", "x"}]\n')
+    assert code_fingerprint(code) == code_fingerprint(moved_code), \
+        'The comments, formatting and line numbers should not change the fingerprint'
+
+    documented_code = compile_function('def f(a):\n    """Other function"""\n    return [b for b in a if b in {"x", "y"}]\n')
+    assert code_fingerprint(code) != code_fingerprint(documented_code)
+    assert code_fingerprint(code, True) == code_fingerprint(documented_code, True), \
+        'The docstrings should not change the normalized fingerprint'
+
+    changed_code = compile_function('def f(a):\n    """Function"""\n    return [b for b in a if b in {"x", "z"}]\n')
+    assert code_fingerprint(code, True) != code_fingerprint(changed_code, True), 'A code change should change the fingerprint'
+
+    cache = dict()
+    assert code_fingerprint(code, cache=cache) == code_fingerprint(code)
+    assert cache[(code, False)] == code_fingerprint(code), 'The fingerprint should be cached by code object'
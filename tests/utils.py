@@ -17,6 +17,7 @@ class TestResult(enum.Enum):
     XFAILED = 'xfailed'
     ERRORS = 'errors'
     ERROR = 'error'
+    DESELECTED = 'deselected'
 
 
 def run_pytest(optional_args=None, timeout=30):